@@ -0,0 +1,479 @@
+"""
+Admin routes: admin login, officer approval, application review and
+dispatch, duplicate flags, exports and request profiles
+"""
+
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from werkzeug.security import check_password_hash
+import jwt
+from datetime import datetime, timedelta
+from functools import wraps
+import analytics
+import citizen_index
+import dedup
+import export
+import http_cache
+import notifications
+import profiling
+import shards
+from http_cache import conditional
+from json_provider import RowSet
+from db import get_db_connection, get_read_connection
+
+admin_bp = Blueprint('admin', __name__)
+# Every tier samples its own requests (profiling.py), so every tier registers these
+profile_bp = Blueprint('profile', __name__)
+
+def admin_required(view):
+    """Route decorator: require an admin JWT (from /api/admin/login)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not profiling.is_admin_request():
+            return jsonify({'error': 'Admin token required'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+@admin_bp.route('/api/admin/login', methods=['POST'])
+def admin_login():
+    try:
+        data = request.get_json()
+        username = data.get('username')
+        password = data.get('password')
+        
+        if not username or not password:
+            return jsonify({'error': 'Username and password are required'}), 400
+        
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        
+        # Get admin details
+        cursor.execute("""
+            SELECT id, username, full_name, password_hash 
+            FROM admins WHERE username = %s
+        """, (username,))
+        admin = cursor.fetchone()
+        
+        cursor.close()
+        conn.close()
+        
+        if not admin:
+            return jsonify({'error': 'Invalid credentials'}), 401
+        
+        if not check_password_hash(admin['password_hash'], password):
+            return jsonify({'error': 'Invalid credentials'}), 401
+        
+        # Generate JWT token
+        token = jwt.encode({
+            'admin_id': admin['id'],
+            'username': admin['username'],
+            'role': 'admin',
+            'exp': datetime.utcnow() + timedelta(hours=24)
+        }, current_app.config['SECRET_KEY'], algorithm='HS256')
+        
+        return jsonify({
+            'token': token,
+            'admin': {
+                'id': admin['id'],
+                'username': admin['username'],
+                'fullName': admin['full_name']
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/admin/officers/pending', methods=['GET'])
+@conditional(http_cache.officers_fingerprint, http_cache.on_primary)
+def get_pending_officers():
+    try:
+        conn = get_read_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT id, id_number, email, phone_number, full_name, station, created_at
+            FROM officers WHERE status = 'pending'
+            ORDER BY created_at DESC
+        """)
+        officers = RowSet.from_cursor(cursor)
+        
+        cursor.close()
+        conn.close()
+        
+        return jsonify({'officers': officers}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/admin/officers/<int:officer_id>/approve', methods=['PUT'])
+def approve_officer(officer_id):
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("UPDATE officers SET status = 'approved' WHERE id = %s", (officer_id,))
+        conn.commit()
+        
+        cursor.close()
+        conn.close()
+        
+        # Listings on every shard show the capturing officer's name
+        shards.sync_reference('officers', [officer_id])
+        
+        return jsonify({'message': 'Officer approved successfully'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/admin/officers/<int:officer_id>/reject', methods=['PUT'])
+def reject_officer(officer_id):
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("UPDATE officers SET status = 'rejected' WHERE id = %s", (officer_id,))
+        conn.commit()
+        
+        cursor.close()
+        conn.close()
+        
+        # Listings on every shard show the capturing officer's name
+        shards.sync_reference('officers', [officer_id])
+        
+        return jsonify({'message': 'Officer rejected'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/admin/applications', methods=['GET'])
+@conditional(http_cache.all_applications_fingerprint)
+def get_all_applications():
+    try:
+        # Regular and lost ID (renewal) applications, newest first, from every shard
+        all_applications = shards.select_all("""
+            SELECT a.id, a.application_number, a.full_names, a.status, 
+                   a.application_type, a.created_at, a.updated_at,
+                   o.full_name as officer_name, 'regular' as source_type
+            FROM applications a 
+            LEFT JOIN officers o ON a.officer_id = o.id
+            UNION ALL
+            SELECT l.id, l.waiting_card_number, 
+                   c.full_names, l.status, 'renewal', 
+                   l.created_at, l.updated_at, o.full_name,
+                   'lost_id'
+            FROM lost_id_applications l
+            LEFT JOIN officers o ON l.officer_id = o.id
+            LEFT JOIN citizens c ON l.citizen_id_number = c.id_number
+            ORDER BY created_at DESC
+        """, order_by='created_at')
+        
+        return jsonify({'applications': all_applications}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/admin/duplicates', methods=['GET'])
+def get_duplicate_flags():
+    """List applications flagged as likely duplicates, highest score first"""
+    try:
+        def open_flags(conn, shard):
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("""
+            SELECT f.id, f.score, f.created_at, f.application_id,
+                   f.candidate_application_id as candidate_id
+            FROM duplicate_flags f
+            WHERE f.status = 'open'
+            ORDER BY f.score DESC, f.created_at DESC
+            """)
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+        
+        # Flags are recorded on the shard of the flagged application
+        flags = shards.merge_sorted(shards.scatter(open_flags),
+                                    key=lambda flag: (flag['score'], flag['created_at']), reverse=True)
+        
+        # The candidate may be on any shard, and either side may be archived
+        described = dedup.describe_applications(
+            [flag['application_id'] for flag in flags] + [flag['candidate_id'] for flag in flags])
+        for flag in flags:
+            application = described.get(flag['application_id'], {})
+            flag['application_number'] = application.get('application_number')
+            flag['full_names'] = application.get('full_names')
+            candidate = described.get(flag['candidate_id'], {})
+            flag['candidate_number'] = candidate.get('application_number')
+            flag['candidate_full_names'] = candidate.get('full_names')
+            flag['candidate_status'] = candidate.get('status')
+        
+        return jsonify({'duplicates': flags}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/admin/duplicates/<int:flag_id>/<action>', methods=['PUT'])
+def resolve_duplicate_flag(flag_id, action):
+    """Confirm or dismiss a duplicate flag"""
+    try:
+        statuses = {'confirm': 'confirmed', 'dismiss': 'dismissed'}
+        if action not in statuses:
+            return jsonify({'error': 'Action must be confirm or dismiss'}), 400
+        
+        conn = shards.connection_for_id(flag_id)
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            UPDATE duplicate_flags SET status = %s
+            WHERE id = %s AND status = 'open'
+        """, (statuses[action], flag_id))
+        
+        if cursor.rowcount == 0:
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Flag not found or already resolved'}), 404
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        return jsonify({'message': f'Duplicate flag {statuses[action]}'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/admin/applications/<int:application_id>', methods=['GET'])
+@conditional(http_cache.application_details_fingerprint, http_cache.on_application_shard)
+def get_application_details(application_id):
+    try:
+        conn = shards.read_connection(shards.shard_for_id(application_id))
+        cursor = conn.cursor(dictionary=True)
+        
+        # Get application details
+        cursor.execute("""
+            SELECT a.*, o.full_name as officer_name
+            FROM applications a 
+            LEFT JOIN officers o ON a.officer_id = o.id
+            WHERE a.id = %s
+        """, (application_id,))
+        
+        application = cursor.fetchone()
+        
+        if not application:
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Application not found'}), 404
+        
+        # Get supporting documents
+        cursor.execute("""
+            SELECT document_type, file_path
+            FROM documents WHERE application_id = %s
+        """, (application_id,))
+        
+        documents = cursor.fetchall()
+        application['documents'] = documents
+        
+        cursor.close()
+        conn.close()
+        
+        return jsonify({'application': application}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/admin/applications/<int:application_id>/approve', methods=['PUT'])
+def approve_application(application_id):
+    try:
+        shard = shards.shard_for_id(application_id)
+        conn = shards.connection(shard)
+        cursor = conn.cursor(dictionary=True)
+        
+        # Generate ID number (counted per shard; the number carries the shard)
+        cursor.execute("SELECT COUNT(*) as count FROM applications WHERE status = 'approved'")
+        count = cursor.fetchone()['count']
+        id_number = shards.id_number(shard, count + 1)
+        
+        # Update application status and assign ID number
+        cursor.execute("""
+            UPDATE applications 
+            SET status = 'approved', generated_id_number = %s, updated_at = NOW(),
+                approved_at = updated_at
+            WHERE id = %s
+        """, (id_number, application_id))
+        
+        if cursor.rowcount == 0:
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Application not found'}), 404
+        
+        # Index the citizen so lookups by ID number hit a single table
+        citizen_index.register_citizen(cursor, application_id)
+        
+        # Tell the applicant; sent in the background (see notifications.py)
+        notifications.notify(cursor, 'application', application_id, 'approved')
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        # Lost-ID cases for this citizen may be captured on any shard
+        shards.sync_reference('citizens', [id_number], source=shard)
+        
+        return jsonify({
+            'message': 'Application approved successfully',
+            'id_number': id_number
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/admin/applications/<int:application_id>/reject', methods=['PUT'])
+def reject_application(application_id):
+    try:
+        conn = shards.connection_for_id(application_id)
+        cursor = conn.cursor(dictionary=True)
+        
+        # Update application status
+        cursor.execute("""
+            UPDATE applications 
+            SET status = 'rejected', updated_at = NOW()
+            WHERE id = %s
+        """, (application_id,))
+        
+        if cursor.rowcount == 0:
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Application not found'}), 404
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        return jsonify({'message': 'Application rejected successfully'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/admin/applications/approved', methods=['GET'])
+def get_approved_applications():
+    try:
+        applications = shards.select_all("""
+            SELECT a.id, a.application_number, a.full_names, a.application_type, 
+                   a.generated_id_number, a.created_at, a.updated_at, o.full_name as officer_name
+            FROM applications a
+            LEFT JOIN officers o ON a.officer_id = o.id
+            WHERE a.status = 'approved'
+            ORDER BY a.updated_at DESC
+        """, order_by='updated_at')
+        
+        return jsonify({'applications': applications}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/admin/export/<source>', methods=['GET'])
+@admin_required
+def export_records(source):
+    """Stream approved/dispatched records to the card-printing bureau"""
+    try:
+        if source not in export.EXPORT_SOURCES:
+            return jsonify({'error': f'Unknown export source: {source}'}), 404
+        
+        export_format = request.args.get('format', 'ndjson')
+        include_photos = request.args.get('photos') == '1'
+        if not include_photos and export_format not in export.EXPORT_FORMATS:
+            return jsonify({'error': f'Unsupported export format: {export_format}'}), 400
+        if export_format == 'parquet' and not export.parquet_available():
+            return jsonify({'error': 'Parquet export is not available on this server'}), 400
+        
+        # Incremental exports resume after the last (updated_at, id) received
+        since = export.parse_watermark(request.args.get('since_updated_at'),
+                                       request.args.get('since_id'))
+        
+        records = export.iter_all_shards(source, since)
+        
+        if include_photos:
+            body = export.stream_photo_tar(records, source)
+            mimetype = 'application/x-tar'
+            filename = f"{source}-photos.tar"
+        else:
+            body = export.EXPORT_WRITERS[export_format](records, source)
+            mimetype = export.EXPORT_FORMATS[export_format]
+            filename = f"{source}.{export_format}"
+        
+        return Response(stream_with_context(body), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename={filename}'
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/admin/applications/<int:application_id>/dispatch', methods=['PUT'])
+def dispatch_application(application_id):
+    try:
+        conn = shards.connection_for_id(application_id)
+        cursor = conn.cursor(dictionary=True)
+        
+        # Update application status to dispatched
+        cursor.execute("""
+            UPDATE applications 
+            SET status = 'dispatched', updated_at = NOW(), dispatched_at = updated_at
+            WHERE id = %s AND status = 'approved'
+        """, (application_id,))
+        
+        if cursor.rowcount == 0:
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Application not found or not approved'}), 404
+        
+        notifications.notify(cursor, 'application', application_id, 'dispatched')
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        return jsonify({'message': 'Application dispatched successfully'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/admin/analytics/turnaround', methods=['GET'])
+def turnaround_analytics():
+    """Lead-time percentiles, backlog aging and daily throughput per station, officer or district"""
+    try:
+        group_by, source, days = analytics.parse_options(request.args.get('group_by'),
+                                                         request.args.get('source'),
+                                                         request.args.get('days'))
+        if not analytics.available():
+            return jsonify({'error': 'Analytics is not available on this server'}), 503
+        
+        return jsonify(analytics.ANALYTICS.report(group_by, source, days)), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/api/admin/notifications/stats', methods=['GET'])
+def notification_stats():
+    """Citizen notification counts by channel and status, and delivery delay over the last day"""
+    try:
+        return jsonify(notifications.stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@profile_bp.route('/api/admin/profile', methods=['GET', 'DELETE'])
+@admin_required
+def profile_summary():
+    """Routes with profiled requests and sample counts; DELETE clears the profiles"""
+    sampler = current_app.extensions['profiling']
+    if request.method == 'DELETE':
+        sampler.reset()
+        return jsonify({'message': 'Profiles cleared'}), 200
+    return jsonify(sampler.summary()), 200
+
+@profile_bp.route('/api/admin/profile/collapsed', methods=['GET'])
+@admin_required
+def profile_collapsed():
+    """Collapsed stacks for flamegraph.pl or speedscope, optionally for one route (?route=GET /api/...)"""
+    body = current_app.extensions['profiling'].collapsed(request.args.get('route'))
+    return Response(body, mimetype='text/plain')
@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+"""
+Turnaround and throughput analytics for the admin dashboard.
+
+Lead times (submitted -> approved -> dispatched -> collected) come from the
+stage timestamps the status routes record (approved_at, dispatched_at,
+ready_at, collected_at). Rather than aggregating in SQL on every request,
+the cases are kept in memory as a columnar snapshot: one NumPy array per
+column, sorted by id, with statuses as ENUM indexes and districts and
+stations as small integer codes. Percentiles, backlog aging and daily
+throughput per station, officer or district are then computed with sorts,
+bincounts and fancy indexing over the whole snapshot at once.
+
+The snapshot is loaded in CHUNK_ROWS keyset pages from every shard
+(shards.py), archives included. After that it is refreshed at most every
+REFRESH_INTERVAL seconds with only the rows whose updated_at is at or past
+the watermark, re-reading the last REFRESH_OVERLAP seconds because
+updated_at has one-second resolution and slow transactions commit late.
+Reports are cached until the snapshot changes, so a dashboard request
+normally costs a dictionary lookup.
+
+NumPy is optional and imported on first use; without it the endpoint
+answers 503.
+
+Run this script from terminal:
+    python analytics.py report [station|officer|district] [days]   # report from the database
+    python analytics.py bench [rows]   # synthetic snapshot: vectorized vs per-row Python
+"""
+
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import shards
+from startup import Lazy
+
+def _load_numpy():
+    import numpy
+    return numpy
+
+numpy = Lazy('numpy', _load_numpy)
+
+def available():
+    return numpy.get() is not None
+
+CHUNK_ROWS = 20000
+REFRESH_INTERVAL = 30   # seconds between incremental refreshes
+REFRESH_OVERLAP = 5     # seconds re-read before the watermark
+PERCENTILES = (50, 90, 95)
+AGE_BUCKETS = (1, 3, 7, 14, 30)  # days; backlog ages are counted into [0,1), [1,3), ... [30, inf)
+MAX_DAYS = 365
+GROUP_BY = ('station', 'officer', 'district')
+REPORT_SOURCES = ('all', 'applications', 'lost-id')
+
+# Order of the status ENUM in both tables; `status + 0` selects its 1-based index
+STATUSES = ('submitted', 'approved', 'rejected', 'dispatched', 'ready_for_collection', 'collected')
+OPEN_STATUSES = ('submitted', 'approved', 'dispatched', 'ready_for_collection')
+
+TIME_COLUMNS = ('created_at', 'approved_at', 'dispatched_at', 'ready_at', 'collected_at', 'updated_at')
+STAGES = {
+    'submitted_to_approved': ('created_at', 'approved_at'),
+    'approved_to_dispatched': ('approved_at', 'dispatched_at'),
+    'dispatched_to_collected': ('dispatched_at', 'collected_at'),
+    'submitted_to_collected': ('created_at', 'collected_at'),
+}
+# Column an open case's age is measured from, by status
+STAGE_ENTERED = {'submitted': 'created_at', 'approved': 'approved_at',
+                 'dispatched': 'dispatched_at', 'ready_for_collection': 'ready_at'}
+THROUGHPUT_EVENTS = {'submitted': 'created_at', 'approved': 'approved_at',
+                     'dispatched': 'dispatched_at', 'collected': 'collected_at'}
+
+_SELECT = """
+    SELECT x.id, x.officer_id, {district} AS district, x.status + 0,
+           UNIX_TIMESTAMP(x.created_at), UNIX_TIMESTAMP(x.approved_at),
+           UNIX_TIMESTAMP(x.dispatched_at), UNIX_TIMESTAMP(x.ready_at),
+           UNIX_TIMESTAMP(x.collected_at), UNIX_TIMESTAMP(x.updated_at)
+    FROM {table} x {join}
+    WHERE {where}
+    ORDER BY {order}
+    LIMIT %s
+"""
+_BY_ID = ("x.id > %s", "x.id")
+_BY_UPDATED = ("(x.updated_at > FROM_UNIXTIME(%s) OR (x.updated_at = FROM_UNIXTIME(%s) AND x.id > %s))",
+               "x.updated_at, x.id")
+
+SOURCES = {
+    'applications': {
+        'tables': ('applications', 'applications_archive'),
+        'district': 'x.home_district',
+        'join': '',
+    },
+    'lost-id': {
+        'tables': ('lost_id_applications', 'lost_id_applications_archive'),
+        # Lost-ID cases carry no home district; the citizen's place of birth stands in
+        'district': 'c.place_of_birth',
+        'join': 'LEFT JOIN citizens c ON x.citizen_id_number = c.id_number',
+    },
+}
+
+class Categories:
+    """Names of a grouping column as small integer codes; code 0 is 'Unknown'"""
+
+    def __init__(self):
+        self.names = ['Unknown']
+        self._codes = {'unknown': 0}
+
+    def code(self, name):
+        key = ' '.join((name or '').lower().split())
+        if not key:
+            return 0
+        code = self._codes.get(key)
+        if code is None:
+            code = self._codes[key] = len(self.names)
+            self.names.append(' '.join(name.split()))
+        return code
+
+    def encode(self, values):
+        """Codes for a column of names; each distinct name is looked up once"""
+        np = numpy.get()
+        names, inverse = np.unique(np.array([value or '' for value in values], dtype=object),
+                                   return_inverse=True)
+        return np.array([self.code(name) for name in names], dtype=np.int32)[inverse]
+
+class Snapshot:
+    """Columns of one source (applications or lost-ID cases), sorted by id"""
+
+    def __init__(self, source, districts):
+        self.source = source
+        self.districts = districts
+        self.columns = None
+        self.watermarks = {}  # shard -> updated_at (epoch seconds) to refresh from
+
+    def __len__(self):
+        return 0 if self.columns is None else len(self.columns['id'])
+
+    def _to_columns(self, rows):
+        np = numpy.get()
+        values = list(zip(*rows))
+        columns = {
+            'id': np.array(values[0], dtype=np.int64),
+            'officer_id': np.array(values[1], dtype=np.float64),
+            'district': self.districts.encode(values[2]),
+            'status': np.array(values[3], dtype=np.int8),
+        }
+        # None (stage not reached) becomes NaN
+        for name, column in zip(TIME_COLUMNS, values[4:]):
+            columns[name] = np.array(column, dtype=np.float64)
+        columns['officer_id'] = np.nan_to_num(columns['officer_id'], nan=-1).astype(np.int32)
+        return columns
+
+    def _read(self, conn, table, keyset, position):
+        """Yield column chunks of `table` after `position`, in keyset order"""
+        spec = SOURCES[self.source]
+        where, order = keyset
+        query = _SELECT.format(district=spec['district'], table=table, join=spec['join'],
+                               where=where, order=order)
+        cursor = conn.cursor()
+        try:
+            while True:
+                cursor.execute(query, (*position, CHUNK_ROWS))
+                rows = cursor.fetchall()
+                if not rows:
+                    return
+                yield self._to_columns(rows)
+                last = rows[-1]
+                position = (last[0],) if keyset is _BY_ID else (last[9], last[9], last[0])
+                if len(rows) < CHUNK_ROWS:
+                    return
+        finally:
+            cursor.close()
+
+    def load_shard(self, conn, shard):
+        """Every case on one shard, hot and archived; returns the chunks"""
+        started = time.time()
+        chunks = [chunk for table in SOURCES[self.source]['tables']
+                  for chunk in self._read(conn, table, _BY_ID, (0,))]
+        self.watermarks[shard] = started - REFRESH_OVERLAP
+        return chunks
+
+    def changes_on_shard(self, conn, shard):
+        """Cases on one shard updated since its watermark (archived rows are never updated)"""
+        since = self.watermarks[shard]
+        chunks = list(self._read(conn, SOURCES[self.source]['tables'][0], _BY_UPDATED, (since, since, 0)))
+        if chunks:
+            newest = max(float(chunk['updated_at'].max()) for chunk in chunks)
+            self.watermarks[shard] = max(since, newest - REFRESH_OVERLAP)
+        return chunks
+
+    def merge(self, chunks):
+        """Upsert chunks by id: changed rows overwrite, new rows are inserted in id order"""
+        np = numpy.get()
+        if not chunks:
+            return 0
+        new = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+        # A row changed during the read can appear twice; the later read wins
+        _, last = np.unique(new['id'][::-1], return_index=True)
+        keep = len(new['id']) - 1 - last
+        new = {name: column[keep] for name, column in new.items()}
+
+        if not len(self):
+            self.columns = new
+            return len(keep)
+        ids = self.columns['id']
+        position = np.searchsorted(ids, new['id'])
+        found = position < len(ids)
+        found[found] = ids[position[found]] == new['id'][found]
+        for name, column in self.columns.items():
+            column[position[found]] = new[name][found]
+        if not found.all():
+            added = ~found
+            merged = {name: np.concatenate([column, new[name][added]])
+                      for name, column in self.columns.items()}
+            order = np.argsort(merged['id'], kind='stable')
+            self.columns = {name: column[order] for name, column in merged.items()}
+        return len(keep)
+
+def grouped_percentiles(groups, values, group_count, percentiles=PERCENTILES):
+    """
+    Per-group count, mean and linearly interpolated percentiles (numpy's
+    default method) of `values`, ignoring NaN. Rows are ordered by group
+    with a stable radix sort and each group's run is then sorted in place,
+    so every percentile of every group is one index into the same array.
+    """
+    np = numpy.get()
+    valid = ~np.isnan(values)
+    groups = groups[valid]
+    values = values[valid]
+    counts = np.bincount(groups, minlength=group_count)
+    sums = np.bincount(groups, weights=values, minlength=group_count)
+
+    # numpy sorts 16-bit keys with a radix sort when kind='stable'
+    keys = groups.astype(np.int16) if group_count < 2 ** 15 else groups
+    values = values[np.argsort(keys, kind='stable')]
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    for code in np.flatnonzero(counts > 1):
+        values[starts[code]:ends[code]].sort()
+
+    present = counts > 0
+    result = np.full((group_count, len(percentiles)), np.nan)
+    for j, q in enumerate(percentiles):
+        rank = starts[present] + (counts[present] - 1) * (q / 100)
+        low = np.floor(rank).astype(np.int64)
+        high = np.minimum(low + 1, ends[present] - 1)
+        fraction = rank - low
+        result[present, j] = values[low] * (1 - fraction) + values[high] * fraction
+    means = np.full(group_count, np.nan)
+    means[present] = sums[present] / counts[present]
+    return counts, means, result
+
+def _rounded(values, digits=1):
+    return [None if value != value else round(value, digits) for value in values.tolist()]
+
+def _day_starts(days):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    first = today - timedelta(days=days - 1)
+    return first, first.timestamp()
+
+class Analytics:
+    """Snapshots of both sources, the officer directory and cached reports"""
+
+    def __init__(self):
+        self.districts = Categories()
+        self.stations = Categories()
+        self.snapshots = {source: Snapshot(source, self.districts) for source in SOURCES}
+        self.officer_names = {}
+        self.officer_station = None  # officer id -> station code
+        self.version = 0
+        self.refreshed_at = None
+        self._reports = {}
+        self._refresh_lock = threading.Lock()
+
+    def _load_officers(self):
+        np = numpy.get()
+        conn = shards.read_connection(0)
+        cursor = conn.cursor()
+        names = {}
+        last_id = 0
+        codes = []
+        try:
+            while True:
+                cursor.execute("SELECT id, full_name, station FROM officers WHERE id > %s ORDER BY id LIMIT %s",
+                               (last_id, CHUNK_ROWS))
+                rows = cursor.fetchall()
+                for officer_id, full_name, station in rows:
+                    names[officer_id] = full_name
+                    codes.append((officer_id, self.stations.code(station)))
+                if len(rows) < CHUNK_ROWS:
+                    break
+                last_id = rows[-1][0]
+        finally:
+            cursor.close()
+            conn.close()
+        station = np.zeros(max(names, default=0) + 1, dtype=np.int32)
+        if codes:
+            ids, station_codes = zip(*codes)
+            station[list(ids)] = station_codes
+        self.officer_names = names
+        self.officer_station = station
+
+    def refresh(self, force=False):
+        """Load or incrementally refresh the snapshots; returns the number of rows read"""
+        if not force and self.refreshed_at and time.time() - self.refreshed_at < REFRESH_INTERVAL:
+            return 0
+        # The first load blocks; later refreshes are skipped while another one is running
+        if not self._refresh_lock.acquire(blocking=self.refreshed_at is None):
+            return 0
+        try:
+            if not force and self.refreshed_at and time.time() - self.refreshed_at < REFRESH_INTERVAL:
+                return 0
+            self._load_officers()
+            read = 0
+            for snapshot in self.snapshots.values():
+                def fetch(conn, shard, snapshot=snapshot):
+                    if shard in snapshot.watermarks:
+                        return snapshot.changes_on_shard(conn, shard)
+                    return snapshot.load_shard(conn, shard)
+                chunks = [chunk for shard_chunks in shards.scatter(fetch) for chunk in shard_chunks]
+                read += snapshot.merge(chunks)
+            if read:
+                self.version += 1
+            self.refreshed_at = time.time()
+            return read
+        finally:
+            self._refresh_lock.release()
+
+    def _columns(self, source):
+        np = numpy.get()
+        parts = [snapshot.columns for name, snapshot in self.snapshots.items()
+                 if snapshot.columns is not None and source in ('all', name)]
+        if not parts:
+            return None
+        return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+    def _groups(self, columns, group_by):
+        """(group code per row, group names)"""
+        np = numpy.get()
+        if group_by == 'district':
+            return columns['district'], list(self.districts.names)
+        officer_ids = columns['officer_id']
+        if group_by == 'station':
+            station = self.officer_station
+            known = (officer_ids >= 0) & (officer_ids < len(station))
+            codes = np.zeros(len(officer_ids), dtype=np.int32)
+            codes[known] = station[officer_ids[known]]
+            return codes, list(self.stations.names)
+        # Officers: dense codes over the officer ids present, 0 for unknown
+        present, codes = np.unique(officer_ids, return_inverse=True)
+        names = [self.officer_names.get(int(officer_id), 'Unknown') if officer_id >= 0 else 'Unknown'
+                 for officer_id in present]
+        return codes.astype(np.int32), names
+
+    def compute(self, group_by='station', source='all', days=30, now=None):
+        np = numpy.get()
+        now = now or time.time()
+        columns = self._columns(source)
+        report = {'groupBy': group_by, 'source': source, 'days': days,
+                  'asOf': datetime.fromtimestamp(self.refreshed_at).isoformat() if self.refreshed_at else None,
+                  'cases': 0, 'groups': [], 'backlog': {}, 'throughput': {}}
+        if columns is None or not len(columns['id']):
+            return report
+        report['cases'] = int(len(columns['id']))
+        groups, names = self._groups(columns, group_by)
+        group_count = len(names)
+
+        # Lead times per stage, in hours
+        stages = {}
+        for stage, (start, end) in STAGES.items():
+            hours = (columns[end] - columns[start]) / 3600
+            hours[hours < 0] = np.nan  # clock skew or backfilled stamps
+            stages[stage] = grouped_percentiles(groups, hours, group_count)
+
+        # Backlog: age of each open case in its current stage, in days
+        status = columns['status']
+        age = np.full(len(status), np.nan)
+        for name, column in STAGE_ENTERED.items():
+            rows = status == STATUSES.index(name) + 1
+            entered = np.where(np.isnan(columns[column][rows]), columns['updated_at'][rows], columns[column][rows])
+            age[rows] = (now - entered) / 86400
+        is_open = ~np.isnan(age)
+        bucket = np.digitize(age[is_open], AGE_BUCKETS)
+        open_status = status[is_open].astype(np.int64) - 1
+        matrix = np.bincount(open_status * (len(AGE_BUCKETS) + 1) + bucket,
+                             minlength=len(STATUSES) * (len(AGE_BUCKETS) + 1))
+        matrix = matrix.reshape(len(STATUSES), len(AGE_BUCKETS) + 1)
+        labels = ([f"<{AGE_BUCKETS[0]}d"] + [f"{low}-{high}d" for low, high in zip(AGE_BUCKETS, AGE_BUCKETS[1:])]
+                  + [f"{AGE_BUCKETS[-1]}d+"])
+        report['backlog'] = {'buckets': labels,
+                             'byStatus': {name: matrix[STATUSES.index(name)].tolist() for name in OPEN_STATUSES}}
+        open_counts, _, open_ages = grouped_percentiles(groups, age, group_count, (50, 100))
+
+        # Daily throughput over the last `days` days
+        first, start = _day_starts(days)
+        report['throughput'] = {'days': [(first + timedelta(days=i)).date().isoformat() for i in range(days)]}
+        for event, column in THROUGHPUT_EVENTS.items():
+            stamps = columns[column][~np.isnan(columns[column])]
+            day = np.floor((stamps - start) / 86400).astype(np.int64)
+            day = day[(day >= 0) & (day < days)]
+            report['throughput'][event] = np.bincount(day, minlength=days).tolist()
+
+        cases = np.bincount(groups, minlength=group_count)
+        for code in np.argsort(-cases, kind='stable'):
+            if not cases[code]:
+                break
+            lead_times = {}
+            for stage, (counts, means, percentiles) in stages.items():
+                lead_times[stage] = {'count': int(counts[code]), 'mean': _rounded(means[code:code + 1])[0],
+                                     **{f"p{q}": value for q, value in
+                                        zip(PERCENTILES, _rounded(percentiles[code]))}}
+            report['groups'].append({
+                'name': names[code],
+                'cases': int(cases[code]),
+                'open': int(open_counts[code]),
+                'leadTimeHours': lead_times,
+                'backlogAgeDays': dict(zip(('p50', 'max'), _rounded(open_ages[code]))),
+            })
+        return report
+
+    def report(self, group_by='station', source='all', days=30):
+        """Cached report; recomputed when the snapshot changed or the cached one is older than REFRESH_INTERVAL"""
+        self.refresh()
+        key = (group_by, source, days)
+        cached = self._reports.get(key)
+        if cached and cached[0] == self.version and time.time() - cached[1] < REFRESH_INTERVAL:
+            return cached[2]
+        result = self.compute(group_by, source, days)
+        self._reports[key] = (self.version, time.time(), result)
+        return result
+
+ANALYTICS = Analytics()
+
+def parse_options(group_by, source, days):
+    group_by = group_by or 'station'
+    source = source or 'all'
+    if group_by not in GROUP_BY:
+        raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+    if source not in REPORT_SOURCES:
+        raise ValueError(f"source must be one of {', '.join(REPORT_SOURCES)}")
+    try:
+        days = int(days or 30)
+    except ValueError:
+        raise ValueError('days must be an integer')
+    if not 1 <= days <= MAX_DAYS:
+        raise ValueError(f'days must be between 1 and {MAX_DAYS}')
+    return group_by, source, days
+
+def _synthetic_chunk(rng, ids, now, districts):
+    """Column chunk shaped like Snapshot._to_columns output, for the benchmark"""
+    np = numpy.get()
+    count = len(ids)
+    created = now - rng.uniform(0, 120 * 86400, count)
+    approved = created + rng.exponential(3 * 86400, count)
+    dispatched = approved + rng.exponential(7 * 86400, count)
+    ready = dispatched + rng.exponential(2 * 86400, count)
+    collected = ready + rng.exponential(5 * 86400, count)
+    stamps = [created, approved, dispatched, ready, collected]
+    stage = np.minimum(rng.integers(0, 5, count), ((now - created) // (8 * 86400)).astype(np.int64))
+    for level in range(1, 5):
+        stamps[level][stage < level] = np.nan
+    for stamp in stamps:
+        stamp[stamp > now] = np.nan
+    status = np.array([1, 2, 4, 5, 6], dtype=np.int8)[stage]
+    updated = np.fmax.reduce(np.vstack(stamps), axis=0)
+    return {'id': np.asarray(ids, dtype=np.int64), 'officer_id': rng.integers(1, 400, count).astype(np.int32),
+            'district': rng.integers(0, len(districts), count).astype(np.int32), 'status': status,
+            'created_at': created, 'approved_at': stamps[1], 'dispatched_at': stamps[2],
+            'ready_at': stamps[3], 'collected_at': stamps[4], 'updated_at': updated}
+
+def _python_percentiles(groups, values, group_count, percentiles=PERCENTILES):
+    """Per-row reference implementation of grouped_percentiles, for the benchmark"""
+    by_group = {}
+    for group, value in zip(groups.tolist(), values.tolist()):
+        if value == value:
+            by_group.setdefault(group, []).append(value)
+    result = {}
+    for group, group_values in by_group.items():
+        group_values.sort()
+        row = []
+        for q in percentiles:
+            rank = (len(group_values) - 1) * q / 100
+            low = int(rank)
+            high = min(low + 1, len(group_values) - 1)
+            row.append(group_values[low] * (1 - (rank - low)) + group_values[high] * (rank - low))
+        result[group] = row
+    return result
+
+def benchmark(rows=1000000, seed=7):
+    """Build a synthetic snapshot, then time the report and an incremental upsert against per-row Python"""
+    np = numpy.get()
+    rng = np.random.default_rng(seed)
+    now = time.time()
+    analytics = Analytics()
+    for name in ('Nairobi', 'Kiambu', 'Nakuru', 'Kisumu', 'Mombasa', 'Machakos', 'Uasin Gishu',
+                 'Kakamega', 'Nyeri', 'Meru', 'Kisii', 'Bungoma', 'Kilifi', 'Kericho'):
+        analytics.districts.code(name)
+        analytics.stations.code(f"{name} Station")
+    analytics.officer_station = np.concatenate(([0], rng.integers(1, len(analytics.stations.names), 399)))
+    analytics.officer_names = {i: f"Officer {i}" for i in range(1, 400)}
+    snapshot = analytics.snapshots['applications']
+
+    started = time.perf_counter()
+    snapshot.merge([_synthetic_chunk(rng, np.arange(start + 1, min(start + CHUNK_ROWS, rows) + 1), now,
+                                     analytics.districts.names)
+                    for start in range(0, rows, CHUNK_ROWS)])
+    analytics.refreshed_at = now
+    results = {'rows': rows, 'load_ms': (time.perf_counter() - started) * 1000}
+
+    started = time.perf_counter()
+    report = analytics.compute('station', 'all', 30, now)
+    results['report_ms'] = (time.perf_counter() - started) * 1000
+
+    changed = rng.choice(rows, size=min(rows, 5000), replace=False) + 1
+    started = time.perf_counter()
+    snapshot.merge([_synthetic_chunk(rng, np.concatenate([changed, np.arange(rows + 1, rows + 1001)]), now,
+                                     analytics.districts.names)])
+    results['refresh_6000_rows_ms'] = (time.perf_counter() - started) * 1000
+
+    columns = snapshot.columns
+    groups, names = analytics._groups(columns, 'station')
+    hours = (columns['approved_at'] - columns['created_at']) / 3600
+    started = time.perf_counter()
+    _, _, vectorized = grouped_percentiles(groups, hours, len(names))
+    results['percentiles_vectorized_ms'] = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    reference = _python_percentiles(groups, hours, len(names))
+    results['percentiles_python_ms'] = (time.perf_counter() - started) * 1000
+    results['max_deviation_hours'] = max(abs(vectorized[group][j] - row[j])
+                                         for group, row in reference.items() for j in range(len(row)))
+    results['groups'] = len(report['groups'])
+    return results
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        if not available() and command in ("report", "bench"):
+            raise RuntimeError("numpy is not installed")
+        if command == "report":
+            group_by, source, days = parse_options(sys.argv[2] if len(sys.argv) > 2 else None, None,
+                                                   sys.argv[3] if len(sys.argv) > 3 else None)
+            started = time.perf_counter()
+            result = ANALYTICS.report(group_by, source, days)
+            print(json.dumps(result, indent=2, default=str))
+            print(f"{result['cases']} cases in {(time.perf_counter() - started) * 1000:.0f}ms")
+        elif command == "bench":
+            for name, value in benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 1000000).items():
+                print(f"{name}: {value:.2f}" if isinstance(value, float) else f"{name}: {value}")
+        else:
+            print(__doc__)
+    except Exception as e:
+        print(f"Error: {e}")
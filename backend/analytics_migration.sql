@@ -0,0 +1,40 @@
+-- Turnaround analytics: run once on databases created before analytics.py
+USE digital_id_system;
+
+-- When each case reached each stage; the status routes set these from now on
+ALTER TABLE applications
+    ADD COLUMN approved_at TIMESTAMP NULL DEFAULT NULL AFTER dedup_key,
+    ADD COLUMN dispatched_at TIMESTAMP NULL DEFAULT NULL AFTER approved_at,
+    ADD COLUMN ready_at TIMESTAMP NULL DEFAULT NULL AFTER dispatched_at,
+    ADD COLUMN collected_at TIMESTAMP NULL DEFAULT NULL AFTER ready_at;
+ALTER TABLE lost_id_applications
+    ADD COLUMN approved_at TIMESTAMP NULL DEFAULT NULL AFTER status,
+    ADD COLUMN dispatched_at TIMESTAMP NULL DEFAULT NULL AFTER approved_at,
+    ADD COLUMN ready_at TIMESTAMP NULL DEFAULT NULL AFTER dispatched_at,
+    ADD COLUMN collected_at TIMESTAMP NULL DEFAULT NULL AFTER ready_at;
+
+-- Keep the archive copies in step (archive.py moves rows with INSERT ... SELECT *)
+ALTER TABLE applications_archive
+    ADD COLUMN approved_at TIMESTAMP NULL DEFAULT NULL AFTER dedup_key,
+    ADD COLUMN dispatched_at TIMESTAMP NULL DEFAULT NULL AFTER approved_at,
+    ADD COLUMN ready_at TIMESTAMP NULL DEFAULT NULL AFTER dispatched_at,
+    ADD COLUMN collected_at TIMESTAMP NULL DEFAULT NULL AFTER ready_at;
+ALTER TABLE lost_id_applications_archive
+    ADD COLUMN approved_at TIMESTAMP NULL DEFAULT NULL AFTER status,
+    ADD COLUMN dispatched_at TIMESTAMP NULL DEFAULT NULL AFTER approved_at,
+    ADD COLUMN ready_at TIMESTAMP NULL DEFAULT NULL AFTER dispatched_at,
+    ADD COLUMN collected_at TIMESTAMP NULL DEFAULT NULL AFTER ready_at;
+
+-- Incremental snapshot refreshes read rows changed since a watermark
+CREATE INDEX idx_applications_updated ON applications(updated_at, id);
+CREATE INDEX idx_lost_id_applications_updated ON lost_id_applications(updated_at, id);
+
+-- Earlier transitions were not timed; the current stage began no later than the last update
+UPDATE applications SET approved_at = updated_at WHERE status = 'approved';
+UPDATE applications SET dispatched_at = updated_at WHERE status = 'dispatched';
+UPDATE applications SET ready_at = updated_at WHERE status = 'ready_for_collection';
+UPDATE applications SET collected_at = updated_at WHERE status = 'collected';
+UPDATE lost_id_applications SET approved_at = updated_at WHERE status = 'approved';
+UPDATE lost_id_applications SET dispatched_at = updated_at WHERE status = 'dispatched';
+UPDATE lost_id_applications SET ready_at = updated_at WHERE status = 'ready_for_collection';
+UPDATE lost_id_applications SET collected_at = updated_at WHERE status = 'collected';
@@ -0,0 +1,68 @@
+"""
+Shared pieces of the new-application submission path, used by
+submit_application and the officer batch-sync endpoint
+"""
+
+import json
+import os
+from datetime import datetime
+
+from werkzeug.utils import secure_filename
+
+import dedup
+
+REQUIRED_FIELDS = ['fullNames', 'dateOfBirth', 'gender', 'fatherName', 'motherName',
+                   'districtOfBirth', 'tribe', 'homeDistrict', 'division',
+                   'constituency', 'location', 'subLocation', 'villageEstate', 'occupation']
+
+# Form file keys -> documents.document_type
+DOCUMENT_TYPES = {
+    'passportPhoto': 'passport_photo',
+    'birthCertificate': 'birth_certificate',
+    'parentsId': 'parent_id_front'
+}
+
+UPLOAD_DIR = 'uploads'
+
+INSERT_SQL = """
+    INSERT INTO applications (
+        application_number, officer_id, application_type,
+        full_names, date_of_birth, gender, father_name, mother_name,
+        marital_status, husband_name, husband_id_no,
+        district_of_birth, tribe, clan, family, home_district,
+        division, constituency, location, sub_location, village_estate,
+        home_address, occupation, phone_number, email,
+        supporting_documents, status, created_at, dedup_key
+    ) VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+    )
+"""
+
+def missing_fields(data):
+    return [field for field in REQUIRED_FIELDS if not data.get(field)]
+
+def application_number(sequence, year=None):
+    return f"APP{year or datetime.now().year}{sequence:06d}"
+
+def dedup_key(data):
+    return dedup.blocking_key(data['dateOfBirth'], data['districtOfBirth'], data['motherName'])
+
+def insert_params(data, number, officer_id, key):
+    """Parameters for INSERT_SQL from form field names"""
+    return (
+        number, officer_id, 'new',
+        data['fullNames'], data['dateOfBirth'], data['gender'],
+        data['fatherName'], data['motherName'], data.get('maritalStatus'),
+        data.get('husbandName'), data.get('husbandIdNo'),
+        data['districtOfBirth'], data['tribe'], data.get('clan'),
+        data.get('family'), data['homeDistrict'], data['division'],
+        data['constituency'], data['location'], data['subLocation'],
+        data['villageEstate'], data.get('homeAddress'), data['occupation'],
+        data.get('phoneNumber') or None, data.get('email') or None,
+        json.dumps(data.get('supportingDocuments', {})), 'submitted', datetime.now(),
+        key
+    )
+
+def upload_path(number, file_key, filename):
+    return os.path.join(UPLOAD_DIR, f"{number}_{secure_filename(file_key)}_{secure_filename(filename)}")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Archival of closed applications.
+
+Applications and lost-ID cases that reached `collected` or `rejected` are
+never updated again, yet every listing and COUNT(*) keeps scanning them.
+This job moves them, with their documents, payments and status history,
+into *_archive tables so the hot tables only hold open work.
+Range partitioning by year was not used: InnoDB does not allow foreign
+keys on partitioned tables, and these tables depend on theirs.
+
+Application and waiting-card numbers are derived from row counts, so the
+job also keeps a running total of archived rows in archive_counters.
+next_sequence() adds it back, which keeps numbering unchanged after a move.
+Tracking lookups fall back to the archive tables, so citizens can still
+track collected or rejected applications, and duplicate detection and name
+search (dedup.py, search.py) include archived applications. Duplicate
+flags stay in place, open ones included, when either application moves. Each application shard
+(shards.py) archives its own rows and keeps its own counters.
+
+Run this script from terminal:
+    python archive.py run [days]   # archive records closed more than `days` ago (default 90)
+    python archive.py stats        # hot vs archived row counts and hot-set scan timings
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+
+CLOSED_STATUSES = ('collected', 'rejected')
+BATCH_SIZE = 500
+
+# Child rows moved together with their parent: (table, foreign key column)
+_CHILDREN = {
+    'applications': [('documents', 'application_id'),
+                     ('payments', 'application_id'),
+                     ('status_history', 'application_id')],
+    'lost_id_applications': [('documents', 'lost_id_application_id'),
+                             ('payments', 'lost_id_application_id')],
+}
+
+def archived_count(cursor, table):
+    cursor.execute("SELECT archived_rows FROM archive_counters WHERE table_name = %s", (table,))
+    row = cursor.fetchone()
+    if not row:
+        return 0
+    return row['archived_rows'] if isinstance(row, dict) else row[0]
+
+def next_sequence(cursor, table):
+    """Sequence for the next APP/WAIT number: hot rows plus archived rows, plus one"""
+    cursor.execute(f"SELECT COUNT(*) AS count FROM {table}")
+    row = cursor.fetchone()
+    count = row['count'] if isinstance(row, dict) else row[0]
+    return count + archived_count(cursor, table) + 1
+
+def _archive_batch(conn, table, cutoff):
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT id FROM {table}
+        WHERE status IN (%s, %s) AND updated_at < %s
+        ORDER BY id
+        LIMIT %s
+        FOR UPDATE
+    """, (*CLOSED_STATUSES, cutoff, BATCH_SIZE))
+    ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        cursor.close()
+        return 0
+
+    placeholders = ', '.join(['%s'] * len(ids))
+    # Copy parents first, then children; delete in the reverse order
+    cursor.execute(f"INSERT INTO {table}_archive SELECT * FROM {table} WHERE id IN ({placeholders})", ids)
+    for child, column in _CHILDREN[table]:
+        cursor.execute(f"INSERT INTO {child}_archive SELECT * FROM {child} "
+                       f"WHERE {column} IN ({placeholders})", ids)
+    for child, column in _CHILDREN[table]:
+        cursor.execute(f"DELETE FROM {child} WHERE {column} IN ({placeholders})", ids)
+    cursor.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", ids)
+
+    cursor.execute("""
+        INSERT INTO archive_counters (table_name, archived_rows) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE archived_rows = archived_rows + VALUES(archived_rows)
+    """, (table, len(ids)))
+    conn.commit()
+    cursor.close()
+    return len(ids)
+
+def archive_closed(conn, older_than_days=90):
+    """Move closed records older than the cutoff, one committed batch at a time"""
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    moved = {}
+    for table in _CHILDREN:
+        moved[table] = 0
+        while True:
+            count = _archive_batch(conn, table, cutoff)
+            if not count:
+                break
+            moved[table] += count
+    return moved
+
+def find_archived_application(cursor, application_number):
+    """Tracking lookup across both archives, same shape as the hot lookup; expects a dictionary cursor"""
+    cursor.execute("""
+        SELECT application_number, full_names, status, created_at, updated_at
+        FROM applications_archive WHERE application_number = %s
+    """, (application_number,))
+    application = cursor.fetchone()
+    if application:
+        return application
+
+    cursor.execute("""
+        SELECT l.waiting_card_number as application_number, c.full_names,
+               l.status, l.created_at, l.updated_at
+        FROM lost_id_applications_archive l
+        LEFT JOIN citizens c ON l.citizen_id_number = c.id_number
+        WHERE l.waiting_card_number = %s
+    """, (application_number,))
+    return cursor.fetchone()
+
+def find_archived_lost_id(cursor, waiting_card_number):
+    """Tracking lookup for an archived lost-ID case; expects a dictionary cursor"""
+    cursor.execute("""
+        SELECT l.waiting_card_number, l.citizen_id_number, l.status,
+               l.created_at, l.updated_at, c.full_names as citizen_name
+        FROM lost_id_applications_archive l
+        LEFT JOIN citizens c ON l.citizen_id_number = c.id_number
+        WHERE l.waiting_card_number = %s
+    """, (waiting_card_number,))
+    return cursor.fetchone()
+
+def stats(conn, rounds=5):
+    """Row counts per tier and timings of the scans the dashboards run on the hot set"""
+    cursor = conn.cursor()
+    report = {}
+    for table in _CHILDREN:
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        hot = cursor.fetchone()[0]
+        cursor.execute(f"SELECT COUNT(*) FROM {table}_archive")
+        archived = cursor.fetchone()[0]
+
+        timings = {}
+        for name, query in (('count_ms', f"SELECT COUNT(*) FROM {table}"),
+                            ('listing_ms', f"SELECT * FROM {table} ORDER BY created_at DESC")):
+            started = time.perf_counter()
+            for _ in range(rounds):
+                cursor.execute(query)
+                cursor.fetchall()
+            timings[name] = (time.perf_counter() - started) / rounds * 1000
+        report[table] = {'hot': hot, 'archived': archived, **timings}
+    cursor.close()
+    return report
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        import shards
+        if command == "run":
+            days = int(sys.argv[2]) if len(sys.argv) > 2 else 90
+            for shard in range(shards.count()):
+                conn = shards.connection(shard)
+                for table, count in archive_closed(conn, days).items():
+                    print(f"shard {shard} {table}: archived {count} closed records")
+                conn.close()
+        elif command == "stats":
+            for shard in range(shards.count()):
+                conn = shards.connection(shard)
+                for table, row in stats(conn).items():
+                    print(f"shard {shard} {table}: {row['hot']} hot | {row['archived']} archived | "
+                          f"COUNT(*) {row['count_ms']:.1f}ms | listing {row['listing_ms']:.1f}ms")
+                conn.close()
+        else:
+            print(__doc__)
+    except Exception as e:
+        print(f"Error: {e}")
@@ -0,0 +1,16 @@
+-- Archival of closed records: run once on databases created before archive.py
+USE digital_id_system;
+
+CREATE TABLE IF NOT EXISTS applications_archive LIKE applications;
+CREATE TABLE IF NOT EXISTS lost_id_applications_archive LIKE lost_id_applications;
+CREATE TABLE IF NOT EXISTS documents_archive LIKE documents;
+CREATE TABLE IF NOT EXISTS payments_archive LIKE payments;
+CREATE TABLE IF NOT EXISTS status_history_archive LIKE status_history;
+
+CREATE TABLE IF NOT EXISTS archive_counters (
+    table_name VARCHAR(64) PRIMARY KEY,
+    archived_rows INT NOT NULL DEFAULT 0
+);
+
+-- Then move closed records (schedule this, e.g. nightly):
+--   python archive.py run 90
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Batch sync of applications captured offline by officers at field stations.
+
+A bundle is either an NDJSON body (one application per line, documents
+inline as base64) or a multipart form with a `records` NDJSON part and
+files named `<clientRef>.<fileKey>`. Every record carries a clientRef that
+the officer's device uses to match the per-record results. The capturing
+officer is the one whose token authenticates the request, and file keys
+must be document types the single submission form knows.
+
+All records are validated up front and their place names made canonical
+(geography.py). Valid ones are grouped by the shard of their home district
+(shards.py) and inserted in chunks: one transaction per chunk, one
+application-number allocation per chunk, and executemany() for the
+application and document rows. A chunk's documents are written to staged
+files and moved into place after its transaction commits, so a chunk that
+rolls back leaves no files behind.
+
+Run this script from terminal to compare against single submissions:
+    python batch_sync.py bench [count]
+"""
+
+import base64
+import io
+import json
+import os
+import sys
+import time
+import uuid
+
+import applications
+import archive
+import geography
+import jobs
+import shards
+
+MAX_BATCH_RECORDS = 5000
+CHUNK_SIZE = 500
+
+def parse_ndjson(text):
+    """Parse an NDJSON bundle; blank lines are ignored"""
+    records = []
+    for line_number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            raise ValueError(f'Line {line_number} is not valid JSON')
+    if len(records) > MAX_BATCH_RECORDS:
+        raise ValueError(f'A batch may contain at most {MAX_BATCH_RECORDS} records')
+    return records
+
+def _decode_inline_documents(record):
+    # {"passportPhoto": {"filename": "...", "content": "<base64>"}}
+    documents = {}
+    for file_key, document in (record.pop('documents', None) or {}).items():
+        documents[file_key] = (document['filename'], base64.b64decode(document['content']))
+    return documents
+
+def parse_multipart(form, files):
+    """
+    Parse the multipart variant: `records` NDJSON part plus `<clientRef>.<fileKey>`
+    files. Returns (records, {clientRef: {fileKey: upload}}).
+    """
+    if 'records' in files:
+        text = files['records'].read().decode('utf-8')
+    else:
+        text = form.get('records', '')
+    records = parse_ndjson(text)
+
+    uploads = {}
+    for name, upload in files.items():
+        if name == 'records' or '.' not in name or not upload.filename:
+            continue
+        client_ref, file_key = name.split('.', 1)
+        uploads.setdefault(client_ref, {})[file_key] = upload
+    return records, uploads
+
+def validate(records, uploads=None):
+    """
+    Split records into (valid, results for invalid ones). Each valid record
+    gets its documents in record['_files']: from `uploads` (multipart parts)
+    when given, else decoded from the record's inline documents.
+    """
+    valid = []
+    invalid = []
+    seen = set()
+    for index, record in enumerate(records):
+        client_ref = record.get('clientRef')
+        if not client_ref:
+            invalid.append({'index': index, 'status': 'invalid', 'error': 'clientRef is required'})
+            continue
+        if client_ref in seen:
+            invalid.append({'clientRef': client_ref, 'status': 'invalid', 'error': 'Duplicate clientRef in batch'})
+            continue
+        seen.add(client_ref)
+        record.pop('_files', None)  # internal; never taken from the client
+
+        missing = applications.missing_fields(record)
+        if missing:
+            invalid.append({'clientRef': client_ref, 'status': 'invalid',
+                            'error': f'Missing required fields: {", ".join(missing)}'})
+            continue
+        try:
+            geography.normalize_form(record)
+        except geography.GeographyError as e:
+            invalid.append({'clientRef': client_ref, 'status': 'invalid', 'error': str(e),
+                            'field': e.field, 'suggestions': e.suggestions})
+            continue
+        try:
+            if uploads is not None:
+                record.pop('documents', None)
+                record['_files'] = uploads.get(str(client_ref), {})
+            else:
+                record['_files'] = _decode_inline_documents(record)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            invalid.append({'clientRef': client_ref, 'status': 'invalid',
+                            'error': 'documents must map file keys to {filename, content}'})
+            continue
+        unknown = sorted(set(record['_files']) - set(applications.DOCUMENT_TYPES))
+        if unknown:
+            invalid.append({'clientRef': client_ref, 'status': 'invalid',
+                            'error': f'Unknown document type: {", ".join(unknown)}'})
+            continue
+        valid.append(record)
+    return valid, invalid
+
+def _stage_document(number, file_key, document):
+    """Write a document next to its final path; returns (staged path, final path)"""
+    filename = document[0] if isinstance(document, tuple) else document.filename
+    file_path = applications.upload_path(number, file_key, filename)
+    staged_path = f"{file_path}.{uuid.uuid4().hex}.part"
+    if isinstance(document, tuple):
+        with open(staged_path, 'wb') as f:
+            f.write(document[1])
+    else:
+        document.save(staged_path)
+    return staged_path, file_path
+
+def _insert_chunk(conn, shard, records, officer_id):
+    cursor = conn.cursor()
+    staged = []  # documents are moved into place only once their rows are committed
+    try:
+        # One allocation for the whole chunk
+        first = archive.next_sequence(cursor, 'applications')
+        numbers = [shards.application_number(shard, first + i) for i in range(len(records))]
+        keys = [applications.dedup_key(record) for record in records]
+
+        cursor.executemany(applications.INSERT_SQL, [
+            applications.insert_params(record, number, officer_id, key)
+            for record, number, key in zip(records, numbers, keys)
+        ])
+
+        placeholders = ', '.join(['%s'] * len(numbers))
+        cursor.execute(f"SELECT application_number, id FROM applications "
+                       f"WHERE application_number IN ({placeholders})", numbers)
+        ids = dict(cursor.fetchall())
+
+        os.makedirs(applications.UPLOAD_DIR, exist_ok=True)
+        document_rows = []
+        results = []
+        for record, number, key in zip(records, numbers, keys):
+            application_id = ids[number]
+            for file_key, document in record['_files'].items():
+                staged_path, file_path = _stage_document(number, file_key, document)
+                staged.append((staged_path, file_path))
+                document_rows.append((application_id, applications.DOCUMENT_TYPES[file_key], file_path))
+            results.append({
+                'clientRef': record['clientRef'],
+                'status': 'created',
+                'applicationNumber': number
+            })
+
+        if document_rows:
+            cursor.executemany("""
+                INSERT INTO documents (application_id, document_type, file_path)
+                VALUES (%s, %s, %s)
+            """, document_rows)
+
+        # Duplicate detection for the whole chunk runs in the background
+        jobs.enqueue_many(cursor, 'find_duplicates',
+                          [{'application_id': ids[number]} for number in numbers])
+
+        conn.commit()
+    except Exception:
+        for staged_path, _ in staged:
+            if os.path.exists(staged_path):
+                os.remove(staged_path)
+        raise
+    finally:
+        cursor.close()
+
+    for staged_path, file_path in staged:
+        os.replace(staged_path, file_path)
+    return results
+
+def sync(records, officer_id, uploads=None):
+    """
+    Validate and insert a bundle for the authenticated officer, returning
+    one result per record. `uploads` are the multipart files by clientRef.
+    """
+    valid, results = validate(records, uploads)
+    by_shard = {}
+    for record in valid:
+        by_shard.setdefault(shards.shard_for_district(record['homeDistrict']), []).append(record)
+
+    for shard, shard_records in by_shard.items():
+        conn = shards.connection(shard)
+        for start in range(0, len(shard_records), CHUNK_SIZE):
+            chunk = shard_records[start:start + CHUNK_SIZE]
+            try:
+                results.extend(_insert_chunk(conn, shard, chunk, officer_id))
+            except Exception as e:
+                conn.rollback()
+                print(f"Batch sync chunk failed: {e}")
+                results.extend({'clientRef': record['clientRef'], 'status': 'failed', 'error': str(e)}
+                               for record in chunk)
+        conn.close()
+    return results
+
+def _bench_record(i):
+    return {
+        'clientRef': f"bench-{i}", 'fullNames': f"Bench Applicant {i}", 'dateOfBirth': '1990-01-01',
+        'gender': 'female', 'fatherName': 'Bench Father', 'motherName': 'Bench Mother',
+        'districtOfBirth': 'Nairobi', 'tribe': 'Bench', 'homeDistrict': 'Nairobi',
+        'division': 'Central', 'constituency': 'Starehe', 'location': 'Town',
+        'subLocation': 'CBD', 'villageEstate': 'Bench Estate', 'occupation': 'Tester',
+        'documents': {'passportPhoto': {'filename': 'photo.jpg',
+                                        'content': base64.b64encode(os.urandom(2048)).decode('ascii')}}
+    }
+
+def benchmark(count=500):
+    """N single multipart POSTs to /api/applications vs one NDJSON batch, through the Flask test client"""
+    import jwt
+    from datetime import datetime, timedelta
+    from app import create_app
+    app = create_app('officer')
+    client = app.test_client()
+    token = jwt.encode({'officer_id': 1, 'role': 'officer', 'exp': datetime.utcnow() + timedelta(hours=1)},
+                       app.config['SECRET_KEY'], algorithm='HS256')
+    records = [_bench_record(i) for i in range(count)]
+
+    started = time.perf_counter()
+    for record in records:
+        fields = {k: v for k, v in record.items() if k not in ('clientRef', 'documents')}
+        photo = record['documents']['passportPhoto']
+        fields['passportPhoto'] = (io.BytesIO(base64.b64decode(photo['content'])), photo['filename'])
+        client.post('/api/applications', data=fields, content_type='multipart/form-data')
+    single = time.perf_counter() - started
+
+    body = '\n'.join(json.dumps(record) for record in records)
+    started = time.perf_counter()
+    client.post('/api/officer/applications/batch', data=body, content_type='application/x-ndjson',
+                headers={'Authorization': f'Bearer {token}'})
+    batch = time.perf_counter() - started
+
+    return {'records': count, 'single_seconds': single, 'batch_seconds': batch}
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+        stats = benchmark(count)
+        print(f"{stats['records']} records | single POSTs: {stats['single_seconds']:.2f}s "
+              f"({stats['records'] / stats['single_seconds']:.0f}/s) | "
+              f"batch: {stats['batch_seconds']:.2f}s ({stats['records'] / stats['batch_seconds']:.0f}/s)")
+    else:
+        print(__doc__)
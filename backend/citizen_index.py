@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Citizen identity index for the Digital ID system.
+
+The `citizens` table holds one row per issued ID number. approve_application
+writes the row in the same transaction that issues the ID, so a citizen
+lookup is a single read on the id_number key instead of probing
+`applications` and then `citizens`. A row that already exists (e.g. one
+loaded from the civil register) is never overwritten; it is only linked
+to the issuing application if it has no application_id yet.
+
+backfill and check run on every application shard (shards.py) and copy the
+rows they index to the other shards, as approve_application does.
+
+Run this script from terminal to maintain the index:
+    python citizen_index.py backfill      # index IDs issued before this table was maintained
+    python citizen_index.py check [--fix] # report drift between the two tables (--fix adds missing rows)
+    python citizen_index.py bench         # compare lookup latency, old path vs index
+"""
+
+import random
+import sys
+import time
+
+import queries
+import shards
+from db import get_db_connection
+
+# Application statuses for which an ID number has been issued
+ISSUED_STATUSES = ('approved', 'dispatched', 'ready_for_collection', 'collected')
+
+_ISSUED_IN = "(" + ", ".join(f"'{status}'" for status in ISSUED_STATUSES) + ")"
+
+_UPSERT_FROM_APPLICATIONS = f"""
+    INSERT INTO citizens (id_number, full_names, date_of_birth, place_of_birth,
+                          gender, nationality, application_id)
+    SELECT generated_id_number, full_names, date_of_birth, district_of_birth,
+           gender, 'Kenyan', id
+    FROM applications
+    WHERE {{where}} AND generated_id_number IS NOT NULL AND status IN {_ISSUED_IN}
+    ON DUPLICATE KEY UPDATE
+        citizens.application_id = COALESCE(citizens.application_id, VALUES(application_id))
+"""
+
+def register_citizen(cursor, application_id):
+    """Index the citizen whose ID was issued by this application (call before commit)"""
+    cursor.execute(_UPSERT_FROM_APPLICATIONS.format(where='id = %s'), (application_id,))
+
+def find_citizen(cursor, id_number):
+    """Look up a citizen by ID number; expects a dictionary cursor"""
+    cursor.execute(queries.QUERIES['citizen_by_id'], (id_number,))
+    return cursor.fetchone()
+
+def backfill_citizens(conn, batch_size=5000):
+    """Index every issued ID, walking applications in primary-key ranges"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM applications")
+    max_id = cursor.fetchone()[0]
+
+    indexed = 0
+    for start in range(0, max_id, batch_size):
+        cursor.execute(_UPSERT_FROM_APPLICATIONS.format(where='id > %s AND id <= %s'),
+                       (start, start + batch_size))
+        conn.commit()
+        indexed += cursor.rowcount
+    cursor.close()
+    return indexed
+
+def check_citizens(conn, batch_size=5000, fix=False):
+    """
+    Compare issued applications against the index.
+
+    Returns (missing, mismatched) lists of application ids: IDs with no
+    citizens row, and rows whose copied fields differ from the application.
+    With fix, missing rows are indexed; conflicting values are left for
+    review.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM applications")
+    max_id = cursor.fetchone()[0]
+
+    missing = []
+    mismatched = []
+    for start in range(0, max_id, batch_size):
+        cursor.execute(f"""
+            SELECT a.id, c.id_number IS NULL AS is_missing
+            FROM applications a
+            LEFT JOIN citizens c ON c.id_number = a.generated_id_number
+            WHERE a.id > %s AND a.id <= %s
+              AND a.generated_id_number IS NOT NULL AND a.status IN {_ISSUED_IN}
+              AND (c.id_number IS NULL
+                   OR NOT (c.full_names <=> a.full_names)
+                   OR NOT (c.date_of_birth <=> a.date_of_birth)
+                   OR NOT (c.place_of_birth <=> a.district_of_birth)
+                   OR NOT (c.gender <=> a.gender))
+        """, (start, start + batch_size))
+        for application_id, is_missing in cursor.fetchall():
+            (missing if is_missing else mismatched).append(application_id)
+
+    if fix:
+        for application_id in missing:
+            register_citizen(cursor, application_id)
+        conn.commit()
+
+    cursor.close()
+    return missing, mismatched
+
+def share_citizens(conn, shard, application_ids=None, batch_size=1000):
+    """
+    Copy the citizens rows issued by this shard's applications (all of them,
+    or those of `application_ids`) to every other shard. Returns the rows copied.
+    """
+    if application_ids is not None and not application_ids:
+        return 0
+    query = f"""
+        SELECT generated_id_number FROM applications
+        WHERE generated_id_number IS NOT NULL AND status IN {_ISSUED_IN}
+    """
+    params = []
+    if application_ids is not None:
+        query += f" AND id IN ({', '.join(['%s'] * len(application_ids))})"
+        params = list(application_ids)
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    id_numbers = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return sum(shards.sync_reference('citizens', id_numbers[i:i + batch_size], source=shard)
+               for i in range(0, len(id_numbers), batch_size))
+
+def _legacy_lookup(cursor, id_number):
+    # The lookup get_citizen_details did before the index existed
+    cursor.execute(f"""
+        SELECT generated_id_number as id_number, full_names, date_of_birth,
+               district_of_birth as place_of_birth, gender, 'Kenyan' as nationality
+        FROM applications
+        WHERE generated_id_number = %s AND status IN {_ISSUED_IN}
+        LIMIT 1
+    """, (id_number,))
+    citizen = cursor.fetchone()
+    if not citizen:
+        cursor.execute("""
+            SELECT id_number, full_names, date_of_birth, place_of_birth, gender, nationality
+            FROM citizens WHERE id_number = %s
+        """, (id_number,))
+        citizen = cursor.fetchone()
+    return citizen
+
+def _percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+def benchmark_lookup(conn, samples=2000):
+    """Time both lookup paths over a sample of indexed IDs, plus unknown IDs"""
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT id_number FROM citizens ORDER BY RAND() LIMIT %s", (samples,))
+    id_numbers = [row['id_number'] for row in cursor.fetchall()]
+    # Misses are the worst case for the old path: both tables are probed
+    id_numbers += [f"ID0000{random.randint(0, 99999999):08d}" for _ in range(len(id_numbers) // 4)]
+    random.shuffle(id_numbers)
+
+    results = {}
+    for name, lookup in (('legacy', _legacy_lookup), ('index', find_citizen)):
+        timings = []
+        for id_number in id_numbers:
+            started = time.perf_counter()
+            lookup(cursor, id_number)
+            timings.append((time.perf_counter() - started) * 1e6)
+        timings.sort()
+        results[name] = {
+            'lookups': len(timings),
+            'mean_us': sum(timings) / len(timings) if timings else 0,
+            'p50_us': _percentile(timings, 0.50) if timings else 0,
+            'p95_us': _percentile(timings, 0.95) if timings else 0,
+        }
+    cursor.close()
+    return results
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        # IDs are issued on every application shard (shards.py); each indexes its own,
+        # then shares the rows so citizen lookups on any shard find them
+        if command == "backfill":
+            for shard in range(shards.count()):
+                conn = shards.connection(shard)
+                written = backfill_citizens(conn)
+                print(f"shard {shard}: backfill complete ({written} rows written, "
+                      f"{share_citizens(conn, shard)} copied to other shards)")
+                conn.close()
+        elif command == "check":
+            fix = "--fix" in sys.argv
+            for shard in range(shards.count()):
+                conn = shards.connection(shard)
+                missing, mismatched = check_citizens(conn, fix=fix)
+                print(f"shard {shard}: missing from index: {len(missing)} {missing[:20]}")
+                print(f"shard {shard}: out of date in index: {len(mismatched)} {mismatched[:20]}")
+                if fix:
+                    share_citizens(conn, shard, missing)
+                conn.close()
+        elif command == "bench":
+            conn = get_db_connection()
+            for name, stats in benchmark_lookup(conn).items():
+                print(f"{name:>7}: {stats['lookups']} lookups | mean {stats['mean_us']:.0f}us | "
+                      f"p50 {stats['p50_us']:.0f}us | p95 {stats['p95_us']:.0f}us")
+            conn.close()
+        else:
+            print(__doc__)
+    except Exception as e:
+        print(f"Error: {e}")
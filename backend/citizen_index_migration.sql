@@ -0,0 +1,9 @@
+-- Citizen identity index: run once on databases created before citizen_index.py
+USE digital_id_system;
+
+-- Link each citizen row back to the application that issued the ID
+ALTER TABLE citizens ADD COLUMN application_id INT NULL AFTER nationality;
+
+-- Then index all IDs issued so far:
+--   python citizen_index.py backfill
+--   python citizen_index.py check
@@ -58,6 +58,10 @@ CREATE TABLE IF NOT EXISTS applications (
     home_address VARCHAR(255),
     occupation VARCHAR(100) NOT NULL,
     
+    -- Where status notifications go (notifications.py); optional
+    phone_number VARCHAR(20) NULL,
+    email VARCHAR(100) NULL,
+    
     -- Supporting Documents (JSON field for document info)
     supporting_documents JSON,
     
@@ -71,6 +75,15 @@ CREATE TABLE IF NOT EXISTS applications (
     -- Generated ID number (after approval)
     generated_id_number VARCHAR(20) UNIQUE NULL,
     
+    -- Duplicate-detection blocking key (see dedup.py)
+    dedup_key CHAR(40) NULL,
+    
+    -- When the application reached each stage (turnaround analytics, see analytics.py)
+    approved_at TIMESTAMP NULL DEFAULT NULL,
+    dispatched_at TIMESTAMP NULL DEFAULT NULL,
+    ready_at TIMESTAMP NULL DEFAULT NULL,
+    collected_at TIMESTAMP NULL DEFAULT NULL,
+    
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     
@@ -84,6 +97,7 @@ CREATE TABLE IF NOT EXISTS documents (
     lost_id_application_id INT NULL,
     document_type ENUM('passport_photo', 'fingerprints', 'birth_certificate', 'parent_id_front', 'parent_id_back', 'ob_photo', 'new_passport_photo', 'birth_cert_photo') NOT NULL,
     file_path VARCHAR(255) NOT NULL,
+    sha256 CHAR(64) NULL,
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     
     FOREIGN KEY (application_id) REFERENCES applications(id) ON DELETE CASCADE,
@@ -99,6 +113,7 @@ CREATE TABLE IF NOT EXISTS citizens (
     place_of_birth VARCHAR(100) NOT NULL,
     gender ENUM('male', 'female') NOT NULL,
     nationality VARCHAR(50) DEFAULT 'Kenyan',
+    application_id INT NULL,  -- application that issued this ID (maintained by citizen_index.py)
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 );
@@ -113,7 +128,13 @@ CREATE TABLE IF NOT EXISTS lost_id_applications (
     ob_description TEXT NOT NULL,
     payment_method ENUM('cash', 'mpesa') NOT NULL,
     payment_amount DECIMAL(10, 2) DEFAULT 1000.00,
+    phone_number VARCHAR(20) NULL,  -- status notifications (notifications.py)
+    email VARCHAR(100) NULL,
     status ENUM('submitted', 'approved', 'rejected', 'dispatched', 'ready_for_collection', 'collected') DEFAULT 'submitted',
+    approved_at TIMESTAMP NULL DEFAULT NULL,
+    dispatched_at TIMESTAMP NULL DEFAULT NULL,
+    ready_at TIMESTAMP NULL DEFAULT NULL,
+    collected_at TIMESTAMP NULL DEFAULT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     
@@ -129,6 +150,8 @@ CREATE TABLE IF NOT EXISTS payments (
     amount DECIMAL(10, 2) NOT NULL,
     payment_method ENUM('cash', 'mpesa') NOT NULL,
     mpesa_transaction_id VARCHAR(50) NULL,
+    account_reference VARCHAR(50) NULL,  -- paybill account number the payer enters (waiting card number)
+    payer_phone VARCHAR(20) NULL,
     status ENUM('pending', 'completed', 'failed') DEFAULT 'pending',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     
@@ -136,6 +159,78 @@ CREATE TABLE IF NOT EXISTS payments (
     FOREIGN KEY (lost_id_application_id) REFERENCES lost_id_applications(id)
 );
 
+-- Likely duplicate applicants found at submission time (see dedup.py)
+CREATE TABLE IF NOT EXISTS duplicate_flags (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    application_id INT NOT NULL,
+    candidate_application_id INT NOT NULL,
+    score DECIMAL(4, 3) NOT NULL,
+    status ENUM('open', 'confirmed', 'dismissed') DEFAULT 'open',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    -- No foreign keys: the candidate may be on another shard (see shards.py), and
+    -- archiving either application (archive.py) must not delete the flag
+    INDEX idx_duplicate_flags_application (application_id),
+    INDEX idx_duplicate_flags_candidate (candidate_application_id)
+);
+
+-- Idempotency keys for submission retries (see idempotency.py)
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    idem_key VARCHAR(64) PRIMARY KEY,
+    route VARCHAR(64) NOT NULL,
+    request_hash BINARY(32) NOT NULL,
+    status ENUM('in_progress', 'completed') NOT NULL,
+    response_code SMALLINT NULL,
+    response_body MEDIUMTEXT NULL,
+    created_at DATETIME NOT NULL,
+    expires_at DATETIME NOT NULL,
+    
+    INDEX idx_idempotency_keys_expires (expires_at)
+);
+
+-- Background jobs (jobs.py). Workers claim rows with FOR UPDATE SKIP LOCKED;
+-- run_at doubles as the visibility deadline while a job is running.
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    queue VARCHAR(50) NOT NULL DEFAULT 'default',
+    kind VARCHAR(50) NOT NULL,
+    payload JSON NOT NULL,
+    status ENUM('queued', 'running', 'done', 'dead') NOT NULL DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_at DATETIME(3) NOT NULL,
+    locked_by VARCHAR(100) NULL,
+    last_error TEXT NULL,
+    created_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    finished_at DATETIME(3) NULL,
+    
+    INDEX idx_jobs_claim (queue, status, run_at),
+    INDEX idx_jobs_finished (status, finished_at)
+);
+
+-- Citizen status notifications (notifications.py): an outbox filled in the
+-- same transaction as the status change and drained in batches by a job
+CREATE TABLE IF NOT EXISTS notifications (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    source ENUM('application', 'lost_id') NOT NULL,
+    record_id INT NOT NULL,
+    event ENUM('approved', 'dispatched', 'ready_for_collection') NOT NULL,
+    channel ENUM('sms', 'email') NOT NULL,
+    recipient VARCHAR(100) NOT NULL,
+    reference VARCHAR(50) NOT NULL,
+    full_names VARCHAR(100) NULL,
+    status ENUM('pending', 'sent', 'failed', 'coalesced') NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    last_error TEXT NULL,
+    created_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    sent_at DATETIME(3) NULL,
+    
+    INDEX idx_notifications_due (status, next_attempt_at),
+    INDEX idx_notifications_record (source, record_id, channel),
+    INDEX idx_notifications_sent (sent_at)
+);
+
 -- Status history table (for tracking status changes)
 CREATE TABLE IF NOT EXISTS status_history (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -163,8 +258,35 @@ CREATE INDEX IF NOT EXISTS idx_officers_status ON officers(status);
 CREATE INDEX IF NOT EXISTS idx_applications_number ON applications(application_number);
 CREATE INDEX IF NOT EXISTS idx_applications_status ON applications(status);
 CREATE INDEX IF NOT EXISTS idx_applications_officer ON applications(officer_id);
+CREATE INDEX IF NOT EXISTS idx_applications_status_updated ON applications(status, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_applications_dedup_key ON applications(dedup_key);
+CREATE INDEX IF NOT EXISTS idx_applications_updated ON applications(updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_duplicate_flags_status ON duplicate_flags(status, score);
 CREATE INDEX IF NOT EXISTS idx_documents_application ON documents(application_id);
 CREATE INDEX IF NOT EXISTS idx_citizens_id_number ON citizens(id_number);
 CREATE INDEX IF NOT EXISTS idx_lost_id_applications_citizen ON lost_id_applications(citizen_id_number);
 CREATE INDEX IF NOT EXISTS idx_lost_id_applications_officer ON lost_id_applications(officer_id);
-CREATE INDEX IF NOT EXISTS idx_lost_id_applications_status ON lost_id_applications(status);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_lost_id_applications_status ON lost_id_applications(status);
+CREATE INDEX IF NOT EXISTS idx_lost_id_applications_status_updated ON lost_id_applications(status, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_lost_id_applications_updated ON lost_id_applications(updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_documents_lost_id_application ON documents(lost_id_application_id);
+CREATE INDEX IF NOT EXISTS idx_payments_status_method ON payments(status, payment_method);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_mpesa_transaction ON payments(mpesa_transaction_id);
+
+-- Name search indexes (search.py). The ngram parser tokenizes by ngram_token_size;
+-- set ngram_token_size=3 in my.cnf before creating them to get trigram tokens.
+CREATE FULLTEXT INDEX ft_applications_search ON applications(full_names, father_name, mother_name, district_of_birth, home_district, division, constituency, location, sub_location) WITH PARSER ngram;
+CREATE FULLTEXT INDEX ft_citizens_search ON citizens(full_names, place_of_birth) WITH PARSER ngram;
+-- Archive tables for closed records (archive.py). LIKE copies columns and
+-- indexes but not foreign keys, so archived rows no longer pin their parents.
+CREATE TABLE IF NOT EXISTS applications_archive LIKE applications;
+CREATE TABLE IF NOT EXISTS lost_id_applications_archive LIKE lost_id_applications;
+CREATE TABLE IF NOT EXISTS documents_archive LIKE documents;
+CREATE TABLE IF NOT EXISTS payments_archive LIKE payments;
+CREATE TABLE IF NOT EXISTS status_history_archive LIKE status_history;
+
+-- Rows moved to each archive table, so APP/WAIT numbering stays count-based
+CREATE TABLE IF NOT EXISTS archive_counters (
+    table_name VARCHAR(64) PRIMARY KEY,
+    archived_rows INT NOT NULL DEFAULT 0
+);
@@ -0,0 +1,260 @@
+"""
+Database connection settings shared by the API and the maintenance scripts.
+
+Writes always go to the primary (get_db_connection). Read-only routes use
+get_read_connection, which goes to the replica when one is configured,
+except:
+  - for STICKY_SECONDS after the same client made a write (read-your-writes)
+  - while replica lag is above MAX_REPLICA_LAG or cannot be measured
+  - when the replica cannot be reached
+To try it locally, run a second MySQL replicating from the first and set
+DB_REPLICA_HOST / DB_REPLICA_PORT.
+
+Connections come from a per-process pool of DB_POOL_SIZE (0 turns pooling
+off), so server-side prepared statements (queries.py) outlive a request.
+Pooled sessions are not reset on return, which would drop those
+statements; instead an open transaction is rolled back at checkout, and
+connections a request forgot to close are returned when it ends.
+
+Every connection has a DB_TIMEOUT connect/read timeout, API sessions a
+server-side statement timeout, and all queries go through a per-server
+circuit breaker (see resilience.py). While the primary's breaker is open,
+requests that fail with a 500 are answered 503 with Retry-After.
+
+Applications can be spread over further nodes listed in DB_SHARDS; the
+primary is shard 0 (see shards.py and get_shard_connection).
+"""
+
+import os
+import threading
+import time
+
+import mysql.connector
+from mysql.connector.pooling import MySQLConnectionPool
+from flask import request, g, has_request_context
+
+import resilience
+import startup
+
+# Database configuration
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',  # Your MySQL username
+    'password': '',  # Your MySQL password
+    'database': 'digital_id_system',
+    'connection_timeout': int(os.environ.get('DB_TIMEOUT', 5))  # seconds, connect and each network read/write; the C extension takes only an int
+}
+
+# Server-side limits for API sessions, so a stuck statement ends on the server too.
+# Maintenance scripts run long scans and keep the server defaults.
+STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 3000))  # SELECTs only
+LOCK_WAIT_TIMEOUT = int(os.environ.get('DB_LOCK_WAIT_TIMEOUT', 5))           # seconds
+
+# Application shards (shards.py). The primary above is shard 0 and also holds every
+# table that is not sharded; DB_SHARDS lists further nodes as host:port[,host:port...].
+SHARD_CONFIGS = [DB_CONFIG] + [
+    {**DB_CONFIG, 'host': node.rsplit(':', 1)[0], 'port': int(node.rsplit(':', 1)[1])}
+    for node in os.environ.get('DB_SHARDS', '').split(',') if node.strip()
+]
+# With more than one shard, row ids step by SHARD_SLOTS and start at shard + 1,
+# so any id tells which shard holds the row
+SHARD_SLOTS = 16
+
+# Read replica (None = all reads go to the primary)
+REPLICA_CONFIG = None
+if os.environ.get('DB_REPLICA_HOST'):
+    REPLICA_CONFIG = {
+        **DB_CONFIG,
+        'host': os.environ['DB_REPLICA_HOST'],
+        'port': int(os.environ.get('DB_REPLICA_PORT', 3306))
+    }
+
+MAX_REPLICA_LAG = 5       # seconds behind the primary before reads fall back to it
+LAG_CHECK_INTERVAL = 2    # seconds between replica lag probes
+STICKY_SECONDS = 10       # reads stay on the primary this long after a client's write
+STICKY_COOKIE = 'db_primary_until'
+
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))  # per process and per server
+
+_lag = {'seconds': None, 'checked_at': 0.0}
+_lag_lock = threading.Lock()
+_sticky_clients = {}
+_pools = {}  # (pid, name) -> MySQLConnectionPool
+_pool_lock = threading.Lock()
+_api_sessions = False  # set by init_app: apply the statement timeouts
+
+BREAKERS = {'primary': resilience.CircuitBreaker('primary'),
+            'replica': resilience.CircuitBreaker('replica')}
+
+def _session_config(config, shard=None):
+    settings = []
+    if _api_sessions:
+        settings += [f"max_execution_time = {STATEMENT_TIMEOUT_MS}",
+                     f"innodb_lock_wait_timeout = {LOCK_WAIT_TIMEOUT}"]
+    if shard is not None and len(SHARD_CONFIGS) > 1:
+        settings += [f"auto_increment_increment = {SHARD_SLOTS}",
+                     f"auto_increment_offset = {shard + 1}"]
+    if not settings:
+        return config
+    return {**config, 'init_command': "SET SESSION " + ", ".join(settings)}
+
+def _checkout(name, config):
+    """Pooled connection to one server; a plain one when pooling is off or the pool is exhausted"""
+    if not POOL_SIZE:
+        return mysql.connector.connect(**config)
+    # Keyed by pid: worker processes forked after a pool was built must not share its sockets
+    key = (os.getpid(), name)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = MySQLConnectionPool(pool_name=f"{name}_{os.getpid()}", pool_size=POOL_SIZE,
+                                           pool_reset_session=False, **config)
+                _pools[key] = pool
+    try:
+        conn = pool.get_connection()
+    except mysql.connector.errors.PoolError:
+        return mysql.connector.connect(**config)
+    if conn.in_transaction:
+        conn.rollback()  # left open by a previous borrower
+    if has_request_context():
+        g.setdefault('pooled_connections', []).append(conn)
+    return conn
+
+def _connect(name, config, shard=None):
+    """Connection to one server through its circuit breaker, with every query guarded by it"""
+    breaker = BREAKERS.get(name)
+    if breaker is None:
+        breaker = BREAKERS.setdefault(name, resilience.CircuitBreaker(name))
+    conn = breaker.call(_checkout, name, _session_config(config, shard))
+    resilience.guard(getattr(conn, '_cnx', None) or conn, breaker)
+    return conn
+
+def get_db_connection():
+    """Connection to the primary, for writes and reads that must see them"""
+    return _connect('primary', DB_CONFIG, 0)
+
+def get_shard_connection(shard):
+    """Connection to one application shard (0 is the primary)"""
+    if shard == 0:
+        return get_db_connection()
+    return _connect(f"shard{shard}", SHARD_CONFIGS[shard], shard)
+
+def run_read(query, connect=None):
+    """
+    query(conn) on a read connection (or one from `connect`), run again on a
+    fresh connection after a transient failure (resilience.retry_read).
+    Only for idempotent reads.
+    """
+    def attempt():
+        conn = (connect or get_read_connection)()
+        try:
+            return query(conn)
+        finally:
+            conn.close()
+    return resilience.retry_read(attempt)
+
+def _client_key():
+    return request.headers.get('Authorization') or request.remote_addr
+
+def _is_sticky():
+    if not has_request_context():
+        return False
+    now = time.time()
+    try:
+        if float(request.cookies.get(STICKY_COOKIE, 0)) > now:
+            return True
+    except ValueError:
+        pass
+    return _sticky_clients.get(_client_key(), 0) > now
+
+def _measure_lag(conn):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SHOW REPLICA STATUS")
+    except mysql.connector.Error:
+        cursor.execute("SHOW SLAVE STATUS")  # MySQL before 8.0.22
+    status = cursor.fetchone()
+    cursor.close()
+    if not status:
+        return None
+    # None when replication is stopped or broken
+    return status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+
+def replica_lag(conn):
+    """Replica lag in seconds, probed at most every LAG_CHECK_INTERVAL"""
+    now = time.monotonic()
+    with _lag_lock:
+        if now - _lag['checked_at'] < LAG_CHECK_INTERVAL:
+            return _lag['seconds']
+        _lag['checked_at'] = now
+    try:
+        seconds = _measure_lag(conn)
+    except mysql.connector.Error as e:
+        print(f"Could not measure replica lag: {e}")
+        seconds = None
+    _lag['seconds'] = seconds
+    return seconds
+
+def get_read_connection():
+    """Connection for read-only queries: the replica when it is safe to use, else the primary"""
+    if REPLICA_CONFIG is None or _is_sticky():
+        return get_db_connection()
+    try:
+        conn = _connect('replica', REPLICA_CONFIG)
+    except mysql.connector.Error as e:
+        print(f"Replica unavailable, reading from primary: {e}")
+        return get_db_connection()
+
+    lag = replica_lag(conn)
+    if lag is None or lag > MAX_REPLICA_LAG:
+        conn.close()
+        return get_db_connection()
+    if has_request_context():
+        g.read_from_replica = True
+    return conn
+
+def _dump_sticky():
+    now = time.time()
+    return {key: until for key, until in _sticky_clients.items() if until > now}
+
+def _load_sticky(state):
+    _sticky_clients.update(state)
+
+def init_app(app):
+    """Pin a client's reads to the primary after each successful write, and tag replica reads"""
+    global _api_sessions
+    _api_sessions = True
+    startup.register_snapshot('sticky_clients', _dump_sticky, _load_sticky)
+
+    @app.teardown_request
+    def return_connections(exc):
+        # Error paths in the routes often skip conn.close(); without this the pool would drain
+        for conn in g.pop('pooled_connections', []):
+            if getattr(conn, '_cnx', None) is None:
+                continue  # already returned
+            try:
+                conn.rollback()
+            except mysql.connector.Error:
+                pass
+            conn.close()
+
+    @app.after_request
+    def remember_writes(response):
+        if g.get('read_from_replica'):
+            response.headers['X-Read-Source'] = 'replica'
+        if response.status_code == 500 and BREAKERS['primary'].is_open:
+            # The route's blanket except turned DatabaseUnavailable into a 500
+            response.status_code = 503
+            response.headers['Retry-After'] = str(int(BREAKERS['primary'].cooldown))
+        if request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and response.status_code < 400:
+            until = time.time() + STICKY_SECONDS
+            _sticky_clients[_client_key()] = until
+            response.set_cookie(STICKY_COOKIE, str(until), max_age=STICKY_SECONDS, httponly=True)
+            if len(_sticky_clients) > 10000:
+                now = time.time()
+                for key, expires in list(_sticky_clients.items()):
+                    if expires < now:
+                        _sticky_clients.pop(key, None)
+        return response
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Duplicate-applicant detection for new ID applications.
+
+Each application gets a blocking key built from date of birth, district of
+birth and the Soundex codes of the mother's name, stored in the indexed
+applications.dedup_key column. After submission a background job
+(jobs.py) fetches and scores only the rows sharing that key, so the cost
+grows with the number of candidates, not with the size of the table. Likely duplicates are recorded in
+duplicate_flags for an admin to review; the submission itself still goes
+through. The key is looked up on every shard (shards.py) and in the
+archive (archive.py), so a flag's candidate may live on another node, or
+in applications_archive, and flags have no foreign keys.
+
+Run this script from terminal:
+    python dedup.py backfill             # compute dedup_key for existing applications
+    python dedup.py bench [count]        # throughput and recall on synthetic data with injected duplicates
+"""
+
+import hashlib
+import random
+import sys
+import time
+from datetime import date, timedelta
+from difflib import SequenceMatcher
+
+DUPLICATE_THRESHOLD = 0.85
+MAX_CANDIDATES = 50
+# Re-registration mistakes injected by the benchmark
+DUPLICATE_KINDS = ('typo', 'name_order', 'dob_shift')
+
+_SOUNDEX_CODES = {}
+for _letters, _code in (('BFPV', '1'), ('CGJKQSXZ', '2'), ('DT', '3'),
+                        ('L', '4'), ('MN', '5'), ('R', '6')):
+    for _letter in _letters:
+        _SOUNDEX_CODES[_letter] = _code
+
+def soundex(word):
+    """American Soundex code, e.g. 'Wanjiku' -> 'W522'"""
+    word = ''.join(ch for ch in word.upper() if 'A' <= ch <= 'Z')
+    if not word:
+        return ''
+    code = word[0]
+    previous = _SOUNDEX_CODES.get(word[0], '')
+    for ch in word[1:]:
+        digit = _SOUNDEX_CODES.get(ch, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if ch not in 'HW':
+            previous = digit
+    return code.ljust(4, '0')
+
+def _normalize(text):
+    return ' '.join((text or '').lower().split())
+
+def blocking_key(date_of_birth, district_of_birth, mother_name):
+    """SHA-1 of dob|district|sorted mother-name Soundex codes, as stored in dedup_key"""
+    phonetic = '-'.join(sorted({soundex(token) for token in _normalize(mother_name).split()} - {''}))
+    raw = f"{date_of_birth}|{_normalize(district_of_birth)}|{phonetic}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def _name_similarity(a, b):
+    # Token order varies between registrations ("Kamau John" / "John Kamau")
+    a = ' '.join(sorted(_normalize(a).split()))
+    b = ' '.join(sorted(_normalize(b).split()))
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+def score_candidate(applicant, candidate):
+    """Weighted name similarity in [0, 1]; both arguments use the applications column names"""
+    score = (0.6 * _name_similarity(applicant['full_names'], candidate['full_names']) +
+             0.25 * _name_similarity(applicant['father_name'], candidate['father_name']) +
+             0.15 * _name_similarity(applicant['mother_name'], candidate['mother_name']))
+    if applicant.get('gender') and candidate.get('gender') and applicant['gender'] != candidate['gender']:
+        score *= 0.5
+    return round(score, 3)
+
+def _block(conn, application_id, dedup_key):
+    # Archived (collected or rejected) applicants still count: holding an ID is
+    # exactly when a second registration matters
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("""
+        (SELECT id, application_number, full_names, father_name, mother_name, gender
+         FROM applications
+         WHERE dedup_key = %(key)s AND id <> %(id)s
+         LIMIT %(limit)s)
+        UNION ALL
+        (SELECT id, application_number, full_names, father_name, mother_name, gender
+         FROM applications_archive
+         WHERE dedup_key = %(key)s
+         LIMIT %(limit)s)
+    """, {'key': dedup_key, 'id': application_id, 'limit': MAX_CANDIDATES})
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+def find_candidates(conn, application_id, dedup_key):
+    """
+    Applications sharing dedup_key on every shard. Applicants are sharded by
+    home district and the key uses district of birth, so a duplicate can be
+    on any shard; `conn` serves the application's own shard.
+    """
+    import shards
+    own = shards.shard_for_id(application_id)
+    candidates = _block(conn, application_id, dedup_key)
+    others = [shard for shard in range(shards.count()) if shard != own]
+    if others:
+        for rows in shards.scatter(lambda other, shard: _block(other, application_id, dedup_key), others):
+            candidates.extend(rows)
+    return candidates[:MAX_CANDIDATES]
+
+def describe_applications(ids):
+    """id -> application_number, full_names and status for application ids on any shard, archived or not"""
+    import shards
+    by_shard = {}
+    for application_id in set(ids):
+        by_shard.setdefault(shards.shard_for_id(application_id), []).append(application_id)
+    if not by_shard:
+        return {}
+
+    def lookup(conn, shard):
+        wanted = by_shard[shard]
+        placeholders = ', '.join(['%s'] * len(wanted))
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(f"""
+            SELECT id, application_number, full_names, status FROM applications
+            WHERE id IN ({placeholders})
+            UNION ALL
+            SELECT id, application_number, full_names, status FROM applications_archive
+            WHERE id IN ({placeholders})
+        """, wanted * 2)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    return {row['id']: row for rows in shards.scatter(lookup, list(by_shard)) for row in rows}
+
+def find_duplicates(conn, application_id, applicant, dedup_key):
+    """
+    Score the applications sharing dedup_key and flag the likely duplicates.
+
+    Returns a list of (application_number, score) above the threshold.
+    Runs inside the caller's transaction; call before commit.
+    """
+    candidates = find_candidates(conn, application_id, dedup_key)
+
+    cursor = conn.cursor(dictionary=True)
+    duplicates = []
+    for candidate in candidates:
+        score = score_candidate(applicant, candidate)
+        if score >= DUPLICATE_THRESHOLD:
+            duplicates.append((candidate['id'], candidate['application_number'], score))
+
+    if duplicates:
+        cursor.executemany("""
+            INSERT INTO duplicate_flags (application_id, candidate_application_id, score)
+            VALUES (%s, %s, %s)
+        """, [(application_id, candidate_id, score) for candidate_id, _, score in duplicates])
+
+    cursor.close()
+    return [(number, score) for _, number, score in duplicates]
+
+def backfill_keys(conn, batch_size=5000):
+    """Compute dedup_key for applications created before detection was enabled"""
+    read_cursor = conn.cursor(dictionary=True)
+    write_cursor = conn.cursor()
+    updated = 0
+    for table in ('applications', 'applications_archive'):
+        last_id = 0
+        while True:
+            read_cursor.execute(f"""
+                SELECT id, date_of_birth, district_of_birth, mother_name
+                FROM {table}
+                WHERE id > %s AND dedup_key IS NULL
+                ORDER BY id
+                LIMIT %s
+            """, (last_id, batch_size))
+            rows = read_cursor.fetchall()
+            if not rows:
+                break
+            write_cursor.executemany(f"UPDATE {table} SET dedup_key = %s WHERE id = %s", [
+                (blocking_key(row['date_of_birth'], row['district_of_birth'], row['mother_name']), row['id'])
+                for row in rows
+            ])
+            conn.commit()
+            updated += len(rows)
+            last_id = rows[-1]['id']
+    read_cursor.close()
+    write_cursor.close()
+    return updated
+
+_FIRST_NAMES = ['John', 'Mary', 'Peter', 'Grace', 'James', 'Faith', 'David', 'Mercy',
+                'Joseph', 'Esther', 'Samuel', 'Ann', 'Daniel', 'Ruth', 'Brian', 'Joy']
+_SURNAMES = ['Kamau', 'Wanjiku', 'Otieno', 'Achieng', 'Mutua', 'Mwangi', 'Kiprop', 'Chebet',
+             'Omondi', 'Njoroge', 'Wambui', 'Kibet', 'Atieno', 'Barasa', 'Nyambura', 'Korir']
+_DISTRICTS = ['Nairobi', 'Kiambu', 'Nakuru', 'Kisumu', 'Mombasa', 'Machakos', 'Uasin Gishu',
+              'Kakamega', 'Nyeri', 'Meru', 'Kisii', 'Bungoma', 'Kilifi', 'Kericho']
+
+def _synthetic_applicant(rng):
+    return {
+        'full_names': f"{rng.choice(_FIRST_NAMES)} {rng.choice(_SURNAMES)} {rng.choice(_SURNAMES)}",
+        'father_name': f"{rng.choice(_FIRST_NAMES)} {rng.choice(_SURNAMES)}",
+        'mother_name': f"{rng.choice(_FIRST_NAMES)} {rng.choice(_SURNAMES)}",
+        'gender': rng.choice(['male', 'female']),
+        'date_of_birth': f"{rng.randint(1950, 2008)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        'district_of_birth': rng.choice(_DISTRICTS),
+    }
+
+def _typo(rng, text):
+    # One keying slip in one name: a letter replaced, dropped or swapped with its neighbour
+    tokens = text.split()
+    i = rng.randrange(len(tokens))
+    word = tokens[i]
+    j = rng.randrange(1, max(2, len(word) - 1))
+    slip = rng.choice(('replace', 'drop', 'swap'))
+    if slip == 'replace':
+        word = word[:j] + rng.choice('aeiounrstlk') + word[j + 1:]
+    elif slip == 'drop':
+        word = word[:j] + word[j + 1:]
+    else:
+        word = word[:j - 1] + word[j] + word[j - 1] + word[j + 1:]
+    tokens[i] = word
+    return ' '.join(tokens)
+
+def _perturbed(rng, original):
+    """A second registration of `original`, with one of the mistakes seen in practice"""
+    duplicate = dict(original)
+    kind = rng.choice(DUPLICATE_KINDS)
+    if kind == 'typo':
+        duplicate['full_names'] = _typo(rng, original['full_names'])
+    elif kind == 'name_order':
+        tokens = original['full_names'].split()
+        rng.shuffle(tokens)
+        duplicate['full_names'] = ' '.join(tokens)
+    else:
+        shifted = date.fromisoformat(original['date_of_birth']) + timedelta(days=rng.choice((-1, 1)))
+        duplicate['date_of_birth'] = shifted.isoformat()
+    return kind, duplicate
+
+def benchmark(count=1000000, duplicate_rate=0.05, seed=42):
+    """
+    Simulate `count` submissions against an in-memory stand-in for the
+    dedup_key index and report keying + scoring throughput. A
+    `duplicate_rate` share of them re-register an earlier applicant with a
+    typo, reordered names or a date of birth one day off; the result counts
+    how many of those were flagged (recall, per kind) and how many flags hit
+    someone else (false positives). A shifted date of birth changes the
+    blocking key, so those duplicates are never scored.
+    """
+    rng = random.Random(seed)
+    index = {}
+    submitted = []
+    candidates_seen = 0
+    flagged = 0
+    false_flags = 0
+    scoring_seconds = 0.0
+    injected = {kind: 0 for kind in DUPLICATE_KINDS}
+    caught = {kind: 0 for kind in DUPLICATE_KINDS}
+    started = time.perf_counter()
+    for person in range(count):
+        kind = None
+        if submitted and rng.random() < duplicate_rate:
+            kind, applicant = _perturbed(rng, rng.choice(submitted))
+            injected[kind] += 1
+        else:
+            applicant = _synthetic_applicant(rng)
+            applicant['person'] = person
+            submitted.append(applicant)
+        key = blocking_key(applicant['date_of_birth'], applicant['district_of_birth'],
+                           applicant['mother_name'])
+        block = index.setdefault(key, [])
+        found = False
+        scoring_started = time.perf_counter()
+        for candidate in block[:MAX_CANDIDATES]:
+            candidates_seen += 1
+            if score_candidate(applicant, candidate) >= DUPLICATE_THRESHOLD:
+                flagged += 1
+                if candidate['person'] == applicant['person']:
+                    found = True
+                else:
+                    false_flags += 1
+        scoring_seconds += time.perf_counter() - scoring_started
+        if kind and found:
+            caught[kind] += 1
+        block.append(applicant)
+    elapsed = time.perf_counter() - started
+    return {
+        'submissions': count,
+        'seconds': elapsed,
+        'per_second': count / elapsed if elapsed else 0,
+        'candidates_scored': candidates_seen,
+        'scoring_seconds': scoring_seconds,
+        'flagged': flagged,
+        'false_flags': false_flags,
+        'injected': injected,
+        'caught': caught,
+    }
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        if command == "backfill":
+            from db import get_db_connection
+            conn = get_db_connection()
+            print(f"Computed dedup_key for {backfill_keys(conn)} applications")
+            conn.close()
+        elif command == "bench":
+            count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+            stats = benchmark(count)
+            print(f"{stats['submissions']} submissions in {stats['seconds']:.1f}s "
+                  f"({stats['per_second']:.0f}/s) | {stats['candidates_scored']} candidates scored "
+                  f"in {stats['scoring_seconds']:.2f}s | {stats['flagged']} flagged, "
+                  f"{stats['false_flags']} of them someone else")
+            for kind, injected in stats['injected'].items():
+                caught = stats['caught'][kind]
+                print(f"{kind:>10}: {caught}/{injected} injected duplicates flagged"
+                      f" ({caught / injected:.0%})" if injected else f"{kind:>10}: none injected")
+        else:
+            print(__doc__)
+    except Exception as e:
+        print(f"Error: {e}")
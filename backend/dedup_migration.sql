@@ -0,0 +1,21 @@
+-- Duplicate-applicant detection: run once on databases created before dedup.py
+USE digital_id_system;
+
+ALTER TABLE applications ADD COLUMN dedup_key CHAR(40) NULL AFTER generated_id_number;
+CREATE INDEX idx_applications_dedup_key ON applications(dedup_key);
+
+CREATE TABLE IF NOT EXISTS duplicate_flags (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    application_id INT NOT NULL,
+    candidate_application_id INT NOT NULL,
+    score DECIMAL(4, 3) NOT NULL,
+    status ENUM('open', 'confirmed', 'dismissed') DEFAULT 'open',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    FOREIGN KEY (application_id) REFERENCES applications(id) ON DELETE CASCADE,
+    FOREIGN KEY (candidate_application_id) REFERENCES applications(id) ON DELETE CASCADE
+);
+CREATE INDEX idx_duplicate_flags_status ON duplicate_flags(status, score);
+
+-- Then key the existing applications:
+--   python dedup.py backfill
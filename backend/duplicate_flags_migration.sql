@@ -0,0 +1,12 @@
+-- Duplicate flags across shards and the archive: run once on databases created before this change
+USE digital_id_system;
+
+-- Candidates are looked up on every shard and in applications_archive (see
+-- dedup.py), so a flag's candidate may not exist in this node's applications
+-- table. Archiving an application (archive.py) deleted its flags through
+-- ON DELETE CASCADE, open ones included. The indexes MySQL created for the
+-- constraints stay. The constraint names are MySQL's defaults; check
+-- SHOW CREATE TABLE duplicate_flags if yours differ.
+ALTER TABLE duplicate_flags
+    DROP FOREIGN KEY duplicate_flags_ibfk_1,
+    DROP FOREIGN KEY duplicate_flags_ibfk_2;
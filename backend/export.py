@@ -0,0 +1,289 @@
+"""
+Streaming export of approved/dispatched records for the card-printing bureau.
+
+Rows are read from an unbuffered cursor in fetchmany() batches and written
+out as CSV, NDJSON or Parquet chunks as they arrive, so memory use stays
+constant no matter how many records are exported. Incremental exports pass
+the (updated_at, id) watermark of the last record they received. Records of
+all application shards (shards.py) are merged into one stream in that order.
+"""
+
+import csv
+import heapq
+import io
+import json
+import os
+import tarfile
+from datetime import date, datetime
+from decimal import Decimal
+
+import shards
+from startup import Lazy
+
+def _load_pyarrow():
+    import pyarrow
+    import pyarrow.parquet
+    return pyarrow
+
+# Parquet export is optional; pyarrow is imported on the first Parquet export
+pyarrow = Lazy('pyarrow', _load_pyarrow)
+
+def parquet_available():
+    return pyarrow.get() is not None
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+EXPORT_STATUSES = ('approved', 'dispatched')
+EXPORT_STATEMENT_TIMEOUT_MS = 2 * 3600 * 1000
+
+# Document types that are printed on the card
+PHOTO_DOCUMENT_TYPES = ('passport_photo', 'new_passport_photo')
+
+EXPORT_SOURCES = {
+    'applications': {
+        'query': """
+            SELECT a.id, a.application_number, a.generated_id_number, a.full_names,
+                   a.date_of_birth, a.gender, a.district_of_birth, a.home_district,
+                   a.constituency, a.location, a.sub_location, a.status,
+                   o.station, a.created_at, a.updated_at,
+                   d.document_type, d.file_path
+            FROM applications a
+            LEFT JOIN officers o ON a.officer_id = o.id
+            LEFT JOIN documents d ON d.application_id = a.id
+            WHERE a.status IN ('approved', 'dispatched') {watermark}
+            ORDER BY a.updated_at, a.id
+        """,
+        'alias': 'a',
+        'number_column': 'application_number',
+        'columns': ['id', 'application_number', 'generated_id_number', 'full_names',
+                    'date_of_birth', 'gender', 'district_of_birth', 'home_district',
+                    'constituency', 'location', 'sub_location', 'status',
+                    'station', 'created_at', 'updated_at'],
+    },
+    'lost-id': {
+        'query': """
+            SELECT l.id, l.waiting_card_number, l.citizen_id_number, c.full_names,
+                   c.date_of_birth, c.gender, c.place_of_birth, l.ob_number, l.status,
+                   o.station, l.created_at, l.updated_at,
+                   d.document_type, d.file_path
+            FROM lost_id_applications l
+            LEFT JOIN citizens c ON l.citizen_id_number = c.id_number
+            LEFT JOIN officers o ON l.officer_id = o.id
+            LEFT JOIN documents d ON d.lost_id_application_id = l.id
+            WHERE l.status IN ('approved', 'dispatched') {watermark}
+            ORDER BY l.updated_at, l.id
+        """,
+        'alias': 'l',
+        'number_column': 'waiting_card_number',
+        'columns': ['id', 'waiting_card_number', 'citizen_id_number', 'full_names',
+                    'date_of_birth', 'gender', 'place_of_birth', 'ob_number', 'status',
+                    'station', 'created_at', 'updated_at'],
+    },
+}
+
+def parse_watermark(updated_at, record_id):
+    """Parse the since_updated_at/since_id query arguments into a watermark tuple"""
+    if not updated_at:
+        return None
+    try:
+        since = datetime.fromisoformat(updated_at)
+        since_id = int(record_id or 0)
+    except (TypeError, ValueError):
+        raise ValueError('since_updated_at must be an ISO timestamp and since_id an integer')
+    return since, since_id
+
+def iter_records(conn, source, since=None, batch_size=1000):
+    """
+    Yield one dict per approved/dispatched record, with its documents attached.
+
+    The join with documents produces one row per document; because rows are
+    ordered by (updated_at, id) the rows of a record are adjacent and can be
+    folded together without holding more than one record in memory. The
+    connection is closed once the generator is exhausted or closed.
+    """
+    spec = EXPORT_SOURCES[source]
+    params = ()
+    watermark = ''
+    if since:
+        alias = spec['alias']
+        watermark = (f"AND ({alias}.updated_at > %s OR "
+                     f"({alias}.updated_at = %s AND {alias}.id > %s))")
+        params = (since[0], since[0], since[1])
+
+    # Unbuffered cursor: rows are streamed from the server as we fetch them
+    cursor = conn.cursor(dictionary=True, buffered=False)
+    try:
+        # Exports stream for longer than the API's statement timeout (db.STATEMENT_TIMEOUT_MS)
+        query = spec['query'].format(watermark=watermark).replace(
+            'SELECT', f"SELECT /*+ MAX_EXECUTION_TIME({EXPORT_STATEMENT_TIMEOUT_MS}) */", 1)
+        cursor.execute(query, params)
+
+        current = None
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                if current is None or row['id'] != current['id']:
+                    if current is not None:
+                        yield current
+                    current = {column: row[column] for column in spec['columns']}
+                    current['documents'] = []
+                if row['document_type']:
+                    current['documents'].append({
+                        'document_type': row['document_type'],
+                        'file_path': row['file_path']
+                    })
+        if current is not None:
+            yield current
+    finally:
+        cursor.close()
+        conn.close()
+
+def iter_all_shards(source, since=None, batch_size=1000):
+    """iter_records() on every shard, merged by (updated_at, id); one open cursor per shard"""
+    streams = [iter_records(shards.read_connection(shard), source, since, batch_size)
+               for shard in range(shards.count())]
+    try:
+        if len(streams) == 1:
+            yield from streams[0]
+        else:
+            yield from heapq.merge(*streams, key=lambda record: (record['updated_at'], record['id']))
+    finally:
+        for stream in streams:
+            stream.close()
+
+def _export_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+def _flat_record(record, columns):
+    row = [_export_value(record[column]) for column in columns]
+    row.append(';'.join(f"{doc['document_type']}:{doc['file_path']}"
+                        for doc in record['documents']))
+    return row
+
+def _batched(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def stream_csv(records, source, batch_size=1000):
+    columns = EXPORT_SOURCES[source]['columns']
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns + ['documents'])
+    for batch in _batched(records, batch_size):
+        writer.writerows(_flat_record(record, columns) for record in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def stream_ndjson(records, source, batch_size=1000):
+    for batch in _batched(records, batch_size):
+        yield ''.join(json.dumps(record, default=_export_value) + '\n' for record in batch)
+
+class _StreamSink:
+    """Write-only file object whose contents are drained after every write burst"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_parquet(records, source, batch_size=1000):
+    """Write one Parquet row group per batch and yield the bytes as they are produced"""
+    pa = pyarrow.get()
+    if pa is None:
+        raise RuntimeError('Parquet export requires pyarrow to be installed')
+
+    columns = EXPORT_SOURCES[source]['columns']
+    schema = pa.schema([(column, pa.int64() if column == 'id' else pa.string())
+                        for column in columns] + [('documents', pa.string())])
+    sink = _StreamSink()
+    writer = pa.parquet.ParquetWriter(sink, schema)
+    try:
+        for batch in _batched(records, batch_size):
+            rows = [_flat_record(record, columns) for record in batch]
+            arrays = [pa.array([None if row[i] is None else
+                                (row[i] if field.name == 'id' else str(row[i]))
+                                for row in rows], type=field.type)
+                      for i, field in enumerate(schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+def stream_photo_tar(records, source, upload_root='.'):
+    """
+    Stream a tar archive with each record's card photo and a record.json.
+
+    The archive is written in stream mode ('w|'), so at most one photo is
+    held in memory at a time.
+    """
+    number_column = EXPORT_SOURCES[source]['number_column']
+    sink = _StreamSink()
+    tar = tarfile.open(fileobj=sink, mode='w|')
+    try:
+        for record in records:
+            folder = record[number_column]
+            payload = json.dumps(record, default=_export_value).encode('utf-8')
+            info = tarfile.TarInfo(f"{folder}/record.json")
+            info.size = len(payload)
+            tar.addfile(info, io.BytesIO(payload))
+
+            for doc in record['documents']:
+                if doc['document_type'] not in PHOTO_DOCUMENT_TYPES:
+                    continue
+                file_path = os.path.join(upload_root, doc['file_path'])
+                if not os.path.isfile(file_path):
+                    print(f"Export: photo missing on disk: {file_path}")
+                    continue
+                info = tar.gettarinfo(file_path, f"{folder}/{os.path.basename(file_path)}")
+                with open(file_path, 'rb') as photo:
+                    tar.addfile(info, photo)
+            yield sink.drain()
+    finally:
+        tar.close()
+    yield sink.drain()
+
+EXPORT_WRITERS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+    'parquet': stream_parquet,
+}
@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""
+Administrative geography reference index: canonical spelling and
+validation of the place fields of a submission, and autocomplete.
+
+geography.csv lists the county / constituency / ward / location /
+sub-location hierarchy. `build` compiles it into geography.idx, a
+read-only binary file that every worker maps with mmap: the pages live
+once in the OS page cache however many workers there are, and opening it
+costs no parsing. The file holds
+  - a node table, one fixed-size record per place, numbered level by level
+    so the children of a place are consecutive and sorted by key
+  - a hash table of (parent node, normalized name) -> node, including the
+    alternative spellings, so a lookup is one crc32 and usually one probe
+  - per level, the node ids sorted by key, for prefix search across parents
+  - one pool of the UTF-8 names and keys the records point into
+Keys are normalized: lowercase, accents and apostrophes dropped,
+punctuation to spaces, trailing level words ("County", "Ward", ...)
+removed, so "MURANG'A county" and "Muranga" are the same key.
+
+The form's fields map onto the hierarchy: districtOfBirth and homeDistrict
+are counties, constituency sits under homeDistrict, division is the ward
+of that constituency, then location and subLocation. normalize_form()
+replaces each field it recognizes with its canonical name. A name that is
+not in the reference data is kept as typed, unless GEOGRAPHY_STRICT=1 and
+the data lists the places under that parent, in which case the submission
+is rejected with suggestions.
+
+The index is rebuilt automatically when geography.csv is newer.
+
+Run this script from terminal:
+    python geography.py build [source.csv] [index]   # compile the reference data
+    python geography.py lookup <field> <name> [homeDistrict] ...   # resolve one value
+    python geography.py check                        # self-check on a temporary index
+    python geography.py bench [places]               # lookup/prefix speed and memory vs a dict
+"""
+
+import csv
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import unicodedata
+import zlib
+
+from startup import Lazy
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_PATH = os.environ.get('GEOGRAPHY_SOURCE', os.path.join(BASE_DIR, 'geography.csv'))
+INDEX_PATH = os.environ.get('GEOGRAPHY_INDEX', os.path.join(BASE_DIR, 'geography.idx'))
+STRICT = os.environ.get('GEOGRAPHY_STRICT') == '1'
+SUGGESTION_LIMIT = 10
+
+LEVELS = ('county', 'constituency', 'ward', 'location', 'sub_location')
+
+# Form field -> (level, field holding its parent place)
+FORM_FIELDS = {
+    'districtOfBirth': ('county', None),
+    'homeDistrict': ('county', None),
+    'constituency': ('constituency', 'homeDistrict'),
+    'division': ('ward', 'constituency'),
+    'location': ('location', 'division'),
+    'subLocation': ('sub_location', 'location'),
+}
+
+ROOT = 0  # node 0 is the country; counties are its children
+
+MAGIC = b'KGEO'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIIIIII' + 'II' * len(LEVELS))
+# parent, first child, child count, name offset, key offset, name length, key length, level
+NODE = struct.Struct('<IIIIIHHB3x')
+# parent, key offset, node, key length
+ENTRY = struct.Struct('<IIIH2x')
+SLOT = struct.Struct('<I')  # entry index + 1; 0 is an empty slot
+
+_LEVEL_WORDS = {'county', 'district', 'constituency', 'ward', 'division', 'location',
+                'sublocation', 'sub'}
+
+class GeographyError(ValueError):
+    """A place name the reference data does not list under its parent"""
+
+    def __init__(self, field, value, suggestions):
+        super().__init__(f'Unknown {field} "{value}"')
+        self.field = field
+        self.suggestions = suggestions
+
+def normalize_key(text):
+    """Comparison key of a place name"""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode('ascii')
+    text = text.lower().replace("'", '').replace('`', '')
+    words = ''.join(ch if ch.isalnum() else ' ' for ch in text).split()
+    while len(words) > 1 and words[-1] in _LEVEL_WORDS:
+        words.pop()
+    return ' '.join(words)
+
+def _hash(parent, key):
+    return zlib.crc32(key, parent)
+
+# --- build ---
+
+def read_source(path):
+    """Tree of the source CSV: {key: [name, aliases, children]} from the top level down"""
+    tree = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = csv.DictReader(line for line in f if line.strip() and not line.startswith('#'))
+        for row in rows:
+            level = tree
+            for column in LEVELS:
+                cell = (row.get(column) or '').strip()
+                if not cell:
+                    break
+                name, *aliases = [part.strip() for part in cell.split('|') if part.strip()]
+                node = level.setdefault(normalize_key(name), [name, set(), {}])
+                node[1].update(aliases)
+                level = node[2]
+    return tree
+
+def build(tree, path):
+    """Write the index file for a read_source() tree; replaces `path` atomically"""
+    pool = bytearray()
+    pooled = {}
+
+    def intern(text):
+        data = text.encode('utf-8')
+        if data not in pooled:
+            pooled[data] = len(pool)
+            pool.extend(data)
+        return pooled[data], len(data)
+
+    # Number the nodes level by level, each parent's children sorted by key
+    nodes = [(ROOT, 0, '', '')]  # parent, level, name, key
+    aliases = {}
+    frontier = [(ROOT, tree)]
+    child_ranges = {}
+    for level in range(len(LEVELS)):
+        next_frontier = []
+        for parent, children in frontier:
+            child_ranges[parent] = (len(nodes), len(children))
+            for key in sorted(children):
+                name, alternatives, grandchildren = children[key]
+                aliases[len(nodes)] = alternatives
+                next_frontier.append((len(nodes), grandchildren))
+                nodes.append((parent, level, name, key))
+        frontier = next_frontier
+
+    node_records = bytearray()
+    entries = []
+    by_level = [[] for _ in LEVELS]
+    for node_id, (parent, level, name, key) in enumerate(nodes):
+        first_child, child_count = child_ranges.get(node_id, (0, 0))
+        name_offset, name_length = intern(name)
+        key_offset, key_length = intern(key)
+        node_records += NODE.pack(parent, first_child, child_count, name_offset, key_offset,
+                                  name_length, key_length, level)
+        if node_id == ROOT:
+            continue
+        by_level[level].append((key, node_id))
+        keys = {key} | {normalize_key(alias) for alias in aliases.get(node_id, ())}
+        for alias_key in sorted(keys):
+            offset, length = intern(alias_key)
+            entries.append((parent, offset, length, node_id))
+
+    slot_count = 1
+    while slot_count < len(entries) * 2:
+        slot_count *= 2
+    slots = [0] * slot_count
+    for index, (parent, offset, length, node_id) in enumerate(entries):
+        slot = _hash(parent, bytes(pool[offset:offset + length])) & (slot_count - 1)
+        while slots[slot]:
+            existing = entries[slots[slot] - 1]
+            if existing[0] == parent and pool[existing[1]:existing[1] + existing[2]] == pool[offset:offset + length]:
+                break  # the same spelling twice under one parent: first one wins
+            slot = (slot + 1) & (slot_count - 1)
+        else:
+            slots[slot] = index + 1
+
+    entry_records = b''.join(ENTRY.pack(parent, offset, node_id, length)
+                             for parent, offset, length, node_id in entries)
+    slot_records = b''.join(SLOT.pack(slot) for slot in slots)
+    level_records = [b''.join(SLOT.pack(node_id) for _, node_id in sorted(ids)) for ids in by_level]
+
+    nodes_offset = HEADER.size
+    entries_offset = nodes_offset + len(node_records)
+    slots_offset = entries_offset + len(entry_records)
+    levels = []
+    offset = slots_offset + len(slot_records)
+    for records in level_records:
+        levels += [offset, len(records) // SLOT.size]
+        offset += len(records)
+    strings_offset = offset
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(nodes), len(entries), slot_count,
+                            nodes_offset, entries_offset, slots_offset, strings_offset, *levels))
+        f.write(node_records)
+        f.write(entry_records)
+        f.write(slot_records)
+        for records in level_records:
+            f.write(records)
+        f.write(pool)
+    os.replace(tmp_path, path)  # workers that already mapped the old file keep it until they reopen
+    return {'places': len(nodes) - 1, 'spellings': len(entries), 'bytes': os.path.getsize(path)}
+
+# --- lookups on the mapped file ---
+
+class GeographyIndex:
+    """Read-only view of an index file through one shared mmap"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self._map, 0)
+        if header[0] != MAGIC or header[1] != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} geography index')
+        (_, _, self.node_count, self.entry_count, self.slot_count, self._nodes,
+         self._entries, self._slots, self._strings) = header[:9]
+        self._levels = [(header[9 + 2 * i], header[10 + 2 * i]) for i in range(len(LEVELS))]
+        self.file = path
+
+    def close(self):
+        self._map.close()
+
+    def _node(self, node_id):
+        return NODE.unpack_from(self._map, self._nodes + node_id * NODE.size)
+
+    def _string(self, offset, length):
+        start = self._strings + offset
+        return self._map[start:start + length]
+
+    def _key(self, node_id):
+        record = self._node(node_id)
+        return self._string(record[4], record[6])
+
+    def name(self, node_id):
+        record = self._node(node_id)
+        return self._string(record[3], record[5]).decode('utf-8')
+
+    def parent(self, node_id):
+        return self._node(node_id)[0]
+
+    def level(self, node_id):
+        return LEVELS[self._node(node_id)[7]]
+
+    def child_count(self, node_id):
+        return self._node(node_id)[2]
+
+    def path(self, node_id):
+        """Names from the county down to this place"""
+        names = []
+        while node_id != ROOT:
+            names.append(self.name(node_id))
+            node_id = self.parent(node_id)
+        return names[::-1]
+
+    def lookup(self, parent, text):
+        """Node of `text` (any listed spelling) among the children of `parent`, or None"""
+        key = normalize_key(text).encode('utf-8')
+        if not key:
+            return None
+        mask = self.slot_count - 1
+        slot = _hash(parent, key) & mask
+        while True:
+            index = SLOT.unpack_from(self._map, self._slots + slot * SLOT.size)[0]
+            if not index:
+                return None
+            entry_parent, offset, node_id, length = ENTRY.unpack_from(
+                self._map, self._entries + (index - 1) * ENTRY.size)
+            if entry_parent == parent and self._string(offset, length) == key:
+                return node_id
+            slot = (slot + 1) & mask
+
+    def _prefix_range(self, node_at, count, prefix, limit):
+        # node_at(i) for i < count is sorted by key; the first `limit` whose keys start with prefix
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(node_at(mid)) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        end = lo
+        while end < min(count, lo + limit) and self._key(node_at(end)).startswith(prefix):
+            end += 1
+        return lo, end
+
+    def children(self, parent, prefix='', limit=SUGGESTION_LIMIT):
+        """Child nodes of `parent` whose key starts with the normalized prefix, in key order"""
+        _, first, count = self._node(parent)[:3]
+        lo, end = self._prefix_range(lambda i: first + i, count,
+                                     normalize_key(prefix).encode('utf-8'), limit)
+        return list(range(first + lo, first + end))
+
+    def at_level(self, level, prefix='', limit=SUGGESTION_LIMIT):
+        """Nodes of a level under any parent whose key starts with the normalized prefix"""
+        offset, count = self._levels[LEVELS.index(level)]
+
+        def node_at(i):
+            return SLOT.unpack_from(self._map, offset + i * SLOT.size)[0]
+
+        lo, end = self._prefix_range(node_at, count, normalize_key(prefix).encode('utf-8'), limit)
+        return [node_at(i) for i in range(lo, end)]
+
+    def suggest(self, parent, text, limit=SUGGESTION_LIMIT):
+        """Canonical names close to `text` under `parent`: same prefix, shortened until something matches"""
+        key = normalize_key(text)
+        for length in range(min(len(key), 4), -1, -1):
+            found = self.children(parent, key[:length], limit)
+            if found:
+                return [self.name(node_id) for node_id in found]
+        return []
+
+def _open_index():
+    if not os.path.exists(INDEX_PATH) or (
+            os.path.exists(SOURCE_PATH) and os.path.getmtime(SOURCE_PATH) > os.path.getmtime(INDEX_PATH)):
+        if not os.path.exists(SOURCE_PATH):
+            return None  # no reference data: place fields are stored as typed
+        build(read_source(SOURCE_PATH), INDEX_PATH)
+    return GeographyIndex(INDEX_PATH)
+
+index = Lazy('geography', _open_index)
+
+def available():
+    return index.get() is not None
+
+# --- the submission form ---
+
+def resolve(data, field):
+    """Node of a form field, resolving its parent fields first; None when any of them is unknown"""
+    level, parent_field = FORM_FIELDS[field]
+    parent = ROOT if parent_field is None else resolve(data, parent_field)
+    if parent is None or not data.get(field):
+        return None
+    return index.get().lookup(parent, data[field])
+
+def normalize_form(data, strict=None):
+    """
+    Replace the place fields of a submission with their canonical names, in
+    place. Raises GeographyError for an unknown name only in strict mode,
+    and only when the reference data lists the places under its parent.
+    """
+    geo = index.get()
+    if geo is None:
+        return data
+    strict = STRICT if strict is None else strict
+    resolved = {None: ROOT}
+    for field, (_, parent_field) in FORM_FIELDS.items():
+        parent = resolved.get(parent_field)
+        value = data.get(field)
+        resolved[field] = None
+        if parent is None or not value:
+            continue
+        node_id = geo.lookup(parent, value)
+        if node_id is None:
+            if strict and geo.child_count(parent):
+                raise GeographyError(field, value, geo.suggest(parent, value))
+            continue
+        data[field] = geo.name(node_id)
+        resolved[field] = node_id
+    return data
+
+def autocomplete(field, prefix, context=None, limit=SUGGESTION_LIMIT):
+    """
+    Suggestions for a form field as [{'name', 'path'}]. `context` holds the
+    parent fields already filled in; without a recognized parent the whole
+    level is searched and `path` tells same-named places apart.
+    """
+    if field not in FORM_FIELDS:
+        raise ValueError(f'field must be one of {", ".join(FORM_FIELDS)}')
+    geo = index.get()
+    if geo is None:
+        return []
+    level, parent_field = FORM_FIELDS[field]
+    parent = ROOT if parent_field is None else resolve(context or {}, parent_field)
+    if parent is not None:
+        found = geo.children(parent, prefix, limit)
+    else:
+        found = geo.at_level(level, prefix, limit)
+    return [{'name': geo.name(node_id), 'path': geo.path(node_id)[:-1]} for node_id in found]
+
+# --- self-check and benchmark ---
+
+def _synthetic_tree(places):
+    """About `places` places, 47 counties wide and 6 deep below each"""
+    tree = {}
+    fanout = max(2, round((places / 47) ** (1 / 4)))
+    for c in range(47):
+        county = tree.setdefault(f"county {c}", [f"County {c}", set(), {}])[2]
+        for k in range(fanout):
+            constituency = county.setdefault(f"constituency {c} {k}",
+                                             [f"Constituency {c} {k}", set(), {}])[2]
+            for w in range(fanout):
+                ward = constituency.setdefault(f"ward {c} {k} {w}", [f"Ward {c} {k} {w}", set(), {}])[2]
+                for l in range(fanout):
+                    location = ward.setdefault(f"kata {c} {k} {w} {l}",
+                                               [f"Kata {c} {k} {w} {l}", set(), {}])[2]
+                    for s in range(fanout):
+                        location[f"mtaa {c} {k} {w} {l} {s}"] = [f"Mtaa {c} {k} {w} {l} {s}", set(), {}]
+    return tree
+
+def self_check():
+    """Build a small index and exercise lookups, aliases, prefixes and strict validation"""
+    global index
+    tree = {
+        normalize_key("Murang'a"): ["Murang'a", {'Muranga'}, {
+            'kandara': ['Kandara', set(), {
+                'ithiru': ['Ithiru', {'Ithiru Ward'}, {}],
+                'ruchu': ['Ruchu', set(), {}],
+            }],
+            'kangema': ['Kangema', set(), {}],
+        }],
+        'nairobi': ['Nairobi', {'Nairobi City'}, {'kibra': ['Kibra', {'Kibera'}, {}]}],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'check.idx')
+        stats = build(tree, path)
+        assert stats['places'] == 7, stats
+        geo = GeographyIndex(path)
+        saved, index = index, Lazy('geography', lambda: geo)
+        try:
+            county = geo.lookup(ROOT, ' MURANGA  county ')
+            assert geo.name(county) == "Murang'a"
+            assert geo.name(geo.lookup(ROOT, 'nairobi city')) == 'Nairobi'
+            assert geo.lookup(ROOT, 'Kandara') is None  # only under its county
+            assert [geo.name(n) for n in geo.children(county, 'kan')] == ['Kandara', 'Kangema']
+            assert [geo.name(n) for n in geo.at_level('ward', 'R')] == ['Ruchu']
+
+            form = {'districtOfBirth': 'nairobi', 'homeDistrict': 'muranga', 'constituency': 'KANDARA',
+                    'division': 'ithiru ward', 'location': 'Gaichanjiru', 'subLocation': 'Kiranga'}
+            normalize_form(form, strict=True)
+            assert form == {'districtOfBirth': 'Nairobi', 'homeDistrict': "Murang'a",
+                            'constituency': 'Kandara', 'division': 'Ithiru',
+                            'location': 'Gaichanjiru', 'subLocation': 'Kiranga'}, form
+            try:
+                normalize_form({'homeDistrict': 'Muranga', 'constituency': 'Kandra'}, strict=True)
+                raise AssertionError('unknown constituency accepted in strict mode')
+            except GeographyError as e:
+                assert e.field == 'constituency' and e.suggestions == ['Kandara'], e.suggestions
+            lenient = normalize_form({'homeDistrict': 'Muranga', 'constituency': 'Kandra'}, strict=False)
+            assert lenient['constituency'] == 'Kandra'
+
+            suggestions = autocomplete('division', 'r', {'homeDistrict': 'muranga', 'constituency': 'kandara'})
+            assert suggestions == [{'name': 'Ruchu', 'path': ["Murang'a", 'Kandara']}], suggestions
+        finally:
+            index = saved
+            geo.close()
+    return stats
+
+def _as_dicts(tree):
+    """Per-process alternative the mmap replaces: nested dicts of canonical names by key"""
+    return {key: (name, _as_dicts(children)) for key, (name, _, children) in tree.items()}
+
+def benchmark(places=100000, rounds=200000):
+    """Lookup and prefix latency on a synthetic index, and its heap cost against nested dicts"""
+    import tracemalloc
+    tree = _synthetic_tree(places)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.idx')
+        stats = build(tree, path)
+
+        tracemalloc.start()
+        geo = GeographyIndex(path)
+        mapped_heap = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        as_dicts = _as_dicts(tree)
+        dict_heap = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del as_dicts
+
+        county = geo.lookup(ROOT, 'County 23')
+        constituency = geo.lookup(county, 'constituency 23 1')
+        names = [f"ward 23 1 {w % 3}" for w in range(rounds)]
+        started = time.perf_counter()
+        for name in names:
+            geo.lookup(constituency, name)
+        lookup_us = (time.perf_counter() - started) / rounds * 1e6
+
+        prefixes = ['kata', 'kata 1', 'kata 23 1', 'kata 46 2 2'] * (rounds // 40)
+        started = time.perf_counter()
+        for prefix in prefixes:
+            geo.at_level('location', prefix)
+        prefix_us = (time.perf_counter() - started) / len(prefixes) * 1e6
+        geo.close()
+    return {**stats, 'lookup_us': lookup_us, 'prefix_us': prefix_us,
+            'mapped_heap_bytes': mapped_heap, 'dict_heap_bytes': dict_heap}
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        if command == "build":
+            source = sys.argv[2] if len(sys.argv) > 2 else SOURCE_PATH
+            target = sys.argv[3] if len(sys.argv) > 3 else INDEX_PATH
+            print(build(read_source(source), target))
+        elif command == "lookup" and len(sys.argv) > 3:
+            field = sys.argv[2]
+            context = dict(zip(['homeDistrict', 'constituency', 'division', 'location'], sys.argv[4:]))
+            context[field] = sys.argv[3]
+            try:
+                print(normalize_form(context, strict=True))
+            except GeographyError as e:
+                print(f"{e}; did you mean: {', '.join(e.suggestions) or 'nothing close'}")
+        elif command == "check":
+            print(f"OK: {self_check()}")
+        elif command == "bench":
+            places = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+            result = benchmark(places)
+            print(f"{result['places']} places, {result['spellings']} spellings, "
+                  f"index file {result['bytes'] / 1024:.0f} KiB")
+            print(f"lookup {result['lookup_us']:.2f}us | prefix {result['prefix_us']:.2f}us")
+            print(f"heap per worker: mmap {result['mapped_heap_bytes'] / 1024:.0f} KiB | "
+                  f"nested dicts {result['dict_heap_bytes'] / 1024 / 1024:.1f} MiB")
+        else:
+            print(__doc__)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
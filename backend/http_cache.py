@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Response compression and conditional GETs for the dashboard endpoints.
+
+Compression: JSON/text responses above MIN_COMPRESS_SIZE are compressed
+with brotli (when installed and accepted) or gzip, chosen from the
+client's Accept-Encoding.
+
+Conditional GETs: @conditional(fingerprint) derives a weak ETag from a
+cheap aggregate such as COUNT(*) + MAX(updated_at) instead of hashing the
+body. When If-None-Match matches, a 304 is returned and the real query
+never runs. updated_at has one-second resolution, so no ETag is issued
+while the newest change is less than a second old by the database's own
+clock (NOW() on the probing connection); otherwise two writes in the same
+second could share an ETag. Routes therefore stamp updated_at with the
+database's NOW() too, never the app server's clock. Fingerprints run on
+every application shard (shards.py) unless the route names the shards it
+reads.
+
+Run this script from terminal for bandwidth/latency numbers:
+    python http_cache.py bench                               # payload size and compression cost
+    python http_cache.py bench-conditional [path] [rounds]   # 200 vs 304 latency (needs the database)
+"""
+
+import gzip
+import hashlib
+import json
+import statistics
+import sys
+import time
+from datetime import timedelta
+from functools import wraps
+
+import mysql.connector
+from flask import request, make_response
+
+import shards
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_TYPES = ('application/json', 'text/csv', 'text/plain', 'application/x-ndjson')
+
+def choose_encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+def init_app(app):
+    """Compress eligible responses after every request"""
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None or response.content_length is None \
+                or response.content_length < MIN_COMPRESS_SIZE:
+            return response
+
+        response.set_data(compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+def conditional(fingerprint, shards_for=None):
+    """
+    Route decorator: answer If-None-Match from fingerprint(cursor, **view_kwargs).
+
+    fingerprint returns a list of (count, max_timestamp) pairs; any change
+    to the underlying rows must change at least one of them. It runs on the
+    shards returned by shards_for(**view_kwargs), or on all of them.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            def probe(conn, shard):
+                cursor = conn.cursor()
+                try:
+                    # The server's clock, read before the stamps and in the same session time
+                    # zone as the TIMESTAMP values they return
+                    cursor.execute("SELECT NOW()")
+                    now = cursor.fetchone()[0]
+                    parts = fingerprint(cursor, **kwargs)
+                    recent = any(stamp is not None and stamp >= now - timedelta(seconds=1)
+                                 for _, stamp in parts)
+                    return parts, recent
+                finally:
+                    cursor.close()
+            used = shards_for(**kwargs) if shards_for else None
+            try:
+                probes = shards.scatter(probe, used)
+            except mysql.connector.Error:
+                # No ETag this time; the view reports the database error in its own format
+                return view(*args, **kwargs)
+            if any(recent for _, recent in probes):
+                return view(*args, **kwargs)
+            parts = [part for shard_parts, _ in probes for part in shard_parts]
+
+            digest = hashlib.sha1(f"{request.full_path}|{parts!r}".encode('utf-8')).hexdigest()[:24]
+            if request.if_none_match.contains_weak(digest):
+                response = make_response('', 304)
+                # Same Vary as the 200 it stands for (compress_response skips 304s)
+                response.vary.add('Accept-Encoding')
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(digest, weak=True)
+            return response
+        return wrapper
+    return decorator
+
+def _table_stamp(cursor, query, params=()):
+    cursor.execute(query, params)
+    count, newest = cursor.fetchone()
+    return (count, newest)
+
+def all_applications_fingerprint(cursor):
+    return [
+        _table_stamp(cursor, "SELECT COUNT(*), MAX(updated_at) FROM applications"),
+        _table_stamp(cursor, "SELECT COUNT(*), MAX(updated_at) FROM lost_id_applications"),
+        _table_stamp(cursor, "SELECT COUNT(*), MAX(updated_at) FROM officers"),
+        _table_stamp(cursor, "SELECT COUNT(*), MAX(updated_at) FROM citizens"),
+    ]
+
+def on_primary(**view_kwargs):
+    # Officers and admins are written on shard 0 first
+    return [0]
+
+def on_application_shard(application_id):
+    return [shards.shard_for_id(application_id)]
+
+def officers_fingerprint(cursor):
+    return [_table_stamp(cursor, "SELECT COUNT(*), MAX(updated_at) FROM officers")]
+
+def officer_applications_fingerprint(cursor):
+    officer_id = request.args.get('officer_id', 1)
+    return [
+        _table_stamp(cursor, "SELECT COUNT(*), MAX(updated_at) FROM applications WHERE officer_id = %s",
+                     (officer_id,)),
+        _table_stamp(cursor, "SELECT COUNT(*), MAX(updated_at) FROM lost_id_applications WHERE officer_id = %s",
+                     (officer_id,)),
+        _table_stamp(cursor, "SELECT COUNT(*), MAX(updated_at) FROM citizens"),
+    ]
+
+def application_details_fingerprint(cursor, application_id):
+    return [
+        _table_stamp(cursor, "SELECT COUNT(*), MAX(updated_at) FROM applications WHERE id = %s",
+                     (application_id,)),
+        _table_stamp(cursor, "SELECT COUNT(*), MAX(uploaded_at) FROM documents WHERE application_id = %s",
+                     (application_id,)),
+        _table_stamp(cursor, """
+            SELECT COUNT(*), MAX(o.updated_at) FROM applications a
+            JOIN officers o ON a.officer_id = o.id WHERE a.id = %s
+        """, (application_id,)),
+    ]
+
+def benchmark(rows=5000, rounds=20):
+    """Payload size and compression cost for an admin listing of `rows` applications"""
+    payload = json.dumps({'applications': [{
+        'id': i, 'application_number': f"APP2024{i:06d}", 'full_names': f"Applicant Number {i}",
+        'status': 'submitted', 'application_type': 'new', 'officer_name': 'Field Officer',
+        'created_at': 'Mon, 01 Jan 2024 10:00:00 GMT', 'updated_at': 'Mon, 01 Jan 2024 10:00:00 GMT',
+        'source_type': 'regular'
+    } for i in range(rows)]}).encode('utf-8')
+
+    results = {'identity': {'bytes': len(payload), 'ms': 0.0}}
+    for encoding in ('gzip', 'br'):
+        if encoding == 'br' and brotli is None:
+            continue
+        started = time.perf_counter()
+        for _ in range(rounds):
+            compressed = compress(payload, encoding)
+        results[encoding] = {'bytes': len(compressed),
+                             'ms': (time.perf_counter() - started) / rounds * 1000}
+    return results
+
+def conditional_benchmark(path='/api/admin/applications', rounds=50):
+    """
+    Latency of full 200 answers vs 304 revalidations of one conditional
+    route, through the Flask test client against the configured database.
+    Requests alternate between the two, so drift affects both alike.
+    """
+    from app import create_app
+    client = create_app('admin').test_client()
+    headers = {'Accept-Encoding': 'gzip'}
+    first = client.get(path, headers=headers)
+    if first.status_code == 200 and not first.headers.get('ETag'):
+        time.sleep(1.1)  # the newest change was under a second old; no ETag is issued then
+        first = client.get(path, headers=headers)
+    etag = first.headers.get('ETag')
+    if first.status_code != 200 or not etag:
+        raise RuntimeError(f"{path} answered {first.status_code} without an ETag")
+
+    timings = {200: [], 304: []}
+    sizes = {200: 0, 304: 0}
+    for _ in range(rounds):
+        for revalidate in (False, True):
+            started = time.perf_counter()
+            response = client.get(path, headers={**headers, 'If-None-Match': etag} if revalidate else headers)
+            elapsed = (time.perf_counter() - started) * 1000
+            timings.setdefault(response.status_code, []).append(elapsed)
+            sizes[response.status_code] = len(response.get_data())
+    return {code: {'requests': len(values), 'median_ms': statistics.median(values),
+                   'p90_ms': sorted(values)[int(len(values) * 0.9) - 1] if values else 0.0,
+                   'bytes': sizes.get(code, 0)}
+            for code, values in timings.items() if values}
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "bench":
+        for encoding, stats in benchmark().items():
+            print(f"{encoding:>8}: {stats['bytes']:>9} bytes | {stats['ms']:.2f} ms to compress")
+        print("A 304 costs one COUNT/MAX probe per table and sends no body.")
+    elif command == "bench-conditional":
+        try:
+            results = conditional_benchmark(sys.argv[2] if len(sys.argv) > 2 else '/api/admin/applications',
+                                            int(sys.argv[3]) if len(sys.argv) > 3 else 50)
+        except Exception as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        for code, stats in sorted(results.items()):
+            print(f"{code}: {stats['requests']} requests | median {stats['median_ms']:.2f} ms | "
+                  f"p90 {stats['p90_ms']:.2f} ms | {stats['bytes']} bytes")
+    else:
+        print(__doc__)
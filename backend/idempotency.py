@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Idempotency keys for submission routes.
+
+Clients send an Idempotency-Key header (one per form fill, reused on every
+retry). The first request with a key claims it by inserting a row into
+idempotency_keys; the primary key makes that claim atomic, so concurrent
+retries cannot both run the handler. Once the handler succeeds, its
+response is stored with the key and replayed for later retries until the
+key expires, without re-running the inserts or file writes. Any other
+response releases the key, so a form fixed after a validation error can be
+resubmitted with the same key.
+
+Run this script from terminal:
+    python idempotency.py purge        # delete expired keys
+    python idempotency.py check [n]    # n concurrent requests with one key (needs the database)
+"""
+
+import hashlib
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+
+import mysql.connector
+from flask import request, jsonify, make_response, Response
+
+from db import get_db_connection
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 64
+KEY_TTL = timedelta(hours=24)
+# An in-progress claim older than this is assumed abandoned (worker crash) and can be taken over
+IN_PROGRESS_TIMEOUT = timedelta(minutes=5)
+# Fraction of keyed requests that also purge a batch of expired keys
+PURGE_PROBABILITY = 0.01
+
+def _request_fingerprint():
+    """Hash of the route and request body, to catch a key reused for a different request"""
+    digest = hashlib.sha256(request.path.encode('utf-8'))
+    if request.mimetype not in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+        digest.update(request.get_data())
+    else:
+        for name, value in sorted(request.form.items(multi=True)):
+            digest.update(f"{name}={value}\n".encode('utf-8'))
+        for name, upload in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+            digest.update(f"{name}:{upload.filename}\n".encode('utf-8'))
+    return digest.digest()
+
+def _claim(cursor, key, fingerprint):
+    """
+    Try to claim the key. Returns None if this request now owns it,
+    otherwise the existing row.
+    """
+    now = datetime.now()
+    try:
+        cursor.execute("""
+            INSERT INTO idempotency_keys (idem_key, route, request_hash, status, created_at, expires_at)
+            VALUES (%s, %s, %s, 'in_progress', %s, %s)
+        """, (key, request.path, fingerprint, now, now + KEY_TTL))
+        return None
+    except mysql.connector.IntegrityError:
+        pass
+
+    # Take over expired keys and abandoned claims; the WHERE clause keeps this atomic
+    cursor.execute("""
+        UPDATE idempotency_keys
+        SET route = %s, request_hash = %s, status = 'in_progress',
+            response_code = NULL, response_body = NULL, created_at = %s, expires_at = %s
+        WHERE idem_key = %s
+          AND (expires_at < %s OR (status = 'in_progress' AND created_at < %s))
+    """, (request.path, fingerprint, now, now + KEY_TTL, key, now, now - IN_PROGRESS_TIMEOUT))
+    if cursor.rowcount == 1:
+        return None
+
+    cursor.execute("""
+        SELECT route, request_hash, status, response_code, response_body
+        FROM idempotency_keys WHERE idem_key = %s
+    """, (key,))
+    return cursor.fetchone()
+
+def purge_expired(cursor, batch_size=1000):
+    cursor.execute("DELETE FROM idempotency_keys WHERE expires_at < %s LIMIT %s",
+                   (datetime.now(), batch_size))
+    return cursor.rowcount
+
+def idempotent(view):
+    """Route decorator: replay the stored response for a repeated Idempotency-Key"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+        fingerprint = _request_fingerprint()
+
+        conn = get_db_connection()
+        conn.autocommit = True  # the claim must be visible to concurrent retries immediately
+        cursor = conn.cursor(dictionary=True)
+        try:
+            existing = _claim(cursor, key, fingerprint)
+            if existing:
+                if existing['route'] != request.path or bytes(existing['request_hash']) != fingerprint:
+                    return jsonify({'error': f'{IDEMPOTENCY_HEADER} was already used for a different request'}), 422
+                if existing['status'] == 'in_progress':
+                    response = jsonify({'error': 'A request with this Idempotency-Key is still being processed'})
+                    response.headers['Retry-After'] = '1'
+                    return response, 409
+                response = Response(existing['response_body'], status=existing['response_code'],
+                                    mimetype='application/json')
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                cursor.execute("DELETE FROM idempotency_keys WHERE idem_key = %s", (key,))
+                raise
+
+            if not 200 <= response.status_code < 300:
+                # Nothing was committed; release the key so the client can fix the request or retry
+                cursor.execute("DELETE FROM idempotency_keys WHERE idem_key = %s", (key,))
+            else:
+                cursor.execute("""
+                    UPDATE idempotency_keys
+                    SET status = 'completed', response_code = %s, response_body = %s
+                    WHERE idem_key = %s
+                """, (response.status_code, response.get_data(as_text=True), key))
+
+            if random.random() < PURGE_PROBABILITY:
+                purge_expired(cursor)
+
+            return response
+        finally:
+            cursor.close()
+            conn.autocommit = False  # pooled connections keep session settings (see db.py)
+            conn.close()
+
+    return wrapper
+
+def concurrency_check(requests=8, handler_seconds=0.3):
+    """
+    Send `requests` concurrent POSTs with one Idempotency-Key to a test route
+    through the Flask test client, against the configured database. The
+    handler must run once: one 201, every other answer a replay of it or a
+    409 while it is still running. Returns (scenario, passed) pairs.
+    """
+    from flask import Flask
+
+    conn = get_db_connection()  # fails fast without a database, before any request is sent
+    app = Flask(__name__)
+    runs = []
+
+    @app.route('/api/idempotency-check', methods=['POST'])
+    @idempotent
+    def submit():
+        if not request.get_json().get('fullNames'):
+            return jsonify({'error': 'Missing required field: fullNames'}), 400
+        runs.append(threading.get_ident())
+        time.sleep(handler_seconds)  # keep the claim in progress while the others arrive
+        return jsonify({'message': 'created', 'run': len(runs)}), 201
+
+    key = f"check-{uuid.uuid4().hex}"
+    # A rejected submission must not hold the key: the corrected one follows with it
+    rejected = app.test_client().post('/api/idempotency-check', json={'fullNames': ''},
+                                      headers={IDEMPOTENCY_HEADER: key})
+    start = threading.Barrier(requests)
+    responses = [None] * requests
+
+    def send(index):
+        client = app.test_client()
+        start.wait()
+        responses[index] = client.post('/api/idempotency-check', json={'fullNames': 'Check Applicant'},
+                                       headers={IDEMPOTENCY_HEADER: key})
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    created = [r for r in responses if r.status_code == 201 and 'Idempotent-Replayed' not in r.headers]
+    replayed = [r for r in responses if r.status_code == 201 and 'Idempotent-Replayed' in r.headers]
+    in_progress = [r for r in responses if r.status_code == 409]
+    retry = app.test_client().post('/api/idempotency-check', json={'fullNames': 'Check Applicant'},
+                                   headers={IDEMPOTENCY_HEADER: key})
+    other_body = app.test_client().post('/api/idempotency-check', json={'fullNames': 'Someone Else'},
+                                        headers={IDEMPOTENCY_HEADER: key})
+
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM idempotency_keys WHERE idem_key = %s", (key,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    return [
+        ('a 400 releases the key for the corrected request', rejected.status_code == 400
+         and len(created) == 1),
+        (f'{requests} concurrent requests run the handler once', len(runs) == 1),
+        ('one 201, the rest replays or 409', len(created) == 1
+         and len(replayed) + len(in_progress) == requests - 1),
+        ('replays carry the original body', all(r.get_json() == created[0].get_json() for r in replayed)
+         if created else False),
+        ('a later retry is replayed', retry.status_code == 201 and 'Idempotent-Replayed' in retry.headers
+         and len(runs) == 1),
+        ('the key reused for another body is refused', other_body.status_code == 422),
+    ]
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        try:
+            results = concurrency_check(int(sys.argv[2]) if len(sys.argv) > 2 else 8)
+        except Exception as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        for scenario, passed in results:
+            print(f"{'ok  ' if passed else 'FAIL'}  {scenario}")
+        sys.exit(0 if all(passed for _, passed in results) else 1)
+    elif len(sys.argv) > 1 and sys.argv[1] == "purge":
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            total = 0
+            while True:
+                purged = purge_expired(cursor)
+                conn.commit()
+                total += purged
+                if purged == 0:
+                    break
+            cursor.close()
+            conn.close()
+            print(f"Purged {total} expired idempotency keys")
+        except Exception as e:
+            print(f"Error: {e}")
+    else:
+        print(__doc__)
@@ -0,0 +1,18 @@
+-- Idempotency keys for submission retries: run once on databases created before idempotency.py
+USE digital_id_system;
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    idem_key VARCHAR(64) PRIMARY KEY,
+    route VARCHAR(64) NOT NULL,
+    request_hash BINARY(32) NOT NULL,
+    status ENUM('in_progress', 'completed') NOT NULL,
+    response_code SMALLINT NULL,
+    response_body MEDIUMTEXT NULL,
+    created_at DATETIME NOT NULL,
+    expires_at DATETIME NOT NULL,
+    
+    INDEX idx_idempotency_keys_expires (expires_at)
+);
+
+-- Expired keys are purged by the API as it runs, or on demand:
+--   python idempotency.py purge
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Durable job queue in MySQL.
+
+enqueue() inserts a row into `jobs` with the caller's cursor, so a job
+commits or rolls back together with the change that caused it. Workers
+claim due jobs with SELECT ... FOR UPDATE SKIP LOCKED, which lets any
+number of them poll the same queue without blocking each other.
+
+Claiming a job pushes its run_at forward by the kind's visibility timeout.
+A worker that dies mid-job therefore leaves the job due again once the
+timeout passes, and another worker picks it up. Failed jobs are retried
+with exponential backoff plus jitter. After max_attempts they are
+dead-lettered (status 'dead') for inspection and manual retry, whether
+the last attempt failed or its worker died or timed out.
+
+Handlers are registered with @handler('kind') and receive (conn, payload).
+They run in their own transaction and must be idempotent, because a job
+whose worker died after the handler committed will run again.
+
+Each application shard (shards.py) has its own jobs table, and a job is
+enqueued on the shard of the row it is about. Every worker process polls
+all shards, spreading its threads across them.
+
+Run this script from terminal:
+    python jobs.py work [processes] [threads]   # run workers until interrupted
+    python jobs.py dead                         # list dead-lettered jobs
+    python jobs.py retry <job_id>               # requeue a dead job
+    python jobs.py purge [days]                 # delete finished jobs older than `days` (default 7)
+    python jobs.py bench [jobs] [threads]       # enqueue/claim throughput and latency
+"""
+
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+import shards
+from db import get_db_connection
+
+DEFAULT_QUEUE = 'default'
+CLAIM_BATCH = 10
+POLL_INTERVAL = 0.5        # seconds a worker sleeps when the queue is empty
+VISIBILITY_TIMEOUT = 300   # seconds before a claimed job is handed to another worker
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 5           # seconds; retry n waits about BACKOFF_BASE * 2**(n-1)
+BACKOFF_MAX = 3600
+
+HANDLERS = {}  # kind -> (function, options)
+
+def handler(kind, visibility_timeout=VISIBILITY_TIMEOUT, max_attempts=MAX_ATTEMPTS, concurrency=None):
+    """Register a job handler; concurrency caps how many of this kind one worker process runs at once"""
+    def decorator(fn):
+        HANDLERS[kind] = (fn, {
+            'visibility_timeout': visibility_timeout,
+            'max_attempts': max_attempts,
+            'semaphore': threading.BoundedSemaphore(concurrency) if concurrency else None,
+        })
+        return fn
+    return decorator
+
+def enqueue(cursor, kind, payload=None, queue=DEFAULT_QUEUE, delay=0):
+    """Queue a job inside the caller's transaction; it becomes visible when the caller commits"""
+    options = HANDLERS.get(kind, (None, {'max_attempts': MAX_ATTEMPTS}))[1]
+    cursor.execute("""
+        INSERT INTO jobs (queue, kind, payload, max_attempts, run_at)
+        VALUES (%s, %s, %s, %s, NOW(3) + INTERVAL %s SECOND)
+    """, (queue, kind, json.dumps(payload or {}), options['max_attempts'], delay))
+    return cursor.lastrowid
+
+def enqueue_many(cursor, kind, payloads, queue=DEFAULT_QUEUE):
+    options = HANDLERS.get(kind, (None, {'max_attempts': MAX_ATTEMPTS}))[1]
+    cursor.executemany("""
+        INSERT INTO jobs (queue, kind, payload, max_attempts, run_at)
+        VALUES (%s, %s, %s, %s, NOW(3))
+    """, [(queue, kind, json.dumps(payload), options['max_attempts']) for payload in payloads])
+
+def enqueue_once(cursor, kind, payload=None, queue=DEFAULT_QUEUE, delay=0):
+    """
+    Queue a job unless one of this kind is already waiting, so a burst of
+    triggers becomes one run. The check is a plain read and takes no locks;
+    a race can queue a second job, so the handler must tolerate that.
+    """
+    cursor.execute("""
+        SELECT id FROM jobs WHERE queue = %s AND status = 'queued' AND kind = %s LIMIT 1
+    """, (queue, kind))
+    if cursor.fetchall():
+        return None
+    return enqueue(cursor, kind, payload, queue, delay)
+
+def claim(conn, worker_id, queue=DEFAULT_QUEUE, limit=CLAIM_BATCH):
+    """Lock up to `limit` due jobs, mark them running and return them"""
+    cursor = conn.cursor(dictionary=True)
+    # A running job past its visibility timeout lost its worker. Once that was its
+    # last attempt it is dead-lettered here, since no handler error reached fail().
+    cursor.execute("""
+        SELECT id FROM jobs
+        WHERE queue = %s AND status = 'running' AND run_at <= NOW(3) AND attempts >= max_attempts
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    """, (queue, limit))
+    expired = [row['id'] for row in cursor.fetchall()]
+    if expired:
+        placeholders = ', '.join(['%s'] * len(expired))
+        cursor.execute(f"""
+            UPDATE jobs SET status = 'dead', finished_at = NOW(3),
+                last_error = 'Worker did not finish the job within its visibility timeout'
+            WHERE id IN ({placeholders})
+        """, expired)
+
+    cursor.execute("""
+        SELECT id, kind, payload, attempts, max_attempts, created_at
+        FROM jobs
+        WHERE queue = %s AND status IN ('queued', 'running') AND run_at <= NOW(3)
+          AND attempts < max_attempts
+        ORDER BY run_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    """, (queue, limit))
+    claimed = cursor.fetchall()
+
+    by_timeout = {}
+    for job in claimed:
+        options = HANDLERS.get(job['kind'], (None, {'visibility_timeout': VISIBILITY_TIMEOUT}))[1]
+        by_timeout.setdefault(options['visibility_timeout'], []).append(job['id'])
+        job['attempts'] += 1
+        job['payload'] = json.loads(job['payload'])
+    for timeout, ids in by_timeout.items():
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f"""
+            UPDATE jobs
+            SET status = 'running', attempts = attempts + 1, locked_by = %s,
+                run_at = NOW(3) + INTERVAL %s SECOND
+            WHERE id IN ({placeholders})
+        """, (worker_id, timeout, *ids))
+    conn.commit()
+    cursor.close()
+    return claimed
+
+def complete(conn, job_id, worker_id):
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE jobs SET status = 'done', finished_at = NOW(3)
+        WHERE id = %s AND locked_by = %s AND status = 'running'
+    """, (job_id, worker_id))
+    conn.commit()
+    cursor.close()
+
+def backoff(attempts):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def fail(conn, job, worker_id, error):
+    """Schedule a retry, or dead-letter the job once it has used all its attempts"""
+    cursor = conn.cursor()
+    if job['attempts'] >= job['max_attempts']:
+        cursor.execute("""
+            UPDATE jobs SET status = 'dead', last_error = %s, finished_at = NOW(3)
+            WHERE id = %s AND locked_by = %s
+        """, (error[:2000], job['id'], worker_id))
+    else:
+        cursor.execute("""
+            UPDATE jobs SET status = 'queued', last_error = %s, locked_by = NULL,
+                run_at = NOW(3) + INTERVAL %s SECOND
+            WHERE id = %s AND locked_by = %s
+        """, (error[:2000], backoff(job['attempts']), job['id'], worker_id))
+    conn.commit()
+    cursor.close()
+
+def run_job(conn, job, worker_id):
+    entry = HANDLERS.get(job['kind'])
+    if entry is None:
+        fail(conn, job, worker_id, f"No handler for job kind {job['kind']}")
+        return False
+    fn, options = entry
+    semaphore = options['semaphore']
+    if semaphore:
+        semaphore.acquire()
+    try:
+        fn(conn, job['payload'])
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        fail(conn, job, worker_id, f"{type(e).__name__}: {e}")
+        return False
+    finally:
+        if semaphore:
+            semaphore.release()
+    complete(conn, job['id'], worker_id)
+    return True
+
+def work(queue=DEFAULT_QUEUE, stop=None, worker_id=None, shard=0):
+    """Claim and run jobs of one shard until `stop` is set"""
+    stop = stop or threading.Event()
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    conn = shards.connection(shard)
+    try:
+        while not stop.is_set():
+            jobs = claim(conn, worker_id, queue)
+            if not jobs:
+                stop.wait(POLL_INTERVAL)
+                continue
+            for job in jobs:
+                run_job(conn, job, worker_id)
+    finally:
+        conn.close()
+
+def _process_main(queue, threads):
+    stop = threading.Event()
+    # At least one thread per shard, so no shard's queue is left unpolled
+    pool = [threading.Thread(target=work, args=(queue, stop, None, i % shards.count()), daemon=True)
+            for i in range(max(threads, shards.count()))]
+    for thread in pool:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in pool):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in pool:
+            thread.join()
+
+def run_workers(processes=2, threads=4, queue=DEFAULT_QUEUE):
+    """Start `processes` worker processes with `threads` polling threads each"""
+    workers = [multiprocessing.Process(target=_process_main, args=(queue, threads))
+               for _ in range(processes)]
+    for process in workers:
+        process.start()
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        for process in workers:
+            process.join()
+
+def dead_jobs(cursor, limit=100):
+    cursor.execute("""
+        SELECT id, queue, kind, attempts, last_error, created_at, finished_at
+        FROM jobs WHERE status = 'dead'
+        ORDER BY finished_at DESC LIMIT %s
+    """, (limit,))
+    return cursor.fetchall()
+
+def retry_dead(cursor, job_id):
+    cursor.execute("""
+        UPDATE jobs SET status = 'queued', attempts = 0, locked_by = NULL, run_at = NOW(3)
+        WHERE id = %s AND status = 'dead'
+    """, (job_id,))
+    return cursor.rowcount
+
+def purge_finished(cursor, days=7, batch_size=5000):
+    cursor.execute("""
+        DELETE FROM jobs
+        WHERE status = 'done' AND finished_at < NOW(3) - INTERVAL %s DAY
+        LIMIT %s
+    """, (days, batch_size))
+    return cursor.rowcount
+
+# Handlers for work moved out of request handlers
+
+@handler('find_duplicates')
+def find_duplicates_job(conn, payload):
+    """Score a new application against its dedup block and flag likely duplicates"""
+    import dedup
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT full_names, father_name, mother_name, gender, dedup_key
+        FROM applications WHERE id = %s
+    """, (payload['application_id'],))
+    application = cursor.fetchone()
+    if not application or not application['dedup_key']:
+        cursor.close()
+        return
+    # A retried job must not flag the same pairs twice
+    cursor.execute("DELETE FROM duplicate_flags WHERE application_id = %s AND status = 'open'",
+                   (payload['application_id'],))
+    cursor.close()
+    dedup.find_duplicates(conn, payload['application_id'], application, application['dedup_key'])
+
+@handler('void_payment')
+def void_payment_job(conn, payload):
+    """Close the pending payment of a rejected lost-ID application"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE payments SET status = 'failed'
+        WHERE lost_id_application_id = %s AND status = 'pending'
+    """, (payload['lost_id_application_id'],))
+    cursor.close()
+
+@handler('deliver_notifications', concurrency=1)
+def deliver_notifications_job(conn, payload):
+    """Send the next batch of citizen status notifications"""
+    import notifications
+    notifications.deliver(conn)
+
+@handler('bench', max_attempts=1)
+def bench_job(conn, payload):
+    pass
+
+def benchmark(count=10000, threads=8):
+    """Enqueue `count` no-op jobs, drain them with `threads` workers, report rates and queue latency"""
+    queue = f"bench-{os.getpid()}"
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    results = {'jobs': count, 'threads': threads}
+
+    started = time.perf_counter()
+    for i in range(min(count, 1000)):
+        enqueue(cursor, 'bench', {'i': i}, queue=queue)
+        conn.commit()
+    single = min(count, 1000)
+    results['enqueue_single_per_s'] = single / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for start in range(single, count, 1000):
+        enqueue_many(cursor, 'bench', [{'i': i} for i in range(start, min(start + 1000, count))], queue=queue)
+        conn.commit()
+    if count > single:
+        results['enqueue_batch_per_s'] = (count - single) / (time.perf_counter() - started)
+
+    stop = threading.Event()
+    pool = [threading.Thread(target=work, args=(queue, stop, f"bench-{i}"), daemon=True)
+            for i in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    while True:
+        cursor.execute("SELECT COUNT(*) FROM jobs WHERE queue = %s AND status IN ('queued', 'running')", (queue,))
+        remaining = cursor.fetchone()[0]
+        conn.commit()
+        if remaining == 0:
+            break
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in pool:
+        thread.join()
+    results['drain_per_s'] = count / elapsed
+
+    cursor.execute("""
+        SELECT TIMESTAMPDIFF(MICROSECOND, created_at, finished_at) / 1000
+        FROM jobs WHERE queue = %s AND status = 'done' ORDER BY 1
+    """, (queue,))
+    latencies = [float(row[0]) for row in cursor.fetchall()]
+    results['latency_p50_ms'] = latencies[len(latencies) // 2]
+    results['latency_p95_ms'] = latencies[int(len(latencies) * 0.95)]
+    cursor.execute("DELETE FROM jobs WHERE queue = %s", (queue,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return results
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        if command == "work":
+            run_workers(int(sys.argv[2]) if len(sys.argv) > 2 else 2,
+                        int(sys.argv[3]) if len(sys.argv) > 3 else 4)
+        elif command == "retry":
+            conn = shards.connection_for_id(int(sys.argv[2]))
+            cursor = conn.cursor()
+            print("Requeued" if retry_dead(cursor, int(sys.argv[2])) else "No dead job with that id")
+            conn.commit()
+            cursor.close()
+            conn.close()
+        elif command in ("dead", "purge"):
+            days = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+            total = 0
+            for shard in range(shards.count()):
+                conn = shards.connection(shard)
+                cursor = conn.cursor(dictionary=True)
+                if command == "dead":
+                    for job in dead_jobs(cursor):
+                        print(f"{job['id']} {job['kind']} after {job['attempts']} attempts "
+                              f"({job['finished_at']}): {job['last_error']}")
+                else:
+                    while True:
+                        purged = purge_finished(cursor, days)
+                        conn.commit()
+                        total += purged
+                        if purged == 0:
+                            break
+                cursor.close()
+                conn.close()
+            if command == "purge":
+                print(f"Purged {total} finished jobs")
+        elif command == "bench":
+            stats = benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 10000,
+                              int(sys.argv[3]) if len(sys.argv) > 3 else 8)
+            for name, value in stats.items():
+                print(f"{name}: {value:.1f}" if isinstance(value, float) else f"{name}: {value}")
+        else:
+            print(__doc__)
+    except Exception as e:
+        print(f"Error: {e}")
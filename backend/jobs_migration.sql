@@ -0,0 +1,23 @@
+-- Background job queue: run once on databases created before jobs.py
+USE digital_id_system;
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    queue VARCHAR(50) NOT NULL DEFAULT 'default',
+    kind VARCHAR(50) NOT NULL,
+    payload JSON NOT NULL,
+    status ENUM('queued', 'running', 'done', 'dead') NOT NULL DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_at DATETIME(3) NOT NULL,
+    locked_by VARCHAR(100) NULL,
+    last_error TEXT NULL,
+    created_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    finished_at DATETIME(3) NULL,
+    
+    INDEX idx_jobs_claim (queue, status, run_at),
+    INDEX idx_jobs_finished (status, finished_at)
+);
+
+-- Then start the workers next to the API:
+--   python jobs.py work 2 4
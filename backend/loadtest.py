@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+Load testing for the backend API.
+
+seed fills a local MySQL with synthetic officers, applications (in every
+status, with document rows), issued IDs and lost-ID cases. run drives a
+mixed workload against a running server from a pool of threads, then
+reports per-endpoint throughput and p50/p95/p99 latency. Results are saved
+as JSON under loadtest_results/, and compare diffs two result files.
+compare exits non-zero when any endpoint's p95 or throughput regressed by
+more than the threshold, so it can gate a CI job.
+
+Everything runs from one client IP, so rate_limit.py will throttle a run
+that goes above RATE_LIMITS. Throttled requests (429/503) are counted
+separately from errors. Raise the limits on the server under test when
+measuring raw capacity.
+
+Run this script from terminal:
+    python loadtest.py seed [applications] [officers] [lost_ids]
+    python loadtest.py run [base_url] [seconds] [threads]
+    python loadtest.py compare <baseline.json> <candidate.json> [threshold_pct]
+    python loadtest.py isolation <public_url> <officer_url> [seconds]
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import date, datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+import applications
+
+RESULTS_DIR = 'loadtest_results'
+SEED_BATCH = 1000
+SEED_FILE = 'seed.json'  # officer ids from the last seed, read by run
+OFFICER_PASSWORD = 'loadtest123'
+
+# (operation, weight): roughly a working day of field, admin and public traffic
+WORKLOAD_MIX = [
+    ('track', 30),
+    ('track_lost', 5),
+    ('submit', 10),
+    ('officer_dashboard', 15),
+    ('officer_lost_ids', 5),
+    ('admin_list', 10),
+    ('admin_details', 10),
+    ('admin_lost_ids', 5),
+    ('approve', 5),
+    ('dispatch', 5),
+]
+
+# Seeded status mix for applications
+STATUS_WEIGHTS = [
+    ('submitted', 40), ('approved', 20), ('dispatched', 10),
+    ('ready_for_collection', 10), ('collected', 15), ('rejected', 5),
+]
+ISSUED = ('approved', 'dispatched', 'ready_for_collection', 'collected')
+
+DISTRICTS = ['Nairobi', 'Mombasa', 'Kisumu', 'Nakuru', 'Kiambu', 'Machakos', 'Kakamega',
+             'Bungoma', 'Meru', 'Nyeri', 'Kericho', 'Uasin Gishu', 'Kilifi', 'Garissa']
+FIRST_NAMES = ['Wanjiku', 'Otieno', 'Achieng', 'Kamau', 'Mutua', 'Njeri', 'Kiprono', 'Atieno',
+               'Mwangi', 'Chebet', 'Omondi', 'Wambui', 'Kibet', 'Akinyi', 'Juma', 'Nyambura']
+LAST_NAMES = ['Odhiambo', 'Kariuki', 'Mutiso', 'Wafula', 'Cheruiyot', 'Onyango', 'Maina',
+              'Kimani', 'Barasa', 'Koech', 'Ndungu', 'Ochieng', 'Rotich', 'Muthoni']
+
+# A tiny valid JPEG header is enough; the server only stores the bytes
+_PHOTO = b'\xff\xd8\xff\xe0' + os.urandom(4096) + b'\xff\xd9'
+
+def _name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+def synthetic_form(rng):
+    """Form fields for one new application, as the officer portal sends them"""
+    district = rng.choice(DISTRICTS)
+    born = date(1960, 1, 1) + timedelta(days=rng.randrange(16000))
+    return {
+        'fullNames': _name(rng), 'dateOfBirth': born.isoformat(),
+        'gender': rng.choice(['male', 'female']),
+        'fatherName': _name(rng), 'motherName': _name(rng),
+        'maritalStatus': rng.choice(['single', 'married']),
+        'districtOfBirth': district, 'tribe': 'Synthetic', 'homeDistrict': district,
+        'division': 'Central', 'constituency': f"{district} Central", 'location': 'Town',
+        'subLocation': 'Township', 'villageEstate': f"Estate {rng.randrange(500)}",
+        'occupation': rng.choice(['Farmer', 'Teacher', 'Trader', 'Student', 'Driver']),
+    }
+
+def _weighted(rng, weights):
+    return rng.choices([name for name, _ in weights], [weight for _, weight in weights])[0]
+
+def seed(conn, application_count=10000, officer_count=20, lost_count=1000, seed_value=42):
+    """Insert synthetic data in SEED_BATCH-row executemany batches"""
+    import archive
+    import citizen_index
+
+    rng = random.Random(seed_value)
+    cursor = conn.cursor()
+    run_tag = uuid.uuid4().hex[:6]
+
+    password_hash = generate_password_hash(OFFICER_PASSWORD)
+    cursor.executemany("""
+        INSERT INTO officers (id_number, email, phone_number, full_name, station, password_hash, status)
+        VALUES (%s, %s, %s, %s, %s, %s, 'approved')
+    """, [(f"LT{run_tag}{i:04d}", f"loadtest.{run_tag}.{i}@example.com", f"0700{i:06d}",
+           _name(rng), f"{rng.choice(DISTRICTS)} Huduma Centre", password_hash)
+          for i in range(officer_count)])
+    conn.commit()
+    cursor.execute("SELECT id FROM officers WHERE id_number LIKE %s", (f"LT{run_tag}%",))
+    officer_ids = [row[0] for row in cursor.fetchall()]
+
+    first = archive.next_sequence(cursor, 'applications')
+    for start in range(0, application_count, SEED_BATCH):
+        rows = []
+        for i in range(start, min(start + SEED_BATCH, application_count)):
+            form = synthetic_form(rng)
+            params = list(applications.insert_params(
+                form, applications.application_number(first + i), rng.choice(officer_ids),
+                applications.dedup_key(form)))
+            params[-3] = _weighted(rng, STATUS_WEIGHTS)                          # status
+            params[-2] = datetime.now() - timedelta(minutes=rng.randrange(525600))  # created_at
+            rows.append(params)
+        cursor.executemany(applications.INSERT_SQL, rows)
+
+        numbers = [row[0] for row in rows]
+        placeholders = ', '.join(['%s'] * len(numbers))
+        cursor.execute(f"SELECT id, application_number, status FROM applications "
+                       f"WHERE application_number IN ({placeholders})", numbers)
+        inserted = cursor.fetchall()
+        cursor.executemany(
+            "INSERT INTO documents (application_id, document_type, file_path) VALUES (%s, %s, %s)",
+            [(app_id, document_type, applications.upload_path(number, key, f"{key}.jpg"))
+             for app_id, number, _ in inserted
+             for key, document_type in applications.DOCUMENT_TYPES.items()])
+        # Seeded ID numbers use their own prefix so approvals during a run cannot collide with them
+        cursor.executemany("UPDATE applications SET generated_id_number = %s WHERE id = %s",
+                           [(f"LT{run_tag}{app_id:010d}", app_id)
+                            for app_id, _, status in inserted if status in ISSUED])
+        conn.commit()
+
+    citizen_index.backfill_citizens(conn)
+
+    cursor.execute("SELECT id_number FROM citizens WHERE id_number LIKE %s", (f"LT{run_tag}%",))
+    citizens = [row[0] for row in cursor.fetchall()]
+    lost_first = archive.next_sequence(cursor, 'lost_id_applications')
+    year = datetime.now().year
+    rows = [(f"WAIT{year}{lost_first + i:06d}", rng.choice(citizens), rng.choice(officer_ids),
+             f"OB/{rng.randrange(1, 999)}/{year}", 'Lost in transit (synthetic)',
+             rng.choice(['cash', 'mpesa']), _weighted(rng, STATUS_WEIGHTS))
+            for i in range(lost_count if citizens else 0)]
+    for start in range(0, len(rows), SEED_BATCH):
+        cursor.executemany("""
+            INSERT INTO lost_id_applications (
+                waiting_card_number, citizen_id_number, officer_id,
+                ob_number, ob_description, payment_method, status
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, rows[start:start + SEED_BATCH])
+        conn.commit()
+    cursor.close()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(os.path.join(RESULTS_DIR, SEED_FILE), 'w') as f:
+        json.dump({'officer_ids': officer_ids}, f)
+    return {'officers': len(officer_ids), 'applications': application_count,
+            'citizens': len(citizens), 'lost_id_applications': len(rows)}
+
+def _multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                     f'{value}\r\n'.encode('utf-8'))
+    for name, (filename, content) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                     f'filename="{filename}"\r\nContent-Type: image/jpeg\r\n\r\n'.encode('utf-8')
+                     + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+def seeded_officer_ids():
+    # There is no API listing approved officers; use the ones the last seed created
+    try:
+        with open(os.path.join(RESULTS_DIR, SEED_FILE)) as f:
+            return json.load(f)['officer_ids']
+    except (OSError, ValueError, KeyError):
+        return [1]
+
+class Workload:
+    """Shared state for one run: the ids the operations pick from, and the samples they record"""
+
+    def __init__(self, base_url, seed_value=None):
+        self.base_url = base_url.rstrip('/')
+        self.rng = random.Random(seed_value)
+        self.samples = {}
+        self.lock = threading.Lock()
+        self.submitted = []
+        self.approved = []
+        self.numbers = []
+        self.waiting_cards = []
+        self.application_ids = []
+        self.officer_ids = []
+
+    def request(self, method, path, body=None, content_type=None):
+        headers = {'Accept-Encoding': 'gzip'}
+        if content_type:
+            headers['Content-Type'] = content_type
+        req = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+        except (urllib.error.URLError, OSError):
+            return 0, b''
+
+    def load_ids(self):
+        """Sample ids for the operations from the admin listings"""
+        status, body = self.request('GET', '/api/admin/applications')
+        if status != 200:
+            raise RuntimeError(f"Could not list applications from {self.base_url} (HTTP {status})")
+        for row in json.loads(body)['applications']:
+            if row.get('source_type') == 'lost_id':
+                self.waiting_cards.append(row['application_number'])
+                continue
+            self.numbers.append(row['application_number'])
+            self.application_ids.append(row['id'])
+            if row['status'] == 'submitted':
+                self.submitted.append(row['id'])
+            elif row['status'] == 'approved':
+                self.approved.append(row['id'])
+        self.officer_ids = seeded_officer_ids()
+        self.rng.shuffle(self.submitted)
+        self.rng.shuffle(self.approved)
+
+    def _pop(self, pool):
+        with self.lock:
+            return pool.pop() if pool else None
+
+    def perform(self, operation):
+        """Run one operation. Returns (endpoint label, HTTP status), or None when nothing is left to act on"""
+        rng = self.rng
+        if operation == 'track':
+            return 'GET /api/applications/track/<number>', \
+                self.request('GET', f"/api/applications/track/{rng.choice(self.numbers)}")[0]
+        if operation == 'track_lost':
+            if not self.waiting_cards:
+                return None
+            return 'GET /api/applications/track-lost/<number>', \
+                self.request('GET', f"/api/applications/track-lost/{rng.choice(self.waiting_cards)}")[0]
+        if operation == 'submit':
+            body, content_type = _multipart(synthetic_form(rng), {
+                key: (f"{key}.jpg", _PHOTO) for key in applications.DOCUMENT_TYPES})
+            status, payload = self.request('POST', '/api/applications', body, content_type)
+            if status == 201:
+                with self.lock:
+                    self.numbers.append(json.loads(payload)['applicationNumber'])
+            return 'POST /api/applications', status
+        if operation == 'officer_dashboard':
+            return 'GET /api/officer/applications', self.request(
+                'GET', f"/api/officer/applications?officer_id={rng.choice(self.officer_ids)}")[0]
+        if operation == 'officer_lost_ids':
+            return 'GET /api/officer/lost-id-applications', self.request(
+                'GET', f"/api/officer/lost-id-applications?officer_id={rng.choice(self.officer_ids)}")[0]
+        if operation == 'admin_list':
+            return 'GET /api/admin/applications', self.request('GET', '/api/admin/applications')[0]
+        if operation == 'admin_details':
+            return 'GET /api/admin/applications/<id>', \
+                self.request('GET', f"/api/admin/applications/{rng.choice(self.application_ids)}")[0]
+        if operation == 'admin_lost_ids':
+            return 'GET /api/admin/lost-id-applications', \
+                self.request('GET', '/api/admin/lost-id-applications')[0]
+        if operation == 'approve':
+            application_id = self._pop(self.submitted)
+            if application_id is None:
+                return None
+            status = self.request('PUT', f"/api/admin/applications/{application_id}/approve")[0]
+            if status == 200:
+                with self.lock:
+                    self.approved.append(application_id)
+            return 'PUT /api/admin/applications/<id>/approve', status
+        if operation == 'dispatch':
+            application_id = self._pop(self.approved)
+            if application_id is None:
+                return None
+            return 'PUT /api/admin/applications/<id>/dispatch', \
+                self.request('PUT', f"/api/admin/applications/{application_id}/dispatch")[0]
+        raise ValueError(f"Unknown operation: {operation}")
+
+    def record(self, endpoint, status, elapsed):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((status, elapsed))
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(samples, seconds):
+    report = {}
+    for endpoint, entries in sorted(samples.items()):
+        ok = sorted(elapsed * 1000 for status, elapsed in entries if 200 <= status < 400)
+        throttled = sum(1 for status, _ in entries if status in (429, 503))
+        report[endpoint] = {
+            'requests': len(entries),
+            'ok': len(ok),
+            'throttled': throttled,
+            'errors': len(entries) - len(ok) - throttled,
+            'rps': len(ok) / seconds if seconds else 0.0,
+            'p50_ms': percentile(ok, 0.50),
+            'p95_ms': percentile(ok, 0.95),
+            'p99_ms': percentile(ok, 0.99),
+        }
+    return report
+
+def _drive(seconds, groups):
+    """Run each (workload, mix, threads) group concurrently for `seconds`; returns the elapsed time"""
+    deadline = time.monotonic() + seconds
+
+    def worker(workload, mix):
+        while time.monotonic() < deadline:
+            operation = _weighted(workload.rng, mix)
+            started = time.perf_counter()
+            outcome = workload.perform(operation)
+            if outcome is not None:
+                workload.record(outcome[0], outcome[1], time.perf_counter() - started)
+
+    started = time.monotonic()
+    pool = [threading.Thread(target=worker, args=(workload, mix), daemon=True)
+            for workload, mix, threads in groups for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.monotonic() - started
+
+def run(base_url='http://localhost:5000', seconds=60, threads=16, mix=None, seed_value=None):
+    """Drive the weighted mix for `seconds` from `threads` workers and summarize per endpoint"""
+    workload = Workload(base_url, seed_value)
+    workload.load_ids()
+    if not workload.numbers:
+        raise RuntimeError("No applications to work on; run `python loadtest.py seed` first")
+    mix = mix or WORKLOAD_MIX
+    elapsed = _drive(seconds, [(workload, mix, threads)])
+
+    return {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'base_url': base_url,
+        'seconds': elapsed,
+        'threads': threads,
+        'mix': dict(mix),
+        'endpoints': summarize(workload.samples, elapsed),
+    }
+
+def isolation(public_url, officer_url, seconds=30, public_threads=32, officer_threads=4):
+    """
+    Flood public tracking while officers work, and report both sides.
+
+    Run it against one combined server (same URL twice, `python app.py all`)
+    and against separate tiers (`python app.py public 5001`,
+    `python app.py officer 5002`); with split tiers the officer p95 should
+    stay flat however hard the public side is pushed.
+    """
+    officer = Workload(officer_url)
+    officer.officer_ids = seeded_officer_ids()
+    public = Workload(public_url)
+    for officer_id in officer.officer_ids[:10]:
+        status, body = officer.request('GET', f"/api/officer/applications?officer_id={officer_id}")
+        if status == 200:
+            public.numbers.extend(row['application_number'] for row in json.loads(body))
+    if not public.numbers:
+        raise RuntimeError("No applications to track; run `python loadtest.py seed` first")
+
+    elapsed = _drive(seconds, [
+        (public, [('track', 1)], public_threads),
+        (officer, [('officer_dashboard', 3), ('submit', 1)], officer_threads),
+    ])
+    return {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'public_url': public_url,
+        'officer_url': officer_url,
+        'seconds': elapsed,
+        'threads': {'public': public_threads, 'officer': officer_threads},
+        'endpoints': {**summarize(public.samples, elapsed), **summarize(officer.samples, elapsed)},
+    }
+
+def save(result, directory=RESULTS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"loadtest-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+    return path
+
+def compare(baseline, candidate, threshold_pct=10.0):
+    """Per-endpoint changes; an endpoint regresses when p95 rises or rps drops by more than threshold_pct"""
+    rows = []
+    for endpoint, new in candidate['endpoints'].items():
+        old = baseline['endpoints'].get(endpoint)
+        if not old or not old['ok'] or not new['ok']:
+            continue
+        p95_change = (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0.0
+        rps_change = (new['rps'] - old['rps']) / old['rps'] * 100 if old['rps'] else 0.0
+        rows.append({
+            'endpoint': endpoint,
+            'p95_ms': (old['p95_ms'], new['p95_ms'], p95_change),
+            'rps': (old['rps'], new['rps'], rps_change),
+            'regressed': p95_change > threshold_pct or rps_change < -threshold_pct,
+        })
+    return rows
+
+def _print_report(result):
+    print(f"{result['seconds']:.0f}s, {result['threads']} threads against {result['base_url']}")
+    for endpoint, row in result['endpoints'].items():
+        print(f"{endpoint:<48} {row['rps']:>7.1f} req/s | p50 {row['p50_ms']:>7.1f}ms | "
+              f"p95 {row['p95_ms']:>7.1f}ms | p99 {row['p99_ms']:>7.1f}ms | "
+              f"{row['errors']} errors, {row['throttled']} throttled")
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    args = sys.argv[2:]
+    try:
+        if command == "seed":
+            from db import get_db_connection
+            conn = get_db_connection()
+            counts = seed(conn, *(int(arg) for arg in args[:3]))
+            conn.close()
+            print(", ".join(f"{count} {name}" for name, count in counts.items()))
+        elif command == "run":
+            result = run(args[0] if args else 'http://localhost:5000',
+                         int(args[1]) if len(args) > 1 else 60,
+                         int(args[2]) if len(args) > 2 else 16)
+            _print_report(result)
+            print(f"Saved {save(result)}")
+        elif command == "isolation" and len(args) >= 2:
+            result = isolation(args[0], args[1], int(args[2]) if len(args) > 2 else 30)
+            for endpoint, row in result['endpoints'].items():
+                print(f"{endpoint:<48} {row['rps']:>7.1f} req/s | p50 {row['p50_ms']:>7.1f}ms | "
+                      f"p95 {row['p95_ms']:>7.1f}ms | {row['errors']} errors, {row['throttled']} throttled")
+            print(f"Saved {save(result)}")
+        elif command == "compare" and len(args) >= 2:
+            with open(args[0]) as f:
+                baseline = json.load(f)
+            with open(args[1]) as f:
+                candidate = json.load(f)
+            rows = compare(baseline, candidate, float(args[2]) if len(args) > 2 else 10.0)
+            for row in rows:
+                old_p95, new_p95, p95_change = row['p95_ms']
+                old_rps, new_rps, rps_change = row['rps']
+                flag = '  REGRESSED' if row['regressed'] else ''
+                print(f"{row['endpoint']:<48} p95 {old_p95:.1f} -> {new_p95:.1f}ms ({p95_change:+.0f}%) | "
+                      f"{old_rps:.1f} -> {new_rps:.1f} req/s ({rps_change:+.0f}%){flag}")
+            sys.exit(1 if any(row['regressed'] for row in rows) else 0)
+        else:
+            print(__doc__)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,369 @@
+"""
+Lost ID replacement routes: citizen lookup, submission, and the officer
+and admin steps of the replacement workflow
+"""
+
+from flask import Blueprint, request, jsonify
+from datetime import datetime
+import os
+from werkzeug.utils import secure_filename
+import archive
+import jobs
+import notifications
+import queries
+import shards
+import uploads
+from idempotency import idempotent
+from db import get_read_connection
+
+lost_id_bp = Blueprint('lost_id', __name__)
+
+@lost_id_bp.route('/api/citizen/<id_number>', methods=['GET'])
+def get_citizen_details(id_number):
+    """Get citizen details by ID number for lost ID replacement"""
+    try:
+        conn = get_read_connection()
+        
+        citizen = queries.fetchone(conn, 'citizen_by_id', (id_number,))
+        
+        conn.close()
+        
+        if not citizen:
+            return jsonify({'error': 'Citizen not found'}), 404
+            
+        return jsonify(citizen), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@lost_id_bp.route('/api/lost-id-applications', methods=['POST'])
+@idempotent
+def submit_lost_id_application():
+    """Submit a lost ID replacement application"""
+    try:
+        print(f"Received lost ID application request: {request.method}")
+        print(f"Form data: {dict(request.form)}")
+        print(f"Files: {list(request.files.keys())}")
+        
+        # Handle form data with files
+        data = request.form.to_dict()
+        files = request.files
+        
+        # Validate required fields
+        required_fields = ['id_number', 'ob_number', 'ob_description', 'payment_method']
+        missing_fields = [field for field in required_fields if not data.get(field)]
+        if missing_fields:
+            print(f"Missing required fields: {missing_fields}")
+            return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+        
+        # Documents sent ahead through resumable uploads (see uploads.py)
+        upload_ids = uploads.parse_upload_ids(data.get('uploads'), ['ob_photo', 'passport_photo', 'birth_certificate'])
+        
+        # Validate required files
+        required_files = ['ob_photo', 'passport_photo', 'birth_certificate']
+        missing_files = [file for file in required_files
+                         if file not in upload_ids and (file not in files or not files[file].filename)]
+        if missing_files:
+            print(f"Missing required files: {missing_files}")
+            return jsonify({'error': f'Missing required files: {", ".join(missing_files)}'}), 400
+        uploads.check_complete(upload_ids)
+        
+        # Get officer ID (in production, extract from JWT)
+        officer_id = data.get('officer_id', 1)
+        
+        # Lost-ID cases live on the shard of the capturing officer's station (see shards.py)
+        print("Connecting to database...")
+        shard = shards.shard_for_officer(officer_id)
+        conn = shards.connection(shard)
+        cursor = conn.cursor()
+        
+        # Citizens are indexed when their ID is issued (see citizen_index.py)
+        print("Checking if citizen exists in citizens table...")
+        if not queries.fetchone(conn, 'citizen_by_id', (data['id_number'],)):
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Citizen not found in system'}), 404
+        
+        # Generate waiting card number
+        print("Generating waiting card number...")
+        sequence = archive.next_sequence(cursor, 'lost_id_applications')
+        waiting_card_number = shards.waiting_card_number(shard, sequence)
+        print(f"Generated waiting card number: {waiting_card_number}")
+        
+        # Insert lost ID application
+        print("Inserting lost ID application...")
+        # Contact details for status notifications; M-Pesa payers already gave a number
+        cursor.execute("""
+            INSERT INTO lost_id_applications (
+                waiting_card_number, citizen_id_number, officer_id, 
+                ob_number, ob_description, payment_method, 
+                payment_amount, phone_number, email, status, created_at
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, (
+            waiting_card_number, data['id_number'], officer_id,
+            data['ob_number'], data['ob_description'], data['payment_method'],
+            1000.00, data.get('phone_number') or data.get('mpesa_phone') or None,
+            data.get('email') or None, 'submitted', datetime.now()
+        ))
+        
+        application_id = cursor.lastrowid
+        print(f"Created application with ID: {application_id}")
+        
+        # Handle file uploads
+        upload_dir = 'uploads/lost_id'
+        os.makedirs(upload_dir, exist_ok=True)
+        print(f"Upload directory created: {upload_dir}")
+        
+        # Map file types for lost ID applications
+        file_type_mapping = {
+            'ob_photo': 'ob_photo',
+            'passport_photo': 'new_passport_photo',
+            'birth_certificate': 'birth_cert_photo'
+        }
+        
+        for file_key, file in files.items():
+            if file and file.filename and file_key in file_type_mapping:
+                print(f"Processing file: {file_key} - {file.filename}")
+                # Create safe filename
+                secure_name = secure_filename(file.filename)
+                filename = f"{waiting_card_number}_{file_key}_{secure_name}"
+                file_path = os.path.join(upload_dir, filename)
+                file.save(file_path)
+                print(f"Saved file to: {file_path}")
+                
+                doc_type = file_type_mapping[file_key]
+                
+                # Insert document record
+                cursor.execute("""
+                    INSERT INTO documents (lost_id_application_id, document_type, file_path)
+                    VALUES (%s, %s, %s)
+                """, (application_id, doc_type, file_path))
+                print(f"Inserted document record: {doc_type}")
+        
+        for file_key, upload_id in upload_ids.items():
+            if file_key not in file_type_mapping:
+                continue
+            secure_name = secure_filename(uploads.load_session(upload_id)['filename'])
+            file_path = os.path.join(upload_dir, f"{waiting_card_number}_{file_key}_{secure_name}")
+            sha256 = uploads.finalize(upload_id, file_path)
+            cursor.execute("""
+                INSERT INTO documents (lost_id_application_id, document_type, file_path, sha256)
+                VALUES (%s, %s, %s, %s)
+            """, (application_id, file_type_mapping[file_key], file_path, sha256))
+            print(f"Finalized resumable upload: {file_key}")
+        
+        # Record payment
+        print("Recording payment...")
+        # M-Pesa payers use the waiting card number as the paybill account reference (see reconcile.py)
+        cursor.execute("""
+            INSERT INTO payments (lost_id_application_id, amount, payment_method, status,
+                                  account_reference, payer_phone)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (application_id, 1000.00, data['payment_method'], 'pending',
+              waiting_card_number, data.get('mpesa_phone')))
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        print("Lost ID application submitted successfully")
+        return jsonify({
+            'message': 'Lost ID application submitted successfully',
+            'waiting_card_number': waiting_card_number
+        }), 201
+        
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        print(f"Error in submit_lost_id_application: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@lost_id_bp.route('/api/officer/lost-id-applications', methods=['GET'])
+def get_officer_lost_id_applications():
+    """Get lost ID applications for a specific officer"""
+    try:
+        # In a real app, get officer_id from JWT token
+        officer_id = request.args.get('officer_id', 1)
+        
+        # The issuing application may be on another shard; citizens are on every shard
+        applications = shards.select_all("""
+            SELECT lia.id, lia.waiting_card_number, lia.citizen_id_number,
+                   lia.ob_number, lia.payment_method, lia.status, lia.created_at,
+                   COALESCE(c.full_names, a.full_names) as citizen_name
+            FROM lost_id_applications lia
+            LEFT JOIN applications a ON lia.citizen_id_number = a.generated_id_number
+            LEFT JOIN citizens c ON lia.citizen_id_number = c.id_number
+            WHERE lia.officer_id = %s
+            ORDER BY lia.created_at DESC
+        """, (officer_id,), order_by='created_at')
+        
+        return jsonify(applications), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@lost_id_bp.route('/api/officer/lost-id-applications/<int:application_id>/card-arrived', methods=['PUT'])
+def mark_lost_id_card_arrived(application_id):
+    """Mark lost ID replacement card as arrived"""
+    try:
+        conn = shards.connection_for_id(application_id)
+        
+        updated = queries.execute(conn, 'lost_id_card_arrived', (application_id,))
+        
+        if updated == 0:
+            conn.close()
+            return jsonify({'error': 'Application not found or not in dispatched status'}), 404
+        
+        cursor = conn.cursor()
+        notifications.notify(cursor, 'lost_id', application_id, 'ready_for_collection')
+        cursor.close()
+        
+        conn.commit()
+        conn.close()
+        
+        return jsonify({'message': 'Lost ID replacement card arrival confirmed'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@lost_id_bp.route('/api/officer/lost-id-applications/<int:application_id>/card-collected', methods=['PUT'])
+def mark_lost_id_card_collected(application_id):
+    """Mark lost ID replacement card as collected"""
+    try:
+        conn = shards.connection_for_id(application_id)
+        
+        updated = queries.execute(conn, 'lost_id_card_collected', (application_id,))
+        
+        if updated == 0:
+            conn.close()
+            return jsonify({'error': 'Application not found or card not ready for collection'}), 404
+        
+        conn.commit()
+        conn.close()
+        
+        return jsonify({'message': 'Lost ID replacement card collection confirmed'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@lost_id_bp.route('/api/admin/lost-id-applications', methods=['GET'])
+def get_lost_id_applications():
+    """Get all lost ID applications for admin"""
+    try:
+        applications = shards.select_all("""
+            SELECT lia.id, lia.waiting_card_number, lia.citizen_id_number,
+                   lia.ob_number, lia.payment_method, lia.status, lia.created_at,
+                   o.full_name as officer_name,
+                   COALESCE(c.full_names, a.full_names) as citizen_name
+            FROM lost_id_applications lia
+            LEFT JOIN officers o ON lia.officer_id = o.id
+            LEFT JOIN applications a ON lia.citizen_id_number = a.generated_id_number
+            LEFT JOIN citizens c ON lia.citizen_id_number = c.id_number
+            ORDER BY lia.created_at DESC
+        """, order_by='created_at')
+        
+        return jsonify({'applications': applications}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@lost_id_bp.route('/api/admin/lost-id-applications/<int:application_id>/approve', methods=['PUT'])
+def approve_lost_id_application(application_id):
+    """Approve a lost ID replacement application"""
+    try:
+        conn = shards.connection_for_id(application_id)
+        cursor = conn.cursor()
+        
+        # Update application status to approved
+        cursor.execute("""
+            UPDATE lost_id_applications 
+            SET status = 'approved', updated_at = NOW(), approved_at = updated_at
+            WHERE id = %s AND status = 'submitted'
+        """, (application_id,))
+        
+        if cursor.rowcount == 0:
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Application not found or already processed'}), 404
+        
+        # Update payment status
+        cursor.execute("""
+            UPDATE payments 
+            SET status = 'completed'
+            WHERE lost_id_application_id = %s
+        """, (application_id,))
+        
+        # Tell the applicant; sent in the background (see notifications.py)
+        notifications.notify(cursor, 'lost_id', application_id, 'approved')
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        return jsonify({'message': 'Lost ID application approved successfully'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@lost_id_bp.route('/api/admin/lost-id-applications/<int:application_id>/reject', methods=['PUT'])
+def reject_lost_id_application(application_id):
+    """Reject a lost ID replacement application"""
+    try:
+        conn = shards.connection_for_id(application_id)
+        cursor = conn.cursor()
+        
+        # Update application status to rejected
+        cursor.execute("""
+            UPDATE lost_id_applications 
+            SET status = 'rejected', updated_at = NOW()
+            WHERE id = %s AND status = 'submitted'
+        """, (application_id,))
+        
+        if cursor.rowcount == 0:
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Application not found or already processed'}), 404
+        
+        # Close the pending payment in the background
+        jobs.enqueue(cursor, 'void_payment', {'lost_id_application_id': application_id})
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        return jsonify({'message': 'Lost ID application rejected'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@lost_id_bp.route('/api/admin/lost-id-applications/<int:application_id>/dispatch', methods=['PUT'])
+def dispatch_lost_id_application(application_id):
+    """Dispatch an approved lost ID replacement"""
+    try:
+        conn = shards.connection_for_id(application_id)
+        cursor = conn.cursor()
+        
+        # Update application status to dispatched
+        cursor.execute("""
+            UPDATE lost_id_applications 
+            SET status = 'dispatched', updated_at = NOW(), dispatched_at = updated_at
+            WHERE id = %s AND status = 'approved'
+        """, (application_id,))
+        
+        if cursor.rowcount == 0:
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Application not found or not approved'}), 404
+        
+        notifications.notify(cursor, 'lost_id', application_id, 'dispatched')
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        return jsonify({'message': 'Lost ID replacement dispatched successfully'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
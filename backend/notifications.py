@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+Citizen notifications for application status changes.
+
+When an application or lost-ID case is approved, dispatched or its card
+arrives at the station (ready_for_collection), the route calls notify()
+with its own cursor. That inserts one `notifications` row per contact
+channel the applicant gave (SMS to phone_number, email to email) and
+queues a deliver_notifications job, all in the request's transaction.
+Nothing talks to a provider while the request is open.
+
+The job (jobs.py) runs deliver() on the shard of the case:
+  - it locks up to BATCH_LIMIT due rows with FOR UPDATE SKIP LOCKED
+  - coalescing: when a record has a newer notification on the same
+    channel, the older one is marked 'coalesced' and only the latest
+    status goes out ("dispatched" replaces a not-yet-sent "approved")
+  - per-provider token buckets cap the send rate. Rows over the budget
+    stay pending for the next run. The buckets live in the worker
+    process, so set NOTIFY_<CHANNEL>_RATE to the provider's limit divided
+    by the number of worker processes
+  - each provider gets the messages in batches of its batch_size
+  - failed messages are retried with jobs.backoff() until MAX_ATTEMPTS,
+    then marked 'failed'
+While rows remain, the job queues its own next run for when the earliest
+one is due. jobs.enqueue_once() keeps at most one run queued per shard.
+
+A provider with NOTIFY_<CHANNEL>_URL set gets HTTP batches (HttpGateway).
+Without one, LocalGateway stands in: it appends what would be sent to
+notification_outbox/<channel>.jsonl after a simulated round trip.
+
+Delivery is at least once: if the job dies after the provider accepted a
+batch but before it commits, that batch is sent again.
+
+Run this script from terminal:
+    python notifications.py stats            # counts by channel and status, delivery delay
+    python notifications.py deliver          # one delivery pass on every shard
+    python notifications.py purge [days]     # delete settled notifications older than `days` (default 30)
+    python notifications.py check            # self-check of templates, coalescing and rate limits
+    python notifications.py bench [messages] # batched vs one-at-a-time sends through the local gateway
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import jobs
+import shards
+
+DELIVER_JOB = 'deliver_notifications'
+BATCH_WINDOW = float(os.environ.get('NOTIFY_BATCH_WINDOW', 5))  # seconds changes wait to be batched
+BATCH_LIMIT = 500   # rows one delivery run takes
+MAX_ATTEMPTS = 5
+
+OUTBOX_DIR = os.environ.get('NOTIFY_OUTBOX_DIR', 'notification_outbox')
+LOCAL_LATENCY = float(os.environ.get('NOTIFY_LOCAL_LATENCY_MS', 50)) / 1000
+LOCAL_FAILURE_RATE = float(os.environ.get('NOTIFY_LOCAL_FAILURE_RATE', 0))
+HTTP_TIMEOUT = 10
+
+def _provider(channel, rate, burst, batch_size):
+    prefix = f"NOTIFY_{channel.upper()}"
+    return {
+        'rate': float(os.environ.get(f'{prefix}_RATE', rate)),          # messages per second
+        'burst': int(os.environ.get(f'{prefix}_BURST', burst)),
+        'batch_size': int(os.environ.get(f'{prefix}_BATCH', batch_size)),  # messages per gateway call
+        'url': os.environ.get(f'{prefix}_URL'),
+    }
+
+PROVIDERS = {
+    'sms': _provider('sms', 10, 50, 100),
+    'email': _provider('email', 20, 100, 200),
+}
+
+EVENTS = ('approved', 'dispatched', 'ready_for_collection')
+
+TEMPLATES = {
+    ('application', 'approved'): "your ID application {reference} has been approved.",
+    ('application', 'dispatched'): "your ID card for application {reference} has been dispatched "
+                                   "to the registration office.",
+    ('application', 'ready_for_collection'): "your ID card for application {reference} is ready for "
+                                             "collection at the registration office where you applied.",
+    ('lost_id', 'approved'): "your replacement ID request {reference} has been approved.",
+    ('lost_id', 'dispatched'): "your replacement ID card ({reference}) has been dispatched to the station.",
+    ('lost_id', 'ready_for_collection'): "your replacement ID card ({reference}) is ready for collection "
+                                         "at the station where you reported the loss.",
+}
+EMAIL_SUBJECT = 'Update on your ID application {reference}'
+
+# One row per channel the applicant left a contact for
+_NOTIFY_SQL = {
+    'application': """
+        INSERT INTO notifications (source, record_id, event, channel, recipient, reference, full_names)
+        SELECT 'application', id, %(event)s, 'sms', phone_number, application_number, full_names
+        FROM applications WHERE id = %(id)s AND phone_number <> ''
+        UNION ALL
+        SELECT 'application', id, %(event)s, 'email', email, application_number, full_names
+        FROM applications WHERE id = %(id)s AND email <> ''
+    """,
+    'lost_id': """
+        INSERT INTO notifications (source, record_id, event, channel, recipient, reference, full_names)
+        SELECT 'lost_id', l.id, %(event)s, 'sms', l.phone_number, l.waiting_card_number, c.full_names
+        FROM lost_id_applications l LEFT JOIN citizens c ON c.id_number = l.citizen_id_number
+        WHERE l.id = %(id)s AND l.phone_number <> ''
+        UNION ALL
+        SELECT 'lost_id', l.id, %(event)s, 'email', l.email, l.waiting_card_number, c.full_names
+        FROM lost_id_applications l LEFT JOIN citizens c ON c.id_number = l.citizen_id_number
+        WHERE l.id = %(id)s AND l.email <> ''
+    """,
+}
+
+METRICS = {}  # channel -> delivery counters of this process
+_metrics_lock = threading.Lock()
+
+def notify(cursor, source, record_id, event):
+    """Queue notifications of a status change inside the caller's transaction; returns how many"""
+    if event not in EVENTS:
+        raise ValueError(f'No notification for event {event}')
+    cursor.execute(_NOTIFY_SQL[source], {'event': event, 'id': record_id})
+    queued = cursor.rowcount
+    if queued > 0:
+        jobs.enqueue_once(cursor, DELIVER_JOB, delay=BATCH_WINDOW)
+    return queued
+
+def render(row):
+    """Gateway message for a notifications row"""
+    greeting = f"Dear {row['full_names']}, " if row.get('full_names') else "Hello, "
+    message = {
+        'id': row['id'],
+        'to': row['recipient'],
+        'text': greeting + TEMPLATES[(row['source'], row['event'])].format(reference=row['reference']),
+    }
+    if row['channel'] == 'email':
+        message['subject'] = EMAIL_SUBJECT.format(reference=row['reference'])
+    return message
+
+def supersede(rows, latest):
+    """Split rows into (to send, ids replaced by a newer notification); latest maps key -> newest id"""
+    keep, superseded = [], []
+    for row in rows:
+        if row['id'] < latest.get((row['source'], row['record_id'], row['channel']), row['id']):
+            superseded.append(row['id'])
+        else:
+            keep.append(row)
+    return keep, superseded
+
+class TokenBucket:
+    """Send budget of one provider in this process"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, wanted):
+        """Take up to `wanted` tokens. Returns (tokens granted, seconds until the next one)"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            granted = min(wanted, int(self._tokens))
+            self._tokens -= granted
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+        return granted, wait
+
+BUCKETS = {channel: TokenBucket(p['rate'], p['burst']) for channel, p in PROVIDERS.items()}
+
+class LocalGateway:
+    """Stand-in provider: appends accepted messages to OUTBOX_DIR/<channel>.jsonl"""
+
+    def __init__(self, channel, latency=LOCAL_LATENCY, failure_rate=LOCAL_FAILURE_RATE, outbox=OUTBOX_DIR):
+        self.path = os.path.join(outbox, f"{channel}.jsonl")
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._lock = threading.Lock()
+
+    def send(self, messages):
+        """Deliver a batch; returns {message id: error, or None when accepted}"""
+        time.sleep(self.latency)  # one round trip per batch, as with a real provider
+        results = {}
+        accepted = []
+        for message in messages:
+            if random.random() < self.failure_rate:
+                results[message['id']] = 'Simulated provider failure'
+            else:
+                results[message['id']] = None
+                accepted.append(json.dumps({**message, 'accepted_at': time.time()}))
+        if accepted:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, 'a') as f:
+                    f.write('\n'.join(accepted) + '\n')
+        return results
+
+class HttpGateway:
+    """Provider endpoint taking {"messages": [...]} and answering {"results": [{"id", "error"}]}"""
+
+    def __init__(self, url, timeout=HTTP_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, messages):
+        request = urllib.request.Request(self.url, data=json.dumps({'messages': messages}).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            answer = json.load(response)
+        errors = {result['id']: result.get('error') for result in answer.get('results', [])}
+        return {message['id']: errors[message['id']] if message['id'] in errors else 'No result from provider'
+                for message in messages}
+
+_gateways = {}
+
+def gateway(channel):
+    if channel not in _gateways:
+        url = PROVIDERS[channel]['url']
+        _gateways[channel] = HttpGateway(url) if url else LocalGateway(channel)
+    return _gateways[channel]
+
+def _count(channel, **counters):
+    with _metrics_lock:
+        metrics = METRICS.setdefault(channel, {'batches': 0, 'sent': 0, 'failed': 0, 'deferred': 0,
+                                               'coalesced': 0, 'gateway_ms': 0.0})
+        for name, value in counters.items():
+            metrics[name] += value
+
+def _send(cursor, channel, rows):
+    """Send rows in provider-sized batches and record the outcome of each"""
+    batch_size = PROVIDERS[channel]['batch_size']
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        started = time.perf_counter()
+        try:
+            results = gateway(channel).send([render(row) for row in batch])
+        except Exception as e:
+            results = {row['id']: f"{type(e).__name__}: {e}" for row in batch}
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        sent = [row['id'] for row in batch if results.get(row['id']) is None]
+        if sent:
+            placeholders = ', '.join(['%s'] * len(sent))
+            cursor.execute(f"""
+                UPDATE notifications SET status = 'sent', attempts = attempts + 1, sent_at = NOW(3)
+                WHERE id IN ({placeholders})
+            """, sent)
+        failed = [row for row in batch if results.get(row['id']) is not None]
+        for row in failed:
+            attempts = row['attempts'] + 1
+            if attempts >= MAX_ATTEMPTS:
+                cursor.execute("""
+                    UPDATE notifications SET status = 'failed', attempts = %s, last_error = %s
+                    WHERE id = %s
+                """, (attempts, results[row['id']][:2000], row['id']))
+            else:
+                cursor.execute("""
+                    UPDATE notifications
+                    SET attempts = %s, last_error = %s, next_attempt_at = NOW(3) + INTERVAL %s SECOND
+                    WHERE id = %s
+                """, (attempts, results[row['id']][:2000], jobs.backoff(attempts), row['id']))
+        _count(channel, batches=1, sent=len(sent), failed=len(failed), gateway_ms=elapsed_ms)
+
+def deliver(conn, limit=BATCH_LIMIT):
+    """One delivery run on this connection's shard; the caller commits"""
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT id, source, record_id, event, channel, recipient, reference, full_names, attempts
+        FROM notifications
+        WHERE status = 'pending' AND next_attempt_at <= NOW(3)
+        ORDER BY next_attempt_at, id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    """, (limit,))
+    rows = cursor.fetchall()
+
+    wait = 0.0
+    if rows:
+        keys = sorted({(row['source'], row['record_id'], row['channel']) for row in rows})
+        cursor.execute(f"""
+            SELECT source, record_id, channel, MAX(id) AS latest
+            FROM notifications
+            WHERE status <> 'coalesced' AND (source, record_id, channel) IN ({', '.join(['(%s, %s, %s)'] * len(keys))})
+            GROUP BY source, record_id, channel
+        """, [value for key in keys for value in key])
+        latest = {(row['source'], row['record_id'], row['channel']): row['latest'] for row in cursor.fetchall()}
+        channel_of = {row['id']: row['channel'] for row in rows}
+        rows, superseded = supersede(rows, latest)
+        if superseded:
+            cursor.execute(f"""
+                UPDATE notifications SET status = 'coalesced'
+                WHERE id IN ({', '.join(['%s'] * len(superseded))})
+            """, superseded)
+            for row_id in superseded:
+                _count(channel_of[row_id], coalesced=1)
+
+        for channel in PROVIDERS:
+            pending = [row for row in rows if row['channel'] == channel]
+            if not pending:
+                continue
+            granted, retry_after = BUCKETS[channel].take(len(pending))
+            if granted < len(pending):
+                wait = max(wait, retry_after)  # the rest stay pending for the next run
+            _count(channel, deferred=len(pending) - granted)
+            _send(cursor, channel, pending[:granted])
+
+    # Run again when the earliest remaining notification is due
+    cursor.execute("""
+        SELECT TIMESTAMPDIFF(MICROSECOND, NOW(3), MIN(next_attempt_at)) / 1000000 AS due_in
+        FROM notifications WHERE status = 'pending'
+    """)
+    due_in = cursor.fetchone()['due_in']
+    if due_in is not None:
+        jobs.enqueue_once(cursor, DELIVER_JOB, delay=max(0.0, float(due_in), wait))
+    cursor.close()
+    return len(rows)
+
+def stats():
+    """Counts by channel and status, and sent-minus-queued delay over the last day, across shards"""
+    def collect(conn, shard):
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT channel, status, COUNT(*) AS n FROM notifications GROUP BY channel, status")
+        counts = cursor.fetchall()
+        cursor.execute("""
+            SELECT TIMESTAMPDIFF(MICROSECOND, created_at, sent_at) / 1000 AS delay_ms
+            FROM notifications WHERE sent_at >= NOW(3) - INTERVAL 1 DAY
+            ORDER BY sent_at DESC LIMIT 10000
+        """)
+        delays = [float(row['delay_ms']) for row in cursor.fetchall()]
+        cursor.close()
+        return counts, delays
+
+    counts = {}
+    delays = []
+    for shard_counts, shard_delays in shards.scatter(collect):
+        for row in shard_counts:
+            channel = counts.setdefault(row['channel'], {})
+            channel[row['status']] = channel.get(row['status'], 0) + row['n']
+        delays.extend(shard_delays)
+    delays.sort()
+    result = {'counts': counts, 'sent_last_day': len(delays)}
+    if delays:
+        result['delay_p50_ms'] = delays[len(delays) // 2]
+        result['delay_p95_ms'] = delays[min(len(delays) - 1, int(len(delays) * 0.95))]
+    return result
+
+def purge(days=30, batch_size=5000):
+    """Delete sent, failed and coalesced notifications older than `days` on every shard"""
+    def run(conn, shard):
+        cursor = conn.cursor()
+        total = 0
+        while True:
+            cursor.execute("""
+                DELETE FROM notifications
+                WHERE status <> 'pending' AND created_at < NOW(3) - INTERVAL %s DAY
+                LIMIT %s
+            """, (days, batch_size))
+            conn.commit()
+            total += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+        cursor.close()
+        return total
+    return sum(shards.scatter(run, read=False))
+
+def self_check():
+    """Templates, coalescing, token buckets and the local gateway, without a database"""
+    row = {'id': 1, 'source': 'lost_id', 'record_id': 7, 'event': 'ready_for_collection', 'channel': 'email',
+           'recipient': 'a@example.com', 'reference': 'WAIT2024000007', 'full_names': 'Achieng Otieno'}
+    message = render(row)
+    assert message['text'].startswith('Dear Achieng Otieno, your replacement ID card (WAIT2024000007)')
+    assert message['subject'] == 'Update on your ID application WAIT2024000007'
+    assert 'subject' not in render({**row, 'channel': 'sms', 'full_names': None})
+    assert all((source, event) in TEMPLATES for source in _NOTIFY_SQL for event in EVENTS)
+
+    rows = [{'id': i, 'source': 'application', 'record_id': record, 'channel': channel}
+            for i, (record, channel) in enumerate([(1, 'sms'), (1, 'sms'), (1, 'email'), (2, 'sms')], 1)]
+    keep, superseded = supersede(rows, {('application', 1, 'sms'): 2, ('application', 1, 'email'): 3,
+                                        ('application', 2, 'sms'): 9})
+    assert [r['id'] for r in keep] == [2, 3] and superseded == [1, 4], (keep, superseded)
+
+    bucket = TokenBucket(rate=100, burst=10)
+    granted, wait = bucket.take(25)
+    assert granted == 10 and 0 < wait <= 0.01, (granted, wait)
+    time.sleep(0.05)
+    assert 4 <= bucket.take(25)[0] <= 6
+
+    with tempfile.TemporaryDirectory() as tmp:
+        local = LocalGateway('sms', latency=0, failure_rate=0, outbox=tmp)
+        results = local.send([render({**row, 'id': i, 'channel': 'sms'}) for i in range(3)])
+        assert results == {0: None, 1: None, 2: None}
+        with open(os.path.join(tmp, 'sms.jsonl')) as f:
+            assert len(f.readlines()) == 3
+    return 'templates, coalescing, token bucket, local gateway'
+
+def benchmark(messages=2000, latency=0.005):
+    """Send time through the local gateway one message per call vs in provider-sized batches"""
+    rows = [{'id': i, 'source': 'application', 'record_id': i, 'event': 'approved', 'channel': 'sms',
+             'recipient': f"07{i:08d}", 'reference': f"APP2024{i:06d}", 'full_names': 'Bench Citizen'}
+            for i in range(messages)]
+    batch_size = PROVIDERS['sms']['batch_size']
+    with tempfile.TemporaryDirectory() as tmp:
+        local = LocalGateway('sms', latency=latency, failure_rate=0, outbox=tmp)
+        started = time.perf_counter()
+        for row in rows:
+            local.send([render(row)])
+        single = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for start in range(0, messages, batch_size):
+            local.send([render(row) for row in rows[start:start + batch_size]])
+        batched = time.perf_counter() - started
+    return {'messages': messages, 'latency_ms': latency * 1000, 'batch_size': batch_size,
+            'single_per_s': messages / single, 'batched_per_s': messages / batched}
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        if command == "stats":
+            print(json.dumps(stats(), indent=2))
+        elif command == "deliver":
+            def run(conn, shard):
+                taken = deliver(conn)
+                conn.commit()
+                return taken
+            print(f"Processed {sum(shards.scatter(run, read=False))} notifications")
+            print(json.dumps(METRICS, indent=2))
+        elif command == "purge":
+            print(f"Purged {purge(int(sys.argv[2]) if len(sys.argv) > 2 else 30)} notifications")
+        elif command == "check":
+            print(f"OK: {self_check()}")
+        elif command == "bench":
+            result = benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
+            print(f"{result['messages']} messages, {result['latency_ms']:.0f}ms per gateway call: "
+                  f"one at a time {result['single_per_s']:.0f}/s | "
+                  f"batches of {result['batch_size']} {result['batched_per_s']:.0f}/s")
+        else:
+            print(__doc__)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,45 @@
+-- Citizen notifications: run once on databases created before notifications.py
+USE digital_id_system;
+
+-- Contact details captured at submission; both optional
+ALTER TABLE applications
+    ADD COLUMN phone_number VARCHAR(20) NULL AFTER occupation,
+    ADD COLUMN email VARCHAR(100) NULL AFTER phone_number;
+ALTER TABLE lost_id_applications
+    ADD COLUMN phone_number VARCHAR(20) NULL AFTER payment_amount,
+    ADD COLUMN email VARCHAR(100) NULL AFTER phone_number;
+
+-- Keep the archive copies in step (archive.py moves rows with INSERT ... SELECT *)
+ALTER TABLE applications_archive
+    ADD COLUMN phone_number VARCHAR(20) NULL AFTER occupation,
+    ADD COLUMN email VARCHAR(100) NULL AFTER phone_number;
+ALTER TABLE lost_id_applications_archive
+    ADD COLUMN phone_number VARCHAR(20) NULL AFTER payment_amount,
+    ADD COLUMN email VARCHAR(100) NULL AFTER phone_number;
+
+-- M-Pesa payers already left a number; use it for their lost-ID case
+UPDATE lost_id_applications l
+JOIN payments p ON p.lost_id_application_id = l.id
+SET l.phone_number = p.payer_phone
+WHERE l.phone_number IS NULL AND p.payer_phone IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS notifications (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    source ENUM('application', 'lost_id') NOT NULL,
+    record_id INT NOT NULL,
+    event ENUM('approved', 'dispatched', 'ready_for_collection') NOT NULL,
+    channel ENUM('sms', 'email') NOT NULL,
+    recipient VARCHAR(100) NOT NULL,
+    reference VARCHAR(50) NOT NULL,
+    full_names VARCHAR(100) NULL,
+    status ENUM('pending', 'sent', 'failed', 'coalesced') NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    last_error TEXT NULL,
+    created_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    sent_at DATETIME(3) NULL,
+    
+    INDEX idx_notifications_due (status, next_attempt_at),
+    INDEX idx_notifications_record (source, record_id, channel),
+    INDEX idx_notifications_sent (sent_at)
+);
@@ -0,0 +1,408 @@
+"""
+Officer routes: officer accounts, application capture (single and offline
+batch), search and the officer dashboard
+"""
+
+from flask import Blueprint, request, jsonify, current_app, g
+from werkzeug.security import generate_password_hash, check_password_hash
+import jwt
+from datetime import datetime, timedelta
+from functools import wraps
+import os
+import applications
+import archive
+import batch_sync
+import geography
+import http_cache
+import jobs
+import notifications
+import queries
+import search
+import shards
+import uploads
+from http_cache import conditional
+from idempotency import idempotent
+from db import get_db_connection
+
+officer_bp = Blueprint('officer', __name__)
+
+def officer_required(view):
+    """Route decorator: require an officer JWT (from /api/officer/login) and set g.officer_id"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        auth = request.headers.get('Authorization', '')
+        try:
+            claims = jwt.decode(auth[7:], current_app.config['SECRET_KEY'], algorithms=['HS256'])
+        except jwt.InvalidTokenError:
+            claims = {}
+        if not auth.startswith('Bearer ') or claims.get('role') != 'officer':
+            return jsonify({'error': 'Officer login required'}), 401
+        g.officer_id = claims['officer_id']
+        return view(*args, **kwargs)
+    return wrapper
+
+@officer_bp.route('/api/officer/signup', methods=['POST'])
+def officer_signup():
+    try:
+        data = request.get_json()
+        
+        # Validate required fields
+        required_fields = ['idNumber', 'email', 'phoneNumber', 'fullName', 'station', 'password']
+        for field in required_fields:
+            if not data.get(field):
+                return jsonify({'error': f'{field} is required'}), 400
+        
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        # Check if officer already exists
+        cursor.execute("SELECT id FROM officers WHERE id_number = %s OR email = %s", 
+                      (data['idNumber'], data['email']))
+        if cursor.fetchone():
+            return jsonify({'error': 'Officer with this ID number or email already exists'}), 400
+        
+        # Hash password
+        hashed_password = generate_password_hash(data['password'])
+        
+        # Insert new officer (pending approval)
+        cursor.execute("""
+            INSERT INTO officers (id_number, email, phone_number, full_name, station, password_hash, status, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, 'pending', %s)
+        """, (data['idNumber'], data['email'], data['phoneNumber'], 
+              data['fullName'], data['station'], hashed_password, datetime.now()))
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        return jsonify({'message': 'Application submitted successfully. Awaiting admin approval.'}), 201
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@officer_bp.route('/api/officer/login', methods=['POST'])
+def officer_login():
+    try:
+        data = request.get_json()
+        email = data.get('email')
+        password = data.get('password')
+        
+        if not email or not password:
+            return jsonify({'error': 'Email and password are required'}), 400
+        
+        conn = get_db_connection()
+        
+        # Get officer details
+        officer = queries.fetchone(conn, 'officer_login', (email,))
+        
+        conn.close()
+        
+        if not officer:
+            return jsonify({'error': 'Invalid credentials'}), 401
+        
+        if officer['status'] != 'approved':
+            return jsonify({'error': 'Account not approved by admin'}), 403
+        
+        if not check_password_hash(officer['password_hash'], password):
+            return jsonify({'error': 'Invalid credentials'}), 401
+        
+        # Generate JWT token
+        token = jwt.encode({
+            'officer_id': officer['id'],
+            'email': officer['email'],
+            'role': 'officer',
+            'exp': datetime.utcnow() + timedelta(hours=24)
+        }, current_app.config['SECRET_KEY'], algorithm='HS256')
+        
+        return jsonify({
+            'token': token,
+            'officer': {
+                'id': officer['id'],
+                'email': officer['email'],
+                'fullName': officer['full_name'],
+                'station': officer['station']
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@officer_bp.route('/api/applications', methods=['POST'])
+@idempotent
+def submit_application():
+    try:
+        print("Received request:", request.method, request.content_type)
+        
+        # Check content type
+        if request.content_type and 'application/json' in request.content_type:
+            # Handle JSON data
+            data = request.get_json()
+            files = {}
+            print("Processing JSON data:", list(data.keys()) if data else "No data")
+        else:
+            # Handle form data with files
+            data = request.form.to_dict()
+            files = request.files
+            print("Processing form data:", list(data.keys()) if data else "No data")
+        
+        # Validate required fields
+        missing_fields = applications.missing_fields(data)
+        if missing_fields:
+            print("Missing required fields:", missing_fields)
+            return jsonify({'error': f'Missing required fields: {", ".join(missing_fields)}'}), 400
+        
+        # Canonical place names, so grouping and shard routing see one spelling (see geography.py)
+        geography.normalize_form(data)
+        
+        # Documents sent ahead through resumable uploads (see uploads.py)
+        upload_ids = uploads.parse_upload_ids(data.get('uploads'), applications.DOCUMENT_TYPES)
+        uploads.check_complete(upload_ids)
+        
+        # Get officer ID from token (you'd normally verify JWT here)
+        officer_id = 1  # Temporary - should get from JWT token
+        
+        # Applications live on the shard of their home district (see shards.py)
+        shard = shards.shard_for_district(data['homeDistrict'])
+        conn = shards.connection(shard)
+        cursor = conn.cursor()
+        
+        # Get current count for application number
+        # Archived applications still hold their numbers (see archive.py)
+        application_number = shards.application_number(
+            shard, archive.next_sequence(cursor, 'applications'))
+        
+        print(f"Generated application number: {application_number}")
+        
+        # Blocking key for duplicate detection (see dedup.py)
+        dedup_key = applications.dedup_key(data)
+        
+        # Insert application
+        cursor.execute(applications.INSERT_SQL,
+                       applications.insert_params(data, application_number, officer_id, dedup_key))
+        
+        application_id = cursor.lastrowid
+        
+        # Duplicate detection runs in the background (see jobs.py); flags show up for admin review
+        jobs.enqueue(cursor, 'find_duplicates', {'application_id': application_id})
+        
+        # Handle file uploads (only if files were sent)
+        os.makedirs(applications.UPLOAD_DIR, exist_ok=True)
+        
+        for file_key, file in files.items():
+            if file and file.filename:
+                file_path = applications.upload_path(application_number, file_key, file.filename)
+                file.save(file_path)
+                
+                doc_type = applications.DOCUMENT_TYPES.get(file_key, file_key)
+                
+                # Insert document record
+                cursor.execute("""
+                    INSERT INTO documents (application_id, document_type, file_path)
+                    VALUES (%s, %s, %s)
+                """, (application_id, doc_type, file_path))
+        
+        for file_key, upload_id in upload_ids.items():
+            file_path = applications.upload_path(application_number, file_key,
+                                                 uploads.load_session(upload_id)['filename'])
+            sha256 = uploads.finalize(upload_id, file_path)
+            cursor.execute("""
+                INSERT INTO documents (application_id, document_type, file_path, sha256)
+                VALUES (%s, %s, %s, %s)
+            """, (application_id, applications.DOCUMENT_TYPES.get(file_key, file_key), file_path, sha256))
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        return jsonify({
+            'message': 'Application submitted successfully',
+            'applicationNumber': application_number
+        }), 201
+        
+    except geography.GeographyError as e:
+        return jsonify({'error': str(e), 'field': e.field, 'suggestions': e.suggestions}), 400
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@officer_bp.route('/api/geography/suggest', methods=['GET'])
+def suggest_place():
+    """Autocomplete for a place field; the parent fields already filled in narrow it down"""
+    try:
+        field = request.args.get('field', '')
+        limit = min(int(request.args.get('limit', geography.SUGGESTION_LIMIT)), 50)
+        suggestions = geography.autocomplete(field, request.args.get('q', ''), request.args, limit)
+        return jsonify({'field': field, 'suggestions': suggestions}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@officer_bp.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """Open a resumable upload session for one document"""
+    try:
+        data = request.get_json(silent=True) or {}
+        meta = uploads.create_session(data.get('filename'), data.get('size'), data.get('sha256'),
+                                      data.get('officerId'))
+        return jsonify({
+            'uploadId': meta['uploadId'],
+            'chunkSize': meta['chunkSize'],
+            'totalChunks': uploads.total_chunks(meta)
+        }), 201
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@officer_bp.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def upload_chunk(upload_id, index):
+    """Store one chunk; the length is checked before the body is read"""
+    try:
+        if request.content_length is None:
+            return jsonify({'error': 'Content-Length required'}), 411
+        uploads.check_chunk_request(uploads.load_session(upload_id), index, request.content_length)
+        length = uploads.write_chunk(upload_id, index, request.get_data(cache=False),
+                                     request.headers.get(uploads.CHUNK_CHECKSUM_HEADER))
+        return jsonify({'uploadId': upload_id, 'index': index, 'bytes': length}), 200
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@officer_bp.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload_status(upload_id):
+    """Received and missing chunks, so an interrupted upload can resume"""
+    try:
+        return jsonify(uploads.status(upload_id)), 200
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@officer_bp.route('/api/officer/applications/batch', methods=['POST'])
+@officer_required  # before @idempotent, so a refused request does not use up its key
+@idempotent
+def sync_application_batch():
+    """Submit many applications captured offline in one request"""
+    try:
+        # Documents come from the multipart parts, or inline in NDJSON records
+        files = None
+        if request.mimetype == 'multipart/form-data':
+            records, files = batch_sync.parse_multipart(request.form, request.files)
+        else:
+            records = batch_sync.parse_ndjson(request.get_data(as_text=True))
+        
+        if not records:
+            return jsonify({'error': 'No records in batch'}), 400
+        
+        results = batch_sync.sync(records, g.officer_id, files)
+        
+        created = sum(1 for result in results if result['status'] == 'created')
+        print(f"Batch sync: {created}/{len(records)} applications created")
+        
+        return jsonify({
+            'created': created,
+            'failed': len(results) - created,
+            'results': results
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@officer_bp.route('/api/search', methods=['GET'])
+def search_people():
+    """Ranked, paginated name/location search over applicants and citizens"""
+    try:
+        text = search.normalize_query(request.args.get('q'))
+        page, page_size = search.parse_paging(request.args.get('page'),
+                                              request.args.get('page_size'))
+        scope = request.args.get('scope', 'all')
+        
+        results, has_more = search.search_shards(text, scope, page, page_size)
+        
+        return jsonify({
+            'results': results,
+            'page': page,
+            'pageSize': page_size,
+            'hasMore': has_more
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@officer_bp.route('/api/officer/applications', methods=['GET'])
+@conditional(http_cache.officer_applications_fingerprint)
+def get_officer_applications():
+    try:
+        # In a real app, get officer_id from JWT token
+        officer_id = request.args.get('officer_id', 1)
+        
+        # Regular and lost ID (renewal) applications, newest first, from every shard
+        all_applications = shards.select_all("""
+            SELECT id, application_number, full_names, status, created_at, 
+                   updated_at, generated_id_number, 'regular' as application_type,
+                   'regular' as source_type
+            FROM applications 
+            WHERE officer_id = %s 
+            UNION ALL
+            SELECT lia.id, lia.waiting_card_number, c.full_names, lia.status, lia.created_at,
+                   lia.updated_at, lia.citizen_id_number, 'renewal', 'lost_id'
+            FROM lost_id_applications lia
+            LEFT JOIN citizens c ON lia.citizen_id_number = c.id_number
+            WHERE lia.officer_id = %s
+            ORDER BY created_at DESC
+        """, (officer_id, officer_id), order_by='created_at')
+        
+        return jsonify(all_applications), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@officer_bp.route('/api/officer/applications/<int:application_id>/card-arrived', methods=['PUT'])
+def mark_card_arrived(application_id):
+    try:
+        conn = shards.connection_for_id(application_id)
+        
+        updated = queries.execute(conn, 'application_card_arrived', (application_id,))
+        
+        if updated == 0:
+            conn.close()
+            return jsonify({'error': 'Application not found or not in dispatched status'}), 404
+        
+        # Tell the applicant; sent in the background (see notifications.py)
+        cursor = conn.cursor()
+        notifications.notify(cursor, 'application', application_id, 'ready_for_collection')
+        cursor.close()
+        
+        conn.commit()
+        conn.close()
+        
+        return jsonify({'message': 'Card arrival confirmed'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@officer_bp.route('/api/officer/applications/<int:application_id>/card-collected', methods=['PUT'])
+def mark_card_collected(application_id):
+    try:
+        conn = shards.connection_for_id(application_id)
+        
+        updated = queries.execute(conn, 'application_card_collected', (application_id,))
+        
+        if updated == 0:
+            conn.close()
+            return jsonify({'error': 'Application not found or card not arrived yet'}), 404
+        
+        conn.commit()
+        conn.close()
+        
+        return jsonify({'message': 'Card collection confirmed'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Opt-in statistical profiling of API requests.
+
+A request is profiled when it is picked by PROFILE_SAMPLE_RATE (0 by
+default, i.e. never), or when it carries `X-Profile: 1` together with an
+admin bearer token. While profiled requests are in flight, one background
+thread reads their stacks with sys._current_frames() every
+PROFILE_INTERVAL_MS and counts them per route. The request thread itself
+runs untraced, so even profiled requests pay almost nothing. With
+profiling disabled, the cost per request is one header lookup.
+
+Stacks are kept in collapsed form (`frame;frame;frame count`, route as
+the root frame). That is the input format of flamegraph.pl and
+speedscope, served by GET /api/admin/profile/collapsed in every tier
+(app.py), each for the requests its own workers handled.
+
+Run this script from terminal to measure the sampler's overhead:
+    python profiling.py bench
+"""
+
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+
+import jwt
+from flask import request, g, current_app
+
+SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+INTERVAL = float(os.environ.get('PROFILE_INTERVAL_MS', 5)) / 1000
+PROFILE_HEADER = 'X-Profile'
+MAX_DEPTH = 64
+MAX_STACKS_PER_ROUTE = 5000  # distinct stacks kept per route; the rest are counted as [other]
+
+def is_admin_request():
+    """True when the request carries a valid admin JWT"""
+    auth = request.headers.get('Authorization', '')
+    if not auth.startswith('Bearer '):
+        return False
+    try:
+        claims = jwt.decode(auth[7:], current_app.config['SECRET_KEY'], algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return False
+    return claims.get('role') == 'admin'
+
+class Sampler:
+    """Samples the stacks of registered threads from one background thread"""
+
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.targets = {}            # thread ident -> route being profiled
+        self.stacks = {}             # route -> Counter of collapsed stacks
+        self.requests = Counter()    # route -> profiled requests
+        self.samples = 0
+        self._labels = {}            # code object -> frame label
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def begin(self, route):
+        with self._lock:
+            self.targets[threading.get_ident()] = route
+            self.requests[route] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def end(self):
+        with self._lock:
+            self.targets.pop(threading.get_ident(), None)
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.requests.clear()
+            self.samples = 0
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _collapse(self, frame):
+        labels = []
+        while frame is not None and len(labels) < MAX_DEPTH:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                idle = not self.targets
+                if idle:
+                    self._wake.clear()
+            if idle:
+                self._wake.wait()
+                continue
+            time.sleep(self.interval)
+
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, route in self.targets.items():
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    stacks = self.stacks.setdefault(route, Counter())
+                    stack = self._collapse(frame)
+                    if stack not in stacks and len(stacks) >= MAX_STACKS_PER_ROUTE:
+                        stack = '[other]'
+                    stacks[stack] += 1
+                    self.samples += 1
+            del frames
+
+    def summary(self):
+        with self._lock:
+            return {
+                'interval_ms': self.interval * 1000,
+                'sample_rate': SAMPLE_RATE,
+                'samples': self.samples,
+                'routes': [{'route': route, 'requests': self.requests[route],
+                            'samples': sum(self.stacks.get(route, {}).values())}
+                           for route in sorted(self.requests)]
+            }
+
+    def collapsed(self, route=None):
+        """Collapsed-stack text for one route, or all routes with the route as root frame"""
+        with self._lock:
+            lines = []
+            for name, stacks in sorted(self.stacks.items()):
+                if route is not None and name != route:
+                    continue
+                lines.extend(f"{name};{stack} {count}" for stack, count in stacks.most_common())
+        return '\n'.join(lines) + '\n' if lines else ''
+
+def init_app(app, sampler=None):
+    """Profile sampled or admin-requested requests"""
+    sampler = sampler or Sampler()
+
+    @app.before_request
+    def start_profile():
+        if request.headers.get(PROFILE_HEADER) == '1':
+            if not is_admin_request():
+                return None
+        elif not SAMPLE_RATE or random.random() >= SAMPLE_RATE:
+            return None
+        route = request.url_rule.rule if request.url_rule else request.path
+        sampler.begin(f"{request.method} {route}")
+        g.profiled = True
+        return None
+
+    @app.teardown_request
+    def stop_profile(exc):
+        if g.pop('profiled', False):
+            sampler.end()
+
+    app.extensions['profiling'] = sampler
+    return sampler
+
+def _busy(seconds):
+    # Stand-in for request work: string building plus dict churn
+    deadline = time.perf_counter() + seconds
+    rows = 0
+    while time.perf_counter() < deadline:
+        rows += len({str(i): i for i in range(200)})
+    return rows
+
+def benchmark(seconds=0.5, repetitions=15):
+    """
+    Work done per `seconds` with and without the sampler watching the
+    thread. Unprofiled and profiled runs are interleaved, alternating which
+    goes first, so machine drift hits both alike. Returns per-pair overhead
+    percentages with their median and spread.
+    """
+    sampler = Sampler()
+    _busy(seconds)  # warm up
+    overheads = []
+    for repetition in range(repetitions):
+        runs = {}
+        for profiled in ((False, True) if repetition % 2 == 0 else (True, False)):
+            if profiled:
+                sampler.begin('bench')
+            runs[profiled] = _busy(seconds)
+            if profiled:
+                sampler.end()
+        overheads.append((runs[False] - runs[True]) / runs[False] * 100)
+    ordered = sorted(overheads)
+    return {'overheads_pct': overheads,
+            'median_pct': statistics.median(ordered),
+            'p25_pct': ordered[len(ordered) // 4],
+            'p75_pct': ordered[(len(ordered) * 3) // 4],
+            'min_pct': ordered[0], 'max_pct': ordered[-1],
+            'samples': sampler.samples}
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        stats = benchmark()
+        print(f"{stats['samples']} samples at {INTERVAL * 1000:.0f}ms intervals | "
+              f"throughput overhead median {stats['median_pct']:.1f}% "
+              f"(IQR {stats['p25_pct']:.1f}% to {stats['p75_pct']:.1f}%, "
+              f"range {stats['min_pct']:.1f}% to {stats['max_pct']:.1f}%) "
+              f"over {len(stats['overheads_pct'])} interleaved pairs")
+    else:
+        print(__doc__)
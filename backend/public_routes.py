@@ -0,0 +1,105 @@
+"""
+Public tracking routes. They are read-only and unauthenticated, and take
+most of the traffic, so they can run as their own process group.
+
+Lookups are retried on transient database failures, and the last good
+answer per number is kept so that, while the database is unavailable,
+a tracking request can still be answered (marked stale) instead of
+failing (see resilience.py). Every number names the shard that holds it
+(see shards.py), so a lookup reads one shard.
+"""
+
+from datetime import datetime
+
+import mysql.connector
+from flask import Blueprint, jsonify
+import archive
+import queries
+import resilience
+import shards
+from db import run_read
+
+public_bp = Blueprint('public', __name__)
+
+TRACKING_CACHE = resilience.TrackingCache()
+
+def _stale_response(key, error):
+    """Cached answer for `key` when the database failed, or the 503 to send instead"""
+    cached = TRACKING_CACHE.get(key)
+    if cached is None:
+        response = jsonify({'error': 'Tracking is temporarily unavailable, please try again shortly'})
+        response.headers['Retry-After'] = str(int(resilience.COOLDOWN))
+        return response, 503
+    application, stored_at = cached
+    print(f"Serving cached tracking result for {key}: {error}")
+    return jsonify({
+        'application': application,
+        'stale': True,
+        'asOf': datetime.fromtimestamp(stored_at)
+    }), 200
+
+def _find_application(conn, application_number):
+    # First, try to find in regular applications (prepared statements, see queries.py)
+    application = queries.fetchone(conn, 'track_application', (application_number,))
+    
+    # If not found in regular applications, check lost_id_applications using waiting card number
+    if not application:
+        application = queries.fetchone(conn, 'track_lost_id_as_application', (application_number,))
+    
+    # Collected and rejected applications may have been archived
+    if not application:
+        cursor = conn.cursor(dictionary=True)
+        application = archive.find_archived_application(cursor, application_number)
+        cursor.close()
+    return application
+
+def _find_lost_id(conn, waiting_card_number):
+    application = queries.fetchone(conn, 'track_lost_id', (waiting_card_number,))
+    if not application:
+        cursor = conn.cursor(dictionary=True)
+        application = archive.find_archived_lost_id(cursor, waiting_card_number)
+        cursor.close()
+    return application
+
+@public_bp.route('/api/applications/track/<application_number>', methods=['GET'])
+def track_application(application_number):
+    key = f"application:{application_number}"
+    try:
+        shard = shards.shard_for_number(application_number)
+        application = run_read(lambda conn: _find_application(conn, application_number),
+                               lambda: shards.read_connection(shard))
+        
+        if not application:
+            return jsonify({'error': 'Application not found'}), 404
+        
+        TRACKING_CACHE.put(key, application)
+        return jsonify({'application': application}), 200
+        
+    except mysql.connector.Error as e:
+        if isinstance(e, resilience.DatabaseUnavailable) or resilience.is_transient(e):
+            return _stale_response(key, e)
+        return jsonify({'error': str(e)}), 500
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@public_bp.route('/api/applications/track-lost/<waiting_card_number>', methods=['GET'])
+def track_lost_id_application(waiting_card_number):
+    """Track lost ID application by waiting card number"""
+    key = f"lost_id:{waiting_card_number}"
+    try:
+        shard = shards.shard_for_number(waiting_card_number)
+        application = run_read(lambda conn: _find_lost_id(conn, waiting_card_number),
+                               lambda: shards.read_connection(shard))
+        
+        if not application:
+            return jsonify({'error': 'Application not found'}), 404
+        
+        TRACKING_CACHE.put(key, application)
+        return jsonify({'application': application}), 200
+        
+    except mysql.connector.Error as e:
+        if isinstance(e, resilience.DatabaseUnavailable) or resilience.is_transient(e):
+            return _stale_response(key, e)
+        return jsonify({'error': str(e)}), 500
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
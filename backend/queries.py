@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Registry of the hot SQL statements, run as server-side prepared statements.
+
+Tracking lookups, citizen lookups, officer login and the officer status
+updates account for most statements the API sends. Each is registered
+here once by name. fetchone / fetchall / execute run it through a
+prepared cursor kept in a per-connection StatementCache, so with pooled
+connections (db.py) the server parses and plans each statement once per
+connection instead of once per request.
+
+The cache holds at most STATEMENT_CACHE_SIZE statements per connection
+and closes the least recently used one when full. A statement prepared
+on a connection that has since reconnected no longer exists on the
+server, so the cache notices the new connection id and prepares again.
+
+Run this script from terminal to compare text and prepared execution:
+    python queries.py bench [rounds]
+"""
+
+import os
+import sys
+import time
+from collections import OrderedDict
+
+import mysql.connector
+
+STATEMENT_CACHE_SIZE = int(os.environ.get('STATEMENT_CACHE_SIZE', 16))
+UNKNOWN_STATEMENT = 1243  # ER_UNKNOWN_STMT_HANDLER: the server no longer has the statement
+
+QUERIES = {
+    'track_application': """
+        SELECT application_number, full_names, status, created_at, updated_at
+        FROM applications WHERE application_number = %s
+    """,
+    'track_lost_id_as_application': """
+        SELECT l.waiting_card_number as application_number, c.full_names,
+               l.status, l.created_at, l.updated_at
+        FROM lost_id_applications l
+        LEFT JOIN citizens c ON l.citizen_id_number = c.id_number
+        WHERE l.waiting_card_number = %s
+    """,
+    'track_lost_id': """
+        SELECT lia.waiting_card_number, lia.citizen_id_number, lia.status,
+               lia.created_at, lia.updated_at,
+               a.full_names as citizen_name
+        FROM lost_id_applications lia
+        LEFT JOIN citizens a ON lia.citizen_id_number = a.id_number
+        WHERE lia.waiting_card_number = %s
+    """,
+    'citizen_by_id': """
+        SELECT id_number, full_names, date_of_birth, place_of_birth, gender, nationality
+        FROM citizens WHERE id_number = %s
+    """,
+    'officer_login': """
+        SELECT id, email, full_name, station, password_hash, status
+        FROM officers WHERE email = %s
+    """,
+    'officer_station': """
+        SELECT station FROM officers WHERE id = %s
+    """,
+    # Stage timestamps (analytics.py) copy the new updated_at: a single-table
+    # UPDATE assigns left to right, so `x_at = updated_at` sees the value just set
+    'application_card_arrived': """
+        UPDATE applications
+        SET status = 'ready_for_collection', updated_at = NOW(), ready_at = updated_at
+        WHERE id = %s AND status = 'dispatched'
+    """,
+    'application_card_collected': """
+        UPDATE applications
+        SET status = 'collected', updated_at = NOW(), collected_at = updated_at
+        WHERE id = %s AND (status = 'ready_for_collection' OR (status IN ('', 'dispatched') AND generated_id_number IS NOT NULL))
+    """,
+    'lost_id_card_arrived': """
+        UPDATE lost_id_applications
+        SET status = 'ready_for_collection', updated_at = NOW(), ready_at = updated_at
+        WHERE id = %s AND status = 'dispatched'
+    """,
+    'lost_id_card_collected': """
+        UPDATE lost_id_applications
+        SET status = 'collected', updated_at = NOW(), collected_at = updated_at
+        WHERE id = %s AND status = 'ready_for_collection'
+    """,
+}
+
+class StatementCache:
+    """Prepared cursors of one connection, least recently used first"""
+
+    def __init__(self, capacity=STATEMENT_CACHE_SIZE):
+        self.capacity = capacity
+        self.cursors = OrderedDict()  # query name -> prepared cursor
+        self.connection_id = None
+        self.hits = 0
+        self.prepares = 0
+        self.evictions = 0
+
+    def cursor(self, cnx, name):
+        if cnx.connection_id != self.connection_id:
+            # New session (first use or reconnect): the server has none of our statements
+            self.cursors.clear()
+            self.connection_id = cnx.connection_id
+        cursor = self.cursors.get(name)
+        if cursor is not None:
+            self.cursors.move_to_end(name)
+            self.hits += 1
+            return cursor
+
+        cursor = cnx.cursor(prepared=True, dictionary=True)
+        self.cursors[name] = cursor
+        self.prepares += 1
+        if len(self.cursors) > self.capacity:
+            _, evicted = self.cursors.popitem(last=False)
+            evicted.close()  # deallocates the statement on the server
+            self.evictions += 1
+        return cursor
+
+    def discard(self, name):
+        self.cursors.pop(name, None)
+
+def _statement_cache(conn):
+    # Pooled connections are wrappers; the cache belongs to the physical connection underneath
+    cnx = getattr(conn, '_cnx', None) or conn
+    cache = getattr(cnx, 'statement_cache', None)
+    if cache is None:
+        cache = cnx.statement_cache = StatementCache()
+    return cnx, cache
+
+def _run(conn, name, params):
+    cnx, cache = _statement_cache(conn)
+    # The prepared cursor only re-prepares when handed a different string object,
+    # so the registry's own string is what gets passed every time
+    sql = QUERIES[name]
+    cursor = cache.cursor(cnx, name)
+    try:
+        cursor.execute(sql, params)
+    except mysql.connector.Error as e:
+        if e.errno != UNKNOWN_STATEMENT:
+            raise
+        cache.discard(name)
+        cursor = cache.cursor(cnx, name)
+        cursor.execute(sql, params)
+    return cursor
+
+def fetchall(conn, name, params=()):
+    """Rows of a registered SELECT as dicts"""
+    return _run(conn, name, params).fetchall()
+
+def fetchone(conn, name, params=()):
+    """First row of a registered SELECT as a dict, or None"""
+    # Read every row so the cached cursor is free for the next statement
+    rows = fetchall(conn, name, params)
+    return rows[0] if rows else None
+
+def execute(conn, name, params=()):
+    """Run a registered INSERT/UPDATE/DELETE; returns the affected row count"""
+    return _run(conn, name, params).rowcount
+
+def cache_stats(conn):
+    _, cache = _statement_cache(conn)
+    return {'cached': list(cache.cursors), 'hits': cache.hits, 'prepares': cache.prepares,
+            'evictions': cache.evictions}
+
+def benchmark(conn, rounds=2000):
+    """Per-statement latency of the registered lookups as text SQL and as cached prepared statements"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT application_number FROM applications ORDER BY id DESC LIMIT 1")
+    row = cursor.fetchone()
+    number = row[0] if row else 'APP2024000001'
+    cursor.execute("SELECT id_number FROM citizens ORDER BY id DESC LIMIT 1")
+    row = cursor.fetchone()
+    id_number = row[0] if row else '00000000'
+    cursor.execute("SELECT email FROM officers ORDER BY id LIMIT 1")
+    row = cursor.fetchone()
+    email = row[0] if row else 'officer@example.com'
+
+    lookups = [('track_application', (number,)), ('track_lost_id', (number,)),
+               ('citizen_by_id', (id_number,)), ('officer_login', (email,))]
+    results = []
+    for name, params in lookups:
+        started = time.perf_counter()
+        for _ in range(rounds):
+            cursor.execute(QUERIES[name], params)
+            cursor.fetchall()
+        text_us = (time.perf_counter() - started) / rounds * 1e6
+
+        fetchall(conn, name, params)  # prepare outside the timed loop
+        started = time.perf_counter()
+        for _ in range(rounds):
+            fetchall(conn, name, params)
+        prepared_us = (time.perf_counter() - started) / rounds * 1e6
+        results.append({'query': name, 'text_us': text_us, 'prepared_us': prepared_us})
+    cursor.close()
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        from db import get_db_connection
+        try:
+            conn = get_db_connection()
+            rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+            for row in benchmark(conn, rounds):
+                saved = (1 - row['prepared_us'] / row['text_us']) * 100
+                print(f"{row['query']:<28} text {row['text_us']:>7.1f}us | "
+                      f"prepared {row['prepared_us']:>7.1f}us | {saved:.0f}% saved")
+            print(cache_stats(conn))
+            conn.close()
+        except Exception as e:
+            print(f"Error: {e}")
+    else:
+        print(__doc__)
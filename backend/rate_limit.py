@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Rate limiting and admission control for the API.
+
+Every request is put in a route class (public, officer or admin). Each
+client IP gets a token bucket per class, so a scraper hammering the public
+tracking routes runs out of tokens without affecting anyone else. Buckets
+live in process memory by default, so each worker limits on its own. Set
+RATE_LIMIT_REDIS_URL to share them between workers through RedisBackend,
+which also accepts any redis-py compatible client, so a local redis or
+fakeredis can stand in during development.
+
+On top of that, admission control caps the number of requests in flight.
+Public requests are only admitted while the server is below PUBLIC_SHARE
+of that cap, so under overload public traffic is shed first and officers
+and admins keep working.
+
+Behind reverse proxies, set RATE_LIMIT_TRUST_PROXY to how many of them
+there are, so buckets are keyed by the forwarded client address. Leave it
+unset when clients can reach the API directly, or they could choose their
+own address with X-Forwarded-For.
+
+Run this script from terminal for a microbenchmark of the per-request cost:
+    python rate_limit.py bench
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request, jsonify, g
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import startup
+
+def _load_redis():
+    import redis
+    return redis
+
+# Only needed for the shared backend, so imported when a RedisBackend is created
+redis = startup.Lazy('redis', _load_redis)
+
+# (tokens per second, burst size) per route class
+RATE_LIMITS = {
+    'public': (5, 20),
+    'officer': (20, 100),
+    'admin': (20, 100),
+}
+
+MAX_IN_FLIGHT = 64
+PUBLIC_SHARE = 0.5  # public requests are shed once this fraction of MAX_IN_FLIGHT is busy
+
+# Number of our own reverse proxies in front of the API (0 = clients connect directly).
+# With N, ProxyFix takes the client address from the Nth-last X-Forwarded-For entry;
+# without it every client behind the proxy would share the proxy's bucket.
+TRUST_PROXY_HOPS = int(os.environ.get('RATE_LIMIT_TRUST_PROXY', 0))
+
+# Shared bucket store for multi-worker deployments; unset keeps buckets per process
+REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL')
+
+PUBLIC_PREFIXES = ('/api/applications/track', '/api/citizen/')
+
+def route_class(path):
+    if path.startswith(PUBLIC_PREFIXES):
+        return 'public'
+    if path.startswith('/api/admin'):
+        return 'admin'
+    return 'officer'
+
+def client_ip():
+    # remote_addr is the forwarded client address once ProxyFix is installed (init_app)
+    return request.remote_addr or 'unknown'
+
+class MemoryBackend:
+    """Token buckets for a single worker process, least recently used first"""
+
+    MAX_KEYS = 100000
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, burst):
+        """Take one token. Returns (allowed, seconds until a token is available)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                allowed, retry_after = True, 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                allowed, retry_after = False, (1 - tokens) / rate
+            self._buckets.move_to_end(key)
+            # Drop the bucket idle the longest; O(1), so a flood of new addresses stays cheap
+            if len(self._buckets) > self.MAX_KEYS:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    def dump(self):
+        # Monotonic timestamps mean nothing in another process; store how long ago instead
+        now = time.monotonic()
+        with self._lock:
+            return {key: [tokens, now - updated] for key, (tokens, updated) in self._buckets.items()}
+
+    def load(self, state):
+        now = time.monotonic()
+        with self._lock:
+            for key, (tokens, age) in state.items():
+                self._buckets[key] = (tokens, now - age)
+
+class RedisBackend:
+    """Token buckets in Redis, shared by every worker; the update runs atomically in a Lua script"""
+
+    SCRIPT = """
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        local tokens = tonumber(bucket[1]) or burst
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+        local allowed = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+        return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, client=None, url='redis://localhost:6379/0'):
+        if client is None:
+            if redis.get() is None:
+                raise RuntimeError('RedisBackend requires the redis package')
+            client = redis.get().Redis.from_url(url)
+        self._script = client.register_script(self.SCRIPT)
+
+    def consume(self, key, rate, burst):
+        allowed, tokens = self._script(keys=[f"ratelimit:{key}"], args=[rate, burst, time.time()])
+        tokens = float(tokens)
+        return bool(allowed), 0.0 if allowed else (1 - tokens) / rate
+
+class AdmissionController:
+    """Counts requests in flight and refuses new ones past the per-class threshold"""
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, public_share=PUBLIC_SHARE):
+        self.limits = {
+            'public': max(1, int(max_in_flight * public_share)),
+            'officer': max_in_flight,
+            'admin': max_in_flight,
+        }
+        self.in_flight = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def enter(self, klass):
+        with self._lock:
+            if self.in_flight >= self.limits[klass]:
+                self.shed += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+def init_app(app, backend=None, admission=None):
+    """Install the limiter on a Flask app"""
+    if backend is None:
+        backend = RedisBackend(url=REDIS_URL) if REDIS_URL else MemoryBackend()
+    admission = admission or AdmissionController()
+    if TRUST_PROXY_HOPS:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUST_PROXY_HOPS)
+
+    @app.before_request
+    def limit_request():
+        if request.method == 'OPTIONS':  # CORS preflight
+            return None
+        klass = route_class(request.path)
+
+        rate, burst = RATE_LIMITS[klass]
+        allowed, retry_after = backend.consume(f"{klass}:{client_ip()}", rate, burst)
+        if not allowed:
+            response = jsonify({'error': 'Too many requests, please slow down'})
+            response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+            return response, 429
+
+        if not admission.enter(klass):
+            response = jsonify({'error': 'Server is busy, please try again shortly'})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+        g.admitted = True
+        return None
+
+    @app.teardown_request
+    def release_request(exc):
+        if g.pop('admitted', False):
+            admission.leave()
+
+    if isinstance(backend, MemoryBackend):
+        # A recycled worker keeps its clients' buckets instead of granting everyone a fresh burst
+        startup.register_snapshot('rate_limit', backend.dump, backend.load)
+    app.extensions['rate_limit'] = {'backend': backend, 'admission': admission}
+
+def benchmark(iterations=200000):
+    """Per-call cost of the limiter pieces, in microseconds"""
+    backend = MemoryBackend()
+    admission = AdmissionController()
+    results = {}
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        backend.consume(f"public:10.0.{i % 256}.{i % 100}", 1e9, 1e9)
+    results['memory_consume_us'] = (time.perf_counter() - started) / iterations * 1e6
+
+    # More distinct clients than MAX_KEYS, as from a scraper rotating addresses
+    flooded = MemoryBackend()
+    started = time.perf_counter()
+    for i in range(iterations):
+        flooded.consume(f"public:10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}-{i}", 1e-3, 20)
+    results['memory_consume_flood_us'] = (time.perf_counter() - started) / iterations * 1e6
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        route_class('/api/applications/track/APP2024000001')
+    results['route_class_us'] = (time.perf_counter() - started) / iterations * 1e6
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        admission.enter('public')
+        admission.leave()
+    results['admission_us'] = (time.perf_counter() - started) / iterations * 1e6
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        for name, value in benchmark().items():
+            print(f"{name}: {value:.2f}")
+    else:
+        print(__doc__)
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+M-Pesa payment reconciliation.
+
+Lost-ID payments are created `pending` with the waiting card number as the
+M-Pesa account reference (payments.account_reference), plus the payer's
+phone when the officer recorded one. A statement file is read line by line
+and matched against in-memory hash indexes of the pending M-Pesa payments:
+    (amount, account reference)  - the reference the payer typed on the paybill
+    (amount, phone)              - fallback for mistyped references; oldest payment first
+Matches are applied in batches: each batch is written to a temporary table
+and the payments are updated with a single UPDATE ... JOIN. Receipts that
+are already recorded, or repeated earlier in the same file, are skipped,
+so the same statement (or overlapping exports of it) can be fed again.
+
+Statement files are CSV, either the M-Pesa paybill export ("Receipt No.",
+"Completion Time", "Paid In", "A/C No.", "Other Party Info") or the plain
+columns receipt, completed_at, amount, phone, reference. Lines that match
+nothing are written to an unmatched report for finance to follow up.
+
+Payments are stored on the shard of their lost-ID case (shards.py), and
+every shard's pending payments are indexed. A line whose reference is a
+sharded number is matched on that shard only. Any other line (legacy or
+mistyped reference) is tried on each shard in turn until one matches, so
+the phone fallback works for cases on every shard.
+
+Run this script from terminal:
+    python reconcile.py run <statement.csv>            # reconcile a statement file
+    python reconcile.py generate <statement.csv> [n]   # stand-in feed: pending payments plus noise
+    python reconcile.py bench [lines]                  # matching throughput, no database
+"""
+
+import csv
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+APPLY_BATCH = 5000
+REPORT_DIR = 'reconcile_reports'
+
+# Statement header -> field, for the paybill export and the plain format
+STATEMENT_COLUMNS = {
+    'receipt no.': 'receipt', 'receipt': 'receipt',
+    'completion time': 'completed_at', 'completed_at': 'completed_at',
+    'paid in': 'amount', 'amount': 'amount',
+    'other party info': 'phone', 'phone': 'phone',
+    'a/c no.': 'reference', 'reference': 'reference',
+    'transaction status': 'status',
+}
+
+def normalize_phone(value):
+    """Last nine digits of a Kenyan mobile number, so 0712..., 254712... and +254712... agree"""
+    digits = ''.join(ch for ch in (value or '').split(' - ')[0] if ch.isdigit())
+    return digits[-9:] if len(digits) >= 9 else None
+
+def normalize_reference(value):
+    return (value or '').strip().upper().replace(' ', '') or None
+
+def amount_cents(value):
+    try:
+        return int(Decimal(str(value).replace(',', '')) * 100)
+    except (InvalidOperation, ValueError):
+        return None
+
+def read_statement(path):
+    """Yield statement lines as dicts with receipt, completed_at, amount (cents), phone, reference"""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        fields = [STATEMENT_COLUMNS.get(column.strip().lower()) for column in header]
+        for row in reader:
+            line = {field: value for field, value in zip(fields, row) if field}
+            if line.get('status', 'Completed') != 'Completed':
+                continue
+            amount = amount_cents(line.get('amount'))
+            if not amount or not line.get('receipt'):
+                continue
+            yield {
+                'receipt': line['receipt'].strip(),
+                'completed_at': line.get('completed_at'),
+                'amount': amount,
+                'phone': normalize_phone(line.get('phone')),
+                'reference': normalize_reference(line.get('reference')),
+            }
+
+class PendingIndex:
+    """Hash indexes over the pending M-Pesa payments"""
+
+    def __init__(self, payments):
+        self.by_reference = {}
+        self.by_phone = {}
+        self.taken = set()
+        # Oldest first, so phone matches go to the longest-waiting payment
+        for payment_id, amount, reference, phone in sorted(payments):
+            cents = amount_cents(amount)
+            if reference:
+                self.by_reference.setdefault((cents, normalize_reference(reference)), []).append(payment_id)
+            if phone:
+                self.by_phone.setdefault((cents, normalize_phone(phone)), []).append(payment_id)
+        self.size = len(payments)
+
+    def _take(self, candidates):
+        while candidates:
+            payment_id = candidates.pop(0)
+            if payment_id not in self.taken:
+                self.taken.add(payment_id)
+                return payment_id
+        return None
+
+    def match(self, line):
+        """Claim the payment this statement line pays for, or None"""
+        payment_id = None
+        if line['reference']:
+            payment_id = self._take(self.by_reference.get((line['amount'], line['reference']), []))
+        if payment_id is None and line['phone']:
+            payment_id = self._take(self.by_phone.get((line['amount'], line['phone']), []))
+        return payment_id
+
+def load_pending(cursor):
+    cursor.execute("""
+        SELECT id, amount, account_reference, payer_phone
+        FROM payments
+        WHERE status = 'pending' AND payment_method = 'mpesa'
+    """)
+    return cursor.fetchall()
+
+def known_receipts(cursor, receipts):
+    placeholders = ', '.join(['%s'] * len(receipts))
+    cursor.execute(f"SELECT mpesa_transaction_id FROM payments "
+                   f"WHERE mpesa_transaction_id IN ({placeholders})", list(receipts))
+    return {row[0] for row in cursor.fetchall()}
+
+def apply_matches(conn, matches):
+    """Mark a batch of (payment_id, receipt) pairs completed with one UPDATE ... JOIN"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS reconcile_matches (
+            payment_id INT PRIMARY KEY,
+            receipt VARCHAR(50) NOT NULL
+        )
+    """)
+    cursor.execute("DELETE FROM reconcile_matches")
+    cursor.executemany("INSERT INTO reconcile_matches (payment_id, receipt) VALUES (%s, %s)", matches)
+    cursor.execute("""
+        UPDATE payments p
+        JOIN reconcile_matches m ON p.id = m.payment_id
+        SET p.status = 'completed', p.mpesa_transaction_id = m.receipt
+        WHERE p.status = 'pending'
+    """)
+    updated = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    return updated
+
+def reconcile(statement_path, report_dir=REPORT_DIR):
+    """
+    Match a statement file against the pending payments of every shard;
+    returns counts and the unmatched report path.
+    """
+    import shards
+    started = time.perf_counter()
+    nodes = []
+    for shard in range(shards.count()):
+        conn = shards.connection(shard)
+        cursor = conn.cursor()
+        nodes.append({'shard': shard, 'conn': conn, 'cursor': cursor,
+                      'index': PendingIndex(load_pending(cursor)), 'matches': []})
+
+    os.makedirs(report_dir, exist_ok=True)
+    report_path = os.path.join(report_dir, f"unmatched-{datetime.now().strftime('%Y%m%d-%H%M%S')}.csv")
+    stats = {'lines': 0, 'matched': 0, 'already_recorded': 0, 'unmatched': 0, 'updated': 0,
+             'pending_before': sum(node['index'].size for node in nodes)}
+
+    seen = set()  # receipts of this run: overlapping statement exports repeat lines
+
+    def candidates(line):
+        # A sharded reference names its shard. Mistyped or legacy references, and
+        # lines matched by phone only, may belong to a case on any shard.
+        shard = shards.shard_in_number(line['reference'])
+        return [nodes[shard]] if shard is not None else nodes
+
+    def flush(batch):
+        receipts = [line['receipt'] for line in batch]
+        known = set()
+        for node in nodes:
+            known |= known_receipts(node['cursor'], receipts)
+        for line in batch:
+            if line['receipt'] in known or line['receipt'] in seen:
+                stats['already_recorded'] += 1
+                continue
+            seen.add(line['receipt'])
+            for node in candidates(line):
+                payment_id = node['index'].match(line)
+                if payment_id is not None:
+                    node['matches'].append((payment_id, line['receipt']))
+                    stats['matched'] += 1
+                    break
+            else:
+                stats['unmatched'] += 1
+                writer.writerow([line['receipt'], line['completed_at'], line['amount'] / 100,
+                                 line['phone'], line['reference']])
+        for node in nodes:
+            if node['matches']:
+                stats['updated'] += apply_matches(node['conn'], node['matches'])
+                node['matches'] = []
+
+    try:
+        with open(report_path, 'w', newline='') as report:
+            writer = csv.writer(report)
+            writer.writerow(['receipt', 'completed_at', 'amount', 'phone', 'reference'])
+            batch = []
+            for line in read_statement(statement_path):
+                stats['lines'] += 1
+                batch.append(line)
+                if len(batch) >= APPLY_BATCH:
+                    flush(batch)
+                    batch = []
+            if batch:
+                flush(batch)
+    finally:
+        for node in nodes:
+            node['cursor'].close()
+            node['conn'].close()
+
+    stats['pending_after'] = sum(node['index'].size - len(node['index'].taken) for node in nodes)
+    stats['seconds'] = time.perf_counter() - started
+    stats['report'] = report_path
+    return stats
+
+def generate_statement(path, pending, lines=100000, seed=7):
+    """Write a paybill-format statement paying most `pending` payments, padded with unrelated lines"""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Receipt No.', 'Completion Time', 'Details', 'Transaction Status',
+                         'Paid In', 'Withdrawn', 'Balance', 'Other Party Info', 'A/C No.'])
+        written = 0
+        for payment_id, amount, reference, phone in pending:
+            if written >= lines or rng.random() < 0.1:  # some payers never pay
+                continue
+            # A few payers mistype the reference; the phone fallback should still find them
+            typed = reference if rng.random() > 0.05 else f"{reference}X"
+            writer.writerow([f"S{payment_id:09d}", datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                             'Pay Bill Online', 'Completed', amount, '', '',
+                             f"{phone or '2547' + str(rng.randrange(10**8)).zfill(8)} - PAYER", typed])
+            written += 1
+        while written < lines:
+            writer.writerow([f"N{written:09d}", datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                             'Pay Bill Online', 'Completed', rng.choice(['50.00', '1000.00', '2500.00']),
+                             '', '', f"2547{rng.randrange(10**8):08d} - OTHER", f"INV{rng.randrange(10**6)}"])
+            written += 1
+    return written
+
+def benchmark(lines=1000000, pending=200000, seed=7):
+    """Index `pending` synthetic payments and match `lines` statement lines against them in memory"""
+    rng = random.Random(seed)
+    payments = [(i, '1000.00', f"WAIT2024{i:06d}", f"07{rng.randrange(10**8):08d}") for i in range(pending)]
+    started = time.perf_counter()
+    index = PendingIndex(payments)
+    index_seconds = time.perf_counter() - started
+
+    statement = [{'receipt': f"R{i}", 'completed_at': None, 'amount': 100000,
+                  'phone': normalize_phone(payments[i % pending][3]),
+                  'reference': normalize_reference(payments[i % pending][2]) if i < pending else f"INV{i}"}
+                 for i in range(lines)]
+    started = time.perf_counter()
+    matched = sum(1 for line in statement if index.match(line) is not None)
+    match_seconds = time.perf_counter() - started
+    return {'pending': pending, 'lines': lines, 'matched': matched,
+            'index_seconds': index_seconds, 'lines_per_second': lines / match_seconds}
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        if command == "run" and len(sys.argv) > 2:
+            stats = reconcile(sys.argv[2])
+            print(f"{stats['lines']} lines in {stats['seconds']:.1f}s | {stats['matched']} matched "
+                  f"({stats['updated']} payments completed) | {stats['already_recorded']} already recorded | "
+                  f"{stats['unmatched']} unmatched -> {stats['report']}")
+            print(f"Pending M-Pesa payments: {stats['pending_before']} -> {stats['pending_after']}")
+        elif command == "generate" and len(sys.argv) > 2:
+            from db import get_db_connection
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            pending = load_pending(cursor)
+            cursor.close()
+            conn.close()
+            lines = int(sys.argv[3]) if len(sys.argv) > 3 else 100000
+            print(f"Wrote {generate_statement(sys.argv[2], pending, lines)} lines to {sys.argv[2]}")
+        elif command == "bench":
+            stats = benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 1000000)
+            print(f"{stats['pending']} pending indexed in {stats['index_seconds']:.2f}s | "
+                  f"{stats['lines']} lines matched at {stats['lines_per_second']:.0f} lines/s "
+                  f"({stats['matched']} matches)")
+        else:
+            print(__doc__)
+    except Exception as e:
+        print(f"Error: {e}")
@@ -0,0 +1,23 @@
+-- M-Pesa reconciliation: run once on databases created before reconcile.py
+USE digital_id_system;
+
+ALTER TABLE payments
+    ADD COLUMN account_reference VARCHAR(50) NULL AFTER mpesa_transaction_id,
+    ADD COLUMN payer_phone VARCHAR(20) NULL AFTER account_reference;
+
+-- Keep the archive copy in step (archive.py moves rows with INSERT ... SELECT *)
+ALTER TABLE payments_archive
+    ADD COLUMN account_reference VARCHAR(50) NULL AFTER mpesa_transaction_id,
+    ADD COLUMN payer_phone VARCHAR(20) NULL AFTER account_reference;
+
+-- Existing lost-ID payments were paid against their waiting card number
+UPDATE payments p
+JOIN lost_id_applications l ON p.lost_id_application_id = l.id
+SET p.account_reference = l.waiting_card_number
+WHERE p.account_reference IS NULL;
+
+CREATE INDEX idx_payments_status_method ON payments(status, payment_method);
+CREATE UNIQUE INDEX idx_payments_mpesa_transaction ON payments(mpesa_transaction_id);
+
+-- Then reconcile each statement export:
+--   python reconcile.py run <statement.csv>
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Keeping the API responsive when MySQL stalls.
+
+Timeouts (db.py): every connection uses DB_TIMEOUT (whole seconds) as its
+connect and network read/write timeout. API connections also set max_execution_time
+and innodb_lock_wait_timeout, so a stuck statement is ended on the server
+as well as abandoned by the client.
+
+Circuit breaker: db.py keeps one CircuitBreaker per database server.
+Every query on a connection it hands out goes through the breaker,
+because the connection's cmd_query / cmd_stmt_prepare / cmd_stmt_execute
+are wrapped the first time it is checked out. Only connection-level
+failures count (lost connection, timeouts, refused). After
+FAILURE_THRESHOLD of them in a row the breaker opens: connects and
+queries fail at once with DatabaseUnavailable for COOLDOWN seconds, and
+request threads stop piling up behind the stalled server. Then a single
+probe is let through (half-open). If it succeeds the breaker closes, and
+if it fails the breaker opens again.
+
+Retries: retry_read() re-runs an idempotent read after a transient
+failure, up to READ_ATTEMPTS times, with full-jitter exponential backoff.
+Writes are never retried here.
+
+Stale results: TrackingCache keeps recent successful tracking answers, so
+the public tracking routes can still answer, marked stale, while the
+database is unavailable.
+
+Run this script from terminal to inject faults through local stand-in
+servers that stall, delay or drop connections (no MySQL needed):
+    python resilience.py faults            # with the configured DB_TIMEOUT
+    DB_TIMEOUT=1 python resilience.py faults
+"""
+
+import random
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import mysql.connector
+
+FAILURE_THRESHOLD = 5
+COOLDOWN = 10.0         # seconds an open breaker fails fast before probing
+READ_ATTEMPTS = 3
+BACKOFF_BASE = 0.05     # seconds; attempt n sleeps up to BACKOFF_BASE * 2**n
+BACKOFF_CAP = 1.0
+STALE_CACHE_SIZE = 50000
+STALE_MAX_AGE = 6 * 3600  # seconds
+
+# Client-side connection failures: can't connect (2002/2003/2005), gone away (2006),
+# lost connection or timed out (2013/2055), too many connections (1040)
+CONNECTION_ERRNOS = {1040, 2002, 2003, 2005, 2006, 2013, 2055}
+# Server-side timeouts: statement ran past max_execution_time (3024), lock wait (1205)
+TIMEOUT_ERRNOS = {1205, 3024}
+
+class DatabaseUnavailable(mysql.connector.errors.OperationalError):
+    """Raised without touching the server while a circuit breaker is open"""
+
+def is_transient(error):
+    """Failures that say the server is unreachable or stalled, as opposed to a bad query"""
+    if isinstance(error, DatabaseUnavailable):
+        return False
+    if isinstance(error, (socket.timeout, ConnectionError)):
+        return True
+    return getattr(error, 'errno', None) in CONNECTION_ERRNOS | TIMEOUT_ERRNOS
+
+def is_retryable(error):
+    # A statement that timed out would most likely time out again
+    return is_transient(error) and getattr(error, 'errno', None) not in TIMEOUT_ERRNOS
+
+class CircuitBreaker:
+    """Closed -> open after `threshold` consecutive transient failures -> half-open after `cooldown`"""
+
+    def __init__(self, name, threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0      # times the breaker has opened
+        self.rejected = 0    # calls failed fast while open
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before(self):
+        """Raise DatabaseUnavailable unless a call may go to the server now"""
+        if self.state == 'closed':
+            return
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True  # this call is the probe
+                return
+            if self.state != 'closed':
+                self.rejected += 1
+                raise DatabaseUnavailable(msg=f"Database {self.name} unavailable (circuit open)")
+
+    def record_success(self):
+        if self.state == 'closed' and not self.failures:
+            return
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                if self.state != 'open':
+                    self.opened += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def call(self, fn, *args, **kwargs):
+        self.before()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if is_transient(e):
+                self.record_failure()
+            else:
+                self.record_success()  # the server answered, even if with an error
+            raise
+        self.record_success()
+        return result
+
+    def wrap(self, fn):
+        @wraps(fn)
+        def guarded(*args, **kwargs):
+            return self.call(fn, *args, **kwargs)
+        return guarded
+
+    @property
+    def is_open(self):
+        return self.state == 'open'
+
+    def stats(self):
+        return {'name': self.name, 'state': self.state, 'failures': self.failures,
+                'opened': self.opened, 'rejected': self.rejected}
+
+def guard(cnx, breaker):
+    """Send every query on the physical connection `cnx` through `breaker` (once per connection)"""
+    if getattr(cnx, 'breaker', None) is breaker:
+        return
+    for name in ('cmd_query', 'cmd_stmt_prepare', 'cmd_stmt_execute'):
+        setattr(cnx, name, breaker.wrap(getattr(cnx, name)))
+    cnx.breaker = breaker
+
+def retry_read(read, attempts=READ_ATTEMPTS):
+    """Call read() until it succeeds, retrying transient failures with jittered backoff; read must be idempotent"""
+    for attempt in range(1, attempts + 1):
+        try:
+            return read()
+        except Exception as e:
+            if attempt == attempts or not is_retryable(e):
+                raise
+            time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+
+class TrackingCache:
+    """Last good answer per tracking number, least recently used evicted first"""
+
+    def __init__(self, size=STALE_CACHE_SIZE, max_age=STALE_MAX_AGE):
+        self.size = size
+        self.max_age = max_age
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """(value, stored_at) if a fresh enough copy is cached, else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or time.time() - entry[0] > self.max_age:
+            return None
+        return entry[1], entry[0]
+
+class FaultyServer:
+    """
+    Local stand-in for a broken MySQL server: 'blackhole' accepts and never
+    answers, 'drop' closes each connection as soon as it is accepted,
+    'delay' sends nothing for `delay` seconds and then drops.
+    """
+
+    def __init__(self, mode, delay=0.0):
+        self.mode = mode
+        self.delay = delay
+        self.accepted = 0
+        self._held = []
+        self._sock = socket.socket()
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(128)
+        self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            self.accepted += 1
+            if self.mode == 'drop':
+                conn.close()
+            elif self.mode == 'delay':
+                threading.Timer(self.delay, conn.close).start()
+            else:
+                self._held.append(conn)
+
+    def close(self):
+        self._sock.close()
+        for conn in self._held:
+            conn.close()
+
+def fault_check():
+    """
+    Point db.py at stand-in servers and check timeouts, retries, the
+    breaker and stale tracking answers. Returns (scenario, passed) pairs.
+    """
+    import db
+    from app import create_app
+
+    saved = (dict(db.DB_CONFIG), db.REPLICA_CONFIG, db.BREAKERS, db.POOL_SIZE)
+    db.REPLICA_CONFIG = None
+    db.POOL_SIZE = 0
+    timeout = db.DB_CONFIG['connection_timeout']  # as configured, so the real connector path is exercised
+    results = []
+
+    def use(server, threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN):
+        db.DB_CONFIG.update(host='127.0.0.1', port=server.port)
+        db.BREAKERS = {'primary': CircuitBreaker('primary', threshold, cooldown),
+                       'replica': CircuitBreaker('replica', threshold, cooldown)}
+        return db.BREAKERS['primary']
+
+    def connect_seconds():
+        started = time.perf_counter()
+        try:
+            db.get_db_connection().close()
+        except mysql.connector.Error as e:
+            return time.perf_counter() - started, e
+        return time.perf_counter() - started, None
+
+    try:
+        blackhole = FaultyServer('blackhole')
+        use(blackhole)
+        seconds, error = connect_seconds()
+        results.append(('stalled server times out at DB_TIMEOUT',
+                        error is not None and seconds < timeout * 2))
+
+        drop = FaultyServer('drop')
+        use(drop)
+        started = time.perf_counter()
+        try:
+            db.run_read(lambda conn: conn)
+        except mysql.connector.Error:
+            pass
+        results.append(('transient read failure retried READ_ATTEMPTS times',
+                        drop.accepted == READ_ATTEMPTS and time.perf_counter() - started < 3))
+
+        delay = FaultyServer('delay', delay=0.2)
+        breaker = use(delay, threshold=3, cooldown=0.5)
+        for _ in range(3):
+            connect_seconds()
+        accepted = delay.accepted
+        seconds, error = connect_seconds()
+        results.append(('open breaker fails fast without connecting',
+                        breaker.is_open and isinstance(error, DatabaseUnavailable)
+                        and seconds < 0.01 and delay.accepted == accepted))
+
+        time.sleep(0.6)
+        connect_seconds()
+        results.append(('half-open breaker probes once, then reopens',
+                        delay.accepted == accepted + 1 and breaker.is_open))
+
+        client = create_app('public').test_client()
+        import public_routes
+        public_routes.TRACKING_CACHE.put('application:APP2024000042', {
+            'application_number': 'APP2024000042', 'full_names': 'Test Applicant',
+            'status': 'dispatched', 'created_at': None, 'updated_at': None})
+        cached = client.get('/api/applications/track/APP2024000042')
+        unknown = client.get('/api/applications/track/APP2024999999')
+        results.append(('tracking serves cached answer while breaker is open',
+                        cached.status_code == 200 and cached.get_json().get('stale') is True
+                        and unknown.status_code == 503))
+        for server in (blackhole, drop, delay):
+            server.close()
+    finally:
+        db.DB_CONFIG.clear()
+        db.DB_CONFIG.update(saved[0])
+        db.REPLICA_CONFIG, db.BREAKERS, db.POOL_SIZE = saved[1:]
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "faults":
+        import resilience  # db.py and the routes see the imported module, not __main__
+        results = resilience.fault_check()
+        for scenario, passed in results:
+            print(f"{'ok  ' if passed else 'FAIL'}  {scenario}")
+        sys.exit(0 if all(passed for _, passed in results) else 1)
+    else:
+        print(__doc__)
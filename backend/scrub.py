@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+Storage scrubber: documents rows against the files under uploads/.
+
+Submissions save the file and insert its documents row without a shared
+transaction, and fix_documents_table.sql once dropped every row, so the
+two drift apart. The scrubber finds
+    orphan    a file no documents row points to
+    missing   a documents row whose file is gone
+    corrupt   a file whose SHA-256 differs from the row's sha256 (verify)
+and writes them to a CSV report. Orphans can be moved to
+uploads/quarantine/<run>/ with the same relative path. Moving one back
+with mv restores it.
+
+Both sides are streamed and sorted on disk, so memory stays bounded
+however many files there are:
+  - files: a thread pool scans the upload tree, one directory per task,
+    skipping resumable-upload sessions and the quarantine
+  - rows: documents and documents_archive on every shard, read in keyset
+    batches by id
+Each side is cut into sorted runs of RUN_SIZE paths written to temporary
+files. heapq.merge reads the runs back in path order, and one merge pass
+walks both sides together. Checksums are computed by the same thread pool
+with at most HASH_IN_FLIGHT files outstanding.
+
+A file saved by a submission that has not committed yet looks like an
+orphan, so files modified in the last GRACE_SECONDS are never reported.
+
+Run this script from terminal:
+    python scrub.py scan               # report orphans and missing files
+    python scrub.py verify             # ... and check SHA-256 of files that have one recorded
+    python scrub.py quarantine         # report, then move orphans to uploads/quarantine/
+    python scrub.py check              # self-check on a temporary tree, no database
+    python scrub.py bench [files]      # scan throughput and peak memory on a synthetic tree
+"""
+
+import csv
+import hashlib
+import heapq
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import applications
+import uploads
+
+UPLOAD_ROOT = applications.UPLOAD_DIR
+REPORT_DIR = 'scrub_reports'
+THREADS = int(os.environ.get('SCRUB_THREADS', 8))
+ROW_BATCH = 5000          # documents rows per keyset query
+RUN_SIZE = 200000         # entries sorted in memory before spilling a run to disk
+HASH_IN_FLIGHT = 64       # files being hashed at once
+GRACE_SECONDS = 3600
+HASH_BLOCK = 1024 * 1024
+
+DOCUMENT_TABLES = ('documents', 'documents_archive')
+
+def normalize(path):
+    """Comparable form of a stored or walked path"""
+    return os.path.normpath(path.replace('\\', '/')).replace(os.sep, '/')
+
+class ExternalSort:
+    """Sorts (path, fields) entries of any number with at most `run_size` held in memory"""
+
+    def __init__(self, workdir, name, run_size=RUN_SIZE):
+        self.workdir = workdir
+        self.name = name
+        self.run_size = run_size
+        self.runs = []
+        self.count = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def add(self, entries):
+        with self._lock:
+            self._buffer.extend(entries)
+            self.count += len(entries)
+            if len(self._buffer) >= self.run_size:
+                self._spill()
+
+    def _spill(self):
+        self._buffer.sort()
+        path = os.path.join(self.workdir, f"{self.name}-{len(self.runs)}.jsonl")
+        with open(path, 'w') as f:
+            for entry in self._buffer:
+                f.write(json.dumps(entry) + '\n')
+        self.runs.append(path)
+        self._buffer = []
+
+    def _read(self, path):
+        with open(path) as f:
+            for line in f:
+                yield tuple(json.loads(line))
+
+    def sorted(self):
+        """Every entry added, in order; call once all producers are done"""
+        if not self.runs:
+            self._buffer.sort()
+            return iter(self._buffer)
+        if self._buffer:
+            self._spill()
+        return heapq.merge(*(self._read(path) for path in self.runs))
+
+def scan_files(root, sorter, pool, skip=()):
+    """Feed (path, size, mtime) of every file under root to sorter, one directory per pool task"""
+    skip = {normalize(path) for path in skip}
+    pending = []
+    lock = threading.Lock()
+    done = threading.Event()
+    outstanding = [0]
+
+    def scan(directory):
+        try:
+            batch = []
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    path = normalize(entry.path)
+                    if entry.is_dir(follow_symlinks=False):
+                        if path not in skip:
+                            submit(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        batch.append((path, stat.st_size, stat.st_mtime))
+                        if len(batch) >= 10000:
+                            sorter.add(batch)
+                            batch = []
+            sorter.add(batch)
+        except FileNotFoundError:
+            pass  # removed while we walked
+        finally:
+            with lock:
+                outstanding[0] -= 1
+                if outstanding[0] == 0:
+                    done.set()
+
+    def submit(directory):
+        with lock:
+            outstanding[0] += 1
+        pending.append(pool.submit(scan, directory))
+
+    if not os.path.isdir(root):
+        return sorter
+    submit(root)
+    done.wait()
+    for future in pending:
+        future.result()  # surface errors other than vanished directories
+    return sorter
+
+def stream_rows(conn, table, batch_size=ROW_BATCH):
+    """(id, file_path, sha256) of a documents table in id order, one keyset batch at a time"""
+    cursor = conn.cursor()
+    last_id = 0
+    while True:
+        cursor.execute(f"""
+            SELECT id, file_path, sha256 FROM {table}
+            WHERE id > %s ORDER BY id LIMIT %s
+        """, (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        yield rows
+        last_id = rows[-1][0]
+    cursor.close()
+
+def scan_rows(sorter):
+    """Feed (path, shard, table, id, sha256) of every documents row on every shard to sorter"""
+    import shards
+
+    def read(conn, shard):
+        for table in DOCUMENT_TABLES:
+            for rows in stream_rows(conn, table):
+                sorter.add([(normalize(path), shard, table, row_id, sha256 or '')
+                            for row_id, path, sha256 in rows])
+    shards.scatter(read)
+    return sorter
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def diff(files, rows):
+    """
+    Walk two path-sorted streams together. Yields (kind, path, file, rows):
+    'orphan' with no rows, 'missing' with no file, 'matched' with both.
+    """
+    files = iter(files)
+    rows = iter(rows)
+    file = next(files, None)
+    row = next(rows, None)
+    while file is not None or row is not None:
+        if row is None or (file is not None and file[0] < row[0]):
+            yield 'orphan', file[0], file, []
+            file = next(files, None)
+            continue
+        path = row[0]
+        group = []
+        while row is not None and row[0] == path:  # several rows may name one file
+            group.append(row)
+            row = next(rows, None)
+        if file is not None and file[0] == path:
+            yield 'matched', path, file, group
+            file = next(files, None)
+        else:
+            yield 'missing', path, None, group
+
+def scrub(row_source, root=UPLOAD_ROOT, verify=False, quarantine=False, report_dir=REPORT_DIR,
+          grace=GRACE_SECONDS, threads=THREADS, run_size=RUN_SIZE):
+    """
+    Compare the upload tree with the documents rows that row_source(sorter)
+    adds, and write a CSV report of every finding. Returns counts and the
+    report path.
+    """
+    started = time.perf_counter()
+    run = datetime.now().strftime('%Y%m%d-%H%M%S')
+    quarantine_root = os.path.join(root, 'quarantine', run)
+    now = time.time()
+    stats = {'files': 0, 'rows': 0, 'matched': 0, 'orphan': 0, 'recent': 0, 'missing': 0,
+             'verified': 0, 'corrupt': 0, 'no_checksum': 0, 'quarantined': 0}
+
+    os.makedirs(report_dir, exist_ok=True)
+    report_path = os.path.join(report_dir, f"scrub-{run}.csv")
+    with tempfile.TemporaryDirectory() as workdir, \
+            ThreadPoolExecutor(max_workers=threads, thread_name_prefix='scrub') as pool, \
+            open(report_path, 'w', newline='') as report:
+        writer = csv.writer(report)
+        writer.writerow(['finding', 'path', 'size', 'shard', 'table', 'document_id', 'detail'])
+
+        # Rows stream in on their own thread while the pool walks the tree
+        row_sorter = ExternalSort(workdir, 'rows', run_size)
+        failure = []
+
+        def read_rows():
+            try:
+                row_source(row_sorter)
+            except Exception as e:
+                failure.append(e)
+
+        reader = threading.Thread(target=read_rows, name='scrub-rows')
+        reader.start()
+        file_sorter = scan_files(root, ExternalSort(workdir, 'files', run_size), pool,
+                                 (uploads.SESSION_DIR, os.path.join(root, 'quarantine')))
+        reader.join()
+        if failure:
+            raise failure[0]
+        stats['files'] = file_sorter.count
+        stats['rows'] = row_sorter.count
+
+        hashing = deque()
+
+        def settle(limit):
+            # Record finished checksums in order until at most `limit` are outstanding
+            while len(hashing) > limit:
+                future, path, size, group = hashing.popleft()
+                actual = future.result()
+                stats['verified'] += 1
+                for _, shard, table, row_id, expected in group:
+                    if actual != expected:
+                        stats['corrupt'] += 1
+                        writer.writerow(['corrupt', path, size, shard, table, row_id,
+                                         f"expected {expected} got {actual}"])
+
+        for kind, path, file, group in diff(file_sorter.sorted(), row_sorter.sorted()):
+            if kind == 'orphan':
+                _, size, mtime = file
+                if now - mtime < grace:
+                    stats['recent'] += 1  # its submission may still be committing
+                    continue
+                stats['orphan'] += 1
+                detail = ''
+                if quarantine:
+                    target = os.path.join(quarantine_root, os.path.relpath(path, root))
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.move(path, target)
+                    stats['quarantined'] += 1
+                    detail = f"moved to {normalize(target)}"
+                writer.writerow(['orphan', path, size, '', '', '', detail])
+            elif kind == 'missing':
+                for _, shard, table, row_id, _ in group:
+                    stats['missing'] += 1
+                    writer.writerow(['missing', path, '', shard, table, row_id, ''])
+            else:
+                stats['matched'] += 1
+                checked = [row for row in group if row[4]]
+                stats['no_checksum'] += len(group) - len(checked)
+                if verify and checked:
+                    hashing.append((pool.submit(file_sha256, path), path, file[1], checked))
+                    settle(HASH_IN_FLIGHT)
+        settle(0)
+
+    stats['seconds'] = time.perf_counter() - started
+    stats['report'] = report_path
+    return stats
+
+def scan_database(verify=False, quarantine=False):
+    return scrub(scan_rows, verify=verify, quarantine=quarantine)
+
+def _fixture(root, files, rows_per_file=1.0, orphan_every=50, missing_every=40, corrupt_every=0):
+    """Synthetic tree and matching rows: every orphan_every-th file has no row, and so on"""
+    entries = []
+    os.makedirs(os.path.join(root, 'lost_id'), exist_ok=True)
+    old = time.time() - 2 * GRACE_SECONDS
+    for i in range(files):
+        directory = os.path.join(root, 'lost_id') if i % 5 == 0 else root
+        path = os.path.join(directory, f"APP2024{i:06d}_passportPhoto_photo.jpg")
+        content = f"document {i}".encode()
+        with open(path, 'wb') as f:
+            f.write(content)
+        os.utime(path, (old, old))
+        digest = hashlib.sha256(content).hexdigest()
+        if corrupt_every and i % corrupt_every == 0:
+            digest = '0' * 64
+        if orphan_every and i % orphan_every == 0:
+            continue
+        entries.append((normalize(path), 0, 'documents', i + 1, digest))
+    for i in range(0, files, missing_every or files + 1):
+        entries.append((normalize(os.path.join(root, f"gone_{i}.jpg")), 0, 'documents', files + i + 1, ''))
+    return entries
+
+def self_check():
+    """Orphans, missing files, corrupt files, the grace period and quarantine on a temporary tree"""
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, 'uploads')
+        entries = _fixture(root, 200, orphan_every=50, missing_every=40, corrupt_every=30)
+        with open(os.path.join(root, 'fresh_upload.jpg'), 'wb') as f:
+            f.write(b'committing')  # recent: never an orphan
+        os.makedirs(os.path.join(root, 'sessions', 'abc'), exist_ok=True)
+        with open(os.path.join(root, 'sessions', 'abc', 'data'), 'wb') as f:
+            f.write(b'partial')
+
+        saved = uploads.SESSION_DIR
+        uploads.SESSION_DIR = os.path.join(root, 'sessions')
+        try:
+            def rows(sorter):
+                for start in range(0, len(entries), 7):
+                    sorter.add(entries[start:start + 7])
+                return sorter
+
+            stats = scrub(rows, root=root, verify=True, report_dir=os.path.join(tmp, 'reports'), run_size=16)
+            assert stats['files'] == 201, stats
+            assert stats['orphan'] == 4 and stats['recent'] == 1, stats       # files 0, 50, 100, 150
+            assert stats['missing'] == 5, stats                               # gone_0 ... gone_160
+            # every 30th file has a wrong checksum, minus those that are orphans (0 and 150)
+            assert stats['corrupt'] == 5 and stats['verified'] == 196, stats
+
+            stats = scrub(rows, root=root, quarantine=True, report_dir=os.path.join(tmp, 'reports'))
+            assert stats['quarantined'] == 4, stats
+            assert not os.path.exists(os.path.join(root, 'lost_id', 'APP2024000050_passportPhoto_photo.jpg'))
+            stats = scrub(rows, root=root, report_dir=os.path.join(tmp, 'reports'))
+            assert stats['orphan'] == 0 and stats['files'] == 197, stats  # quarantine is not scanned
+        finally:
+            uploads.SESSION_DIR = saved
+    return 'orphans, missing, corrupt, grace period, quarantine'
+
+def benchmark(files=100000, run_size=20000):
+    """Scan a synthetic tree; peak Python heap of the sorted-run diff vs diffing two in-memory sets"""
+    import tracemalloc
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, 'uploads')
+        entries = _fixture(root, files)
+        entries_path = os.path.join(tmp, 'rows.jsonl')
+        with open(entries_path, 'w') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+        del entries
+
+        def rows(sorter):
+            batch = []
+            with open(entries_path) as f:
+                for line in f:
+                    batch.append(tuple(json.loads(line)))
+                    if len(batch) >= ROW_BATCH:
+                        sorter.add(batch)
+                        batch = []
+            sorter.add(batch)
+            return sorter
+
+        stats = scrub(rows, root=root, verify=True, report_dir=os.path.join(tmp, 'reports'), run_size=run_size)
+
+        # tracemalloc slows everything down, so memory is measured on a second run
+        tracemalloc.start()
+        scrub(rows, root=root, verify=True, report_dir=os.path.join(tmp, 'reports'), run_size=run_size)
+        stats['peak_heap_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        on_disk = {normalize(os.path.join(directory, name))
+                   for directory, _, names in os.walk(root) for name in names}
+        with open(entries_path) as f:
+            in_db = {json.loads(line)[0] for line in f}
+        _ = (on_disk - in_db, in_db - on_disk)
+        stats['set_diff_peak_heap_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return stats
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        if command in ("scan", "verify", "quarantine"):
+            stats = scan_database(verify=command == "verify", quarantine=command == "quarantine")
+            for name, value in stats.items():
+                print(f"{name}: {value:.1f}" if isinstance(value, float) else f"{name}: {value}")
+        elif command == "check":
+            print(f"OK: {self_check()}")
+        elif command == "bench":
+            files = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+            stats = benchmark(files)
+            print(f"{stats['files']} files, {stats['rows']} rows in {stats['seconds']:.1f}s "
+                  f"({stats['files'] / stats['seconds']:.0f} files/s, SHA-256 verified {stats['verified']})")
+            print(f"orphan {stats['orphan']} | missing {stats['missing']} | corrupt {stats['corrupt']}")
+            print(f"peak heap: sorted runs {stats['peak_heap_bytes'] / 1024 / 1024:.1f} MiB | "
+                  f"in-memory sets {stats['set_diff_peak_heap_bytes'] / 1024 / 1024:.1f} MiB")
+        else:
+            print(__doc__)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
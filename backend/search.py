@@ -0,0 +1,167 @@
+"""
+Ranked name search over applicants and citizens.
+
+Backed by MySQL FULLTEXT indexes built WITH PARSER ngram (see
+database_setup.sql, or search_migration.sql for existing databases), so misspelt or partial names still match on shared
+character n-grams and the ranking is done inside the index. Results are
+paginated without a COUNT(*): one extra row is fetched to tell whether
+another page exists. search_shards() runs the search on every application
+shard (shards.py) and merges the hits by score.
+"""
+
+import shards
+
+MIN_QUERY_LENGTH = 2   # shorter queries produce no n-gram tokens
+MAX_QUERY_LENGTH = 100
+MAX_PAGE_SIZE = 100
+MAX_RESULT_WINDOW = 1000  # deep pages get slower; ask the user to refine instead
+
+SEARCH_SCOPES = {
+    # Hot and archived (collected or rejected) applications. The archive copies
+    # the table's columns and FULLTEXT index, so their scores are on one scale.
+    'applications': {
+        'match': """MATCH(a.full_names, a.father_name, a.mother_name, a.district_of_birth,
+                          a.home_district, a.division, a.constituency, a.location,
+                          a.sub_location)""",
+        'query': """
+            SELECT * FROM (
+                (SELECT a.id, a.application_number, a.full_names, a.father_name, a.mother_name,
+                        a.date_of_birth, a.home_district, a.constituency, a.location,
+                        a.sub_location, a.status, a.generated_id_number, a.created_at,
+                        0 AS archived,
+                        {match} AGAINST (%(text)s IN NATURAL LANGUAGE MODE) AS score
+                 FROM applications a
+                 WHERE {match} AGAINST (%(text)s IN NATURAL LANGUAGE MODE)
+                 ORDER BY score DESC, a.id DESC
+                 LIMIT %(window)s)
+                UNION ALL
+                (SELECT a.id, a.application_number, a.full_names, a.father_name, a.mother_name,
+                        a.date_of_birth, a.home_district, a.constituency, a.location,
+                        a.sub_location, a.status, a.generated_id_number, a.created_at,
+                        1 AS archived,
+                        {match} AGAINST (%(text)s IN NATURAL LANGUAGE MODE) AS score
+                 FROM applications_archive a
+                 WHERE {match} AGAINST (%(text)s IN NATURAL LANGUAGE MODE)
+                 ORDER BY score DESC, a.id DESC
+                 LIMIT %(window)s)
+            ) hits
+            ORDER BY score DESC, id DESC
+            LIMIT %(limit)s OFFSET %(offset)s
+        """,
+    },
+    'citizens': {
+        'match': "MATCH(c.full_names, c.place_of_birth)",
+        'query': """
+            SELECT c.id, c.id_number, c.full_names, c.date_of_birth, c.place_of_birth,
+                   c.gender, c.created_at,
+                   {match} AGAINST (%(text)s IN NATURAL LANGUAGE MODE) AS score
+            FROM citizens c
+            WHERE {match} AGAINST (%(text)s IN NATURAL LANGUAGE MODE)
+            ORDER BY score DESC, c.id DESC
+            LIMIT %(limit)s OFFSET %(offset)s
+        """,
+    },
+}
+
+def normalize_query(text):
+    """Collapse whitespace and drop FULLTEXT operator characters"""
+    text = ''.join(' ' if ch in '+-<>()~*"@' else ch for ch in (text or ''))
+    text = ' '.join(text.split())
+    if len(text) < MIN_QUERY_LENGTH:
+        raise ValueError(f'Search query must be at least {MIN_QUERY_LENGTH} characters')
+    return text[:MAX_QUERY_LENGTH]
+
+def parse_paging(page, page_size):
+    try:
+        page = max(1, int(page or 1))
+        page_size = min(MAX_PAGE_SIZE, max(1, int(page_size or 20)))
+    except ValueError:
+        raise ValueError('page and page_size must be integers')
+    if page * page_size > MAX_RESULT_WINDOW:
+        raise ValueError(f'Only the first {MAX_RESULT_WINDOW} results can be paged; refine the search')
+    return page, page_size
+
+def _search_scope(cursor, scope, text, limit, offset):
+    spec = SEARCH_SCOPES[scope]
+    cursor.execute(spec['query'].format(match=spec['match']),
+                   {'text': text, 'limit': limit, 'offset': offset, 'window': limit + offset})
+    rows = cursor.fetchall()
+    for row in rows:
+        row['source'] = scope
+        row['score'] = float(row['score'])
+    return rows
+
+def rank_sources(rows):
+    """
+    Order hits from several scopes by relevance: each row's score divided by
+    the best score of its scope. FULLTEXT scores of different tables and
+    column sets are not on one scale, so raw scores are not compared.
+    """
+    best = {}
+    for row in rows:
+        best[row['source']] = max(best.get(row['source'], 0.0), row['score'])
+    for row in rows:
+        row['relevance'] = row['score'] / best[row['source']] if best[row['source']] else 0.0
+    rows.sort(key=lambda row: row['relevance'], reverse=True)
+    return rows
+
+def search(cursor, text, scope='all', page=1, page_size=20):
+    """
+    Return (results, has_more) for one page of ranked matches.
+
+    With scope='all' each table's top hits up to the end of the requested
+    page are merged by relevance (rank_sources), which is cheap because the
+    window is capped. Expects a dictionary cursor.
+    """
+    offset = (page - 1) * page_size
+    if scope == 'all':
+        rows = []
+        for name in SEARCH_SCOPES:
+            rows.extend(_search_scope(cursor, name, text, offset + page_size + 1, 0))
+        rows = rank_sources(rows)[offset:]
+    elif scope in SEARCH_SCOPES:
+        rows = _search_scope(cursor, scope, text, page_size + 1, offset)
+    else:
+        raise ValueError(f'Unknown search scope: {scope}')
+
+    return rows[:page_size], len(rows) > page_size
+
+def search_shards(text, scope='all', page=1, page_size=20):
+    """
+    search() over every shard. Each shard returns its top hits up to the
+    end of the page. One scope's lists are merged by score, several scopes
+    by relevance (rank_sources). Citizens are copied to every shard, so only
+    shard 0's copy is searched.
+    """
+    if scope != 'all' and scope not in SEARCH_SCOPES:
+        raise ValueError(f'Unknown search scope: {scope}')
+
+    if shards.count() == 1:
+        def run(conn, shard):
+            cursor = conn.cursor(dictionary=True)
+            try:
+                return search(cursor, text, scope, page, page_size)
+            finally:
+                cursor.close()
+        return shards.scatter(run)[0]
+
+    offset = (page - 1) * page_size
+    scopes = list(SEARCH_SCOPES) if scope == 'all' else [scope]
+
+    def top_hits(conn, shard):
+        cursor = conn.cursor(dictionary=True)
+        rows = []
+        for name in scopes:
+            if name == 'citizens' and shard != 0:
+                continue
+            rows.extend(_search_scope(cursor, name, text, offset + page_size + 1, 0))
+        cursor.close()
+        rows.sort(key=lambda row: row['score'], reverse=True)
+        return rows
+
+    hits = shards.scatter(top_hits)
+    if scope == 'all':
+        rows = rank_sources([row for shard_rows in hits for row in shard_rows])[offset:]
+    else:
+        rows = shards.merge_sorted(hits, key=lambda row: row['score'], reverse=True)[offset:]
+    return rows[:page_size], len(rows) > page_size
@@ -0,0 +1,12 @@
+-- Name search: run once on databases created before search.py
+USE digital_id_system;
+
+-- The ngram parser tokenizes by ngram_token_size; set ngram_token_size=3 in
+-- my.cnf and restart MySQL before creating the indexes to get trigram tokens.
+-- Building them copies each table; run outside office hours on large tables.
+CREATE FULLTEXT INDEX ft_applications_search ON applications(full_names, father_name, mother_name, district_of_birth, home_district, division, constituency, location, sub_location) WITH PARSER ngram;
+CREATE FULLTEXT INDEX ft_citizens_search ON citizens(full_names, place_of_birth) WITH PARSER ngram;
+
+-- Archived applications are searched too. archive_migration.sql copies the index
+-- when it runs after this file; if applications_archive already existed, add it:
+CREATE FULLTEXT INDEX ft_applications_search ON applications_archive(full_names, father_name, mother_name, district_of_birth, home_district, division, constituency, location, sub_location) WITH PARSER ngram;
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Horizontal sharding of applications across MySQL nodes.
+
+applications and lost_id_applications, together with their documents,
+payments, status history, duplicate flags, jobs and notifications, are
+spread over the nodes in db.SHARD_CONFIGS. Shard 0 is the primary, and
+DB_SHARDS adds more nodes. Every node runs the same database_setup.sql.
+A new application is stored on the shard of its home district, and a
+lost-ID case on the shard of the capturing officer's station. Both use
+shard_for_district().
+
+Nothing needs a lookup table to find a record again:
+  - Numbers carry their shard: APP<year><shard:02d><seq:06d>, and the same
+    for WAIT numbers. With a single shard numbers keep the legacy
+    APP<year><seq:06d> form. Legacy numbers always route to shard 0.
+  - Row ids step by db.SHARD_SLOTS starting at shard + 1 (auto_increment
+    session settings in db.py), so shard_for_id() is arithmetic. Rows
+    created before sharding have ids up to SHARD_ID_FLOOR and stay on
+    shard 0; DB_SHARD_ID_FLOOR must be set whenever DB_SHARDS is.
+Adding a shard therefore only changes where new submissions go.
+
+officers and citizens are reference tables that the listings join on
+every shard. They are written to shard 0 (or the application's shard) and
+copied to the others with sync_reference(). admins and idempotency keys
+live on shard 0 only. Listings run on every shard in parallel (scatter)
+and are merged in order (merge_sorted).
+
+Run this script from terminal:
+    python shards.py status                 # per-node row counts and auto_increment settings
+    python shards.py init                   # prepare added nodes: id floor and reference rows
+    python shards.py bench [seconds] [threads]   # submit + track throughput on 1..N shards
+"""
+
+import heapq
+import os
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from operator import itemgetter
+
+import mysql.connector
+
+import db
+import queries
+from json_provider import RowSet
+
+SHARD_ID_FLOOR = int(os.environ.get('DB_SHARD_ID_FLOOR', 0))  # max row id before sharding was enabled
+if len(db.SHARD_CONFIGS) > 1 and 'DB_SHARD_ID_FLOOR' not in os.environ:
+    # Without it, rows created before sharding would be looked up on the wrong node
+    raise RuntimeError("DB_SHARDS is set but DB_SHARD_ID_FLOOR is not: set it to the highest row id "
+                       "created before sharding (0 for a fresh install)")
+REFERENCE_TABLES = {'officers': 'id', 'citizens': 'id_number'}
+SHARDED_TABLES = ('applications', 'lost_id_applications', 'documents', 'payments',
+                  'status_history', 'duplicate_flags', 'jobs', 'notifications')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def count():
+    return len(db.SHARD_CONFIGS)
+
+def shard_for_district(district):
+    """Shard for a home district or station name; stable across processes and restarts"""
+    key = ' '.join((district or '').lower().split())
+    return zlib.crc32(key.encode('utf-8')) % count()
+
+def shard_for_officer(officer_id):
+    """Shard of the officer's station, where the cases they capture are stored"""
+    if count() == 1:
+        return 0
+    conn = db.get_read_connection()
+    try:
+        officer = queries.fetchone(conn, 'officer_station', (officer_id,))
+    finally:
+        conn.close()
+    return shard_for_district(officer['station'] if officer else None)
+
+def shard_in_number(number):
+    """Shard encoded in a sharded APP/WAIT number, or None when the number names no configured shard"""
+    digits = (number or '').lstrip('APWIT')
+    if count() == 1 or len(digits) != 12 or not digits.isdigit():
+        return None
+    shard = int(digits[4:6])
+    return shard if shard < count() else None
+
+def shard_for_number(number):
+    """Shard encoded in an APP/WAIT number; legacy and unrecognized numbers are on shard 0"""
+    shard = shard_in_number(number)
+    return 0 if shard is None else shard
+
+def shard_for_id(row_id):
+    """
+    Shard holding the row with this auto_increment id. An id whose slot has
+    no configured shard cannot exist; like an unrecognized number it routes
+    to shard 0, where the lookup finds nothing.
+    """
+    if count() == 1 or row_id <= SHARD_ID_FLOOR:
+        return 0
+    shard = (row_id - 1) % db.SHARD_SLOTS
+    return shard if shard < count() else 0
+
+def _numbered(prefix, shard, sequence, width):
+    year = datetime.now().year
+    if count() == 1:
+        return f"{prefix}{year}{sequence:0{width}d}"
+    return f"{prefix}{year}{shard:02d}{sequence:0{width}d}"
+
+def application_number(shard, sequence):
+    return _numbered('APP', shard, sequence, 6)
+
+def waiting_card_number(shard, sequence):
+    return _numbered('WAIT', shard, sequence, 6)
+
+def id_number(shard, sequence):
+    return _numbered('ID', shard, sequence, 8)
+
+def connection(shard):
+    return db.get_shard_connection(shard)
+
+def read_connection(shard):
+    """Shard 0 reads may use its replica; other shards read from their own node"""
+    return db.get_read_connection() if shard == 0 else db.get_shard_connection(shard)
+
+def connection_for_id(row_id):
+    return connection(shard_for_id(row_id))
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(4, count() * 2),
+                                               thread_name_prefix='scatter')
+    return _executor
+
+def scatter(query, shards=None, read=True):
+    """
+    Run query(conn, shard) on every shard and return the results in shard
+    order. Shards are queried in parallel, each on its own connection.
+    """
+    shards = list(range(count())) if shards is None else list(shards)
+    connect = read_connection if read else connection
+
+    def run(shard):
+        conn = connect(shard)
+        try:
+            return query(conn, shard)
+        finally:
+            conn.close()
+
+    if len(shards) == 1:
+        return [run(shards[0])]
+    return list(_pool().map(run, shards))
+
+def merge_sorted(results, key, reverse=False, limit=None):
+    """Merge per-shard lists that are each already sorted by `key`"""
+    merged = heapq.merge(*results, key=key, reverse=reverse)
+    if limit is not None:
+        merged = (row for _, row in zip(range(limit), merged))
+    return list(merged)
+
+def select_all(sql, params=(), order_by=None, reverse=True, limit=None):
+    """
+    One SELECT run on every shard, as a single RowSet. Each shard's rows
+    must already be sorted by the `order_by` column (ORDER BY in `sql`),
+    newest first unless reverse=False.
+    """
+    def run(conn, shard):
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = RowSet.from_cursor(cursor)
+        cursor.close()
+        return rows
+
+    parts = scatter(run)
+    if len(parts) == 1:
+        return parts[0]
+    columns = parts[0].columns
+    if order_by is None:
+        return RowSet(columns, [row for part in parts for row in part.rows])
+    key = itemgetter(columns.index(order_by))
+    return RowSet(columns, merge_sorted([part.rows for part in parts], key, reverse, limit))
+
+def sync_reference(table, keys, source=0):
+    """Copy rows of a reference table, by key, from `source` to every other shard"""
+    if count() == 1 or not keys:
+        return 0
+    column = REFERENCE_TABLES[table]
+    conn = connection(source)
+    cursor = conn.cursor()
+    placeholders = ', '.join(['%s'] * len(keys))
+    cursor.execute(f"SELECT * FROM {table} WHERE {column} IN ({placeholders})", list(keys))
+    columns = cursor.column_names
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    if not rows:
+        return 0
+
+    upsert = (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+              f"ON DUPLICATE KEY UPDATE " + ', '.join(f"{c} = VALUES({c})" for c in columns if c != 'id'))
+
+    def write(conn, shard):
+        cursor = conn.cursor()
+        cursor.executemany(upsert, rows)
+        conn.commit()
+        cursor.close()
+
+    scatter(write, [shard for shard in range(count()) if shard != source], read=False)
+    return len(rows)
+
+def status():
+    """Per-shard row counts of the sharded and reference tables"""
+    def counts(conn, shard):
+        cursor = conn.cursor()
+        result = {'shard': shard, 'host': f"{db.SHARD_CONFIGS[shard]['host']}:"
+                                          f"{db.SHARD_CONFIGS[shard].get('port', 3306)}"}
+        for table in ('applications', 'lost_id_applications') + tuple(REFERENCE_TABLES):
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            result[table] = cursor.fetchone()[0]
+        cursor.execute("SELECT @@auto_increment_increment, @@auto_increment_offset")
+        result['auto_increment'] = cursor.fetchone()
+        cursor.close()
+        return result
+    return scatter(counts, read=False)
+
+def init_nodes():
+    """
+    Prepare every shard after nodes are added: start new ids above
+    SHARD_ID_FLOOR, so they never route to shard 0, and copy the
+    reference tables from shard 0.
+    """
+    def raise_floor(conn, shard):
+        cursor = conn.cursor()
+        for table in SHARDED_TABLES:
+            cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+            if cursor.fetchone()[0] < SHARD_ID_FLOOR:
+                cursor.execute(f"ALTER TABLE {table} AUTO_INCREMENT = {SHARD_ID_FLOOR + 1}")
+        cursor.close()
+    scatter(raise_floor, range(1, count()), read=False)
+
+    copied = {}
+    for table, column in REFERENCE_TABLES.items():
+        conn = connection(0)
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {column} FROM {table}")
+        keys = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        conn.close()
+        copied[table] = sum(sync_reference(table, keys[i:i + 1000]) for i in range(0, len(keys), 1000))
+    return copied
+
+BENCH_PREFIX = 'BENCH'
+
+def _bench_worker(shards, deadline, totals, lock, worker, run):
+    import applications
+    done = {'submitted': 0, 'tracked': 0, 'errors': 0}
+    numbers = []
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            i += 1
+            shard = shards[i % len(shards)]
+            # Unique per run, worker and submit, so rounds never collide on application_number
+            number = f"{BENCH_PREFIX}{run}-{worker}-{i}"
+            conn = connection(shard)
+            cursor = conn.cursor()
+            try:
+                cursor.execute(applications.INSERT_SQL, applications.insert_params({
+                    'fullNames': f"Shard Bench {worker}-{i}", 'dateOfBirth': '1990-01-01',
+                    'gender': 'female', 'fatherName': 'Bench Father', 'motherName': 'Bench Mother',
+                    'districtOfBirth': 'Bench', 'tribe': 'Bench', 'homeDistrict': 'Bench',
+                    'division': 'Bench', 'constituency': 'Bench', 'location': 'Bench',
+                    'subLocation': 'Bench', 'villageEstate': 'Bench', 'occupation': 'Bench',
+                }, number, 1, None))
+                conn.commit()
+                numbers.append((shard, number))
+                done['submitted'] += 1
+                for tracked_shard, tracked in numbers[-4:]:
+                    if tracked_shard == shard:
+                        queries.fetchone(conn, 'track_application', (tracked,))
+                        done['tracked'] += 1
+            except mysql.connector.Error:
+                done['errors'] += 1
+            finally:
+                cursor.close()
+                conn.close()
+    finally:
+        with lock:
+            for key, value in done.items():
+                totals[key] += value
+
+def _bench_cleanup():
+    def cleanup(conn, shard):
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM applications WHERE application_number LIKE %s", (f"{BENCH_PREFIX}%",))
+        conn.commit()
+        cursor.close()
+    scatter(cleanup, read=False)
+
+def benchmark(seconds=10, threads=16):
+    """Submit + track throughput using the first 1, 2, ... N shards, with the same client threads"""
+    results = []
+    run = int(time.time())
+    try:
+        for used in range(1, count() + 1):
+            _bench_cleanup()  # each round starts from the same table sizes
+            totals = {'submitted': 0, 'tracked': 0, 'errors': 0}
+            lock = threading.Lock()
+            deadline = time.perf_counter() + seconds
+            workers = [threading.Thread(target=_bench_worker,
+                                        args=(list(range(used)), deadline, totals, lock, n, f"{run}.{used}"))
+                       for n in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            results.append({'shards': used, 'submits_per_second': totals['submitted'] / seconds,
+                            'tracks_per_second': totals['tracked'] / seconds, 'errors': totals['errors']})
+    finally:
+        _bench_cleanup()
+    return results
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        if command == "status":
+            for row in status():
+                print(row)
+        elif command == "init":
+            print(f"Reference rows copied: {init_nodes()}")
+        elif command == "bench":
+            seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+            threads = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+            for row in benchmark(seconds, threads):
+                print(f"{row['shards']} shard(s): {row['submits_per_second']:.0f} submits/s, "
+                      f"{row['tracks_per_second']:.0f} tracks/s, {row['errors']} errors")
+        else:
+            print(__doc__)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
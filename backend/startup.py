@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Worker boot time: lazy subsystems, state snapshots and a boot budget.
+
+Lazy: optional heavy dependencies (pyarrow, redis, ...) are wrapped in
+Lazy(loader) and imported on first use instead of at import time. The
+time each one takes to load is recorded in LOAD_TIMES.
+
+Snapshots: in-process state that a recycled worker would otherwise lose
+(rate-limit buckets, read-your-writes stickiness) registers a dump/load
+pair with register_snapshot(). When STARTUP_SNAPSHOT names a file, the
+state is written there at exit and read back at boot if it is no older
+than SNAPSHOT_MAX_AGE, without touching the database.
+
+Run this script from terminal:
+    python startup.py importtime [top]   # import-time breakdown of app.py per imported module
+    python startup.py bench [runs]       # boot time in fresh interpreters vs BOOT_BUDGET_MS
+"""
+
+import atexit
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BOOT_BUDGET_MS = 500
+SNAPSHOT_PATH = os.environ.get('STARTUP_SNAPSHOT')
+SNAPSHOT_MAX_AGE = 300  # seconds
+
+LOAD_TIMES = {}  # Lazy name -> milliseconds spent loading it
+_snapshots = {}  # name -> (dump, load)
+
+class Lazy:
+    """Value produced by loader() on first get(); loader may raise ImportError, which get() turns into None"""
+
+    def __init__(self, name, loader):
+        self.name = name
+        self._loader = loader
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                started = time.perf_counter()
+                try:
+                    self._value = self._loader()
+                except ImportError:
+                    self._value = None
+                LOAD_TIMES[self.name] = (time.perf_counter() - started) * 1000
+                self._loaded = True
+        return self._value
+
+def register_snapshot(name, dump, load):
+    """dump() returns JSON-serializable state; load(state) restores it in a new worker"""
+    _snapshots[name] = (dump, load)
+
+def save_snapshot(path=None):
+    path = path or SNAPSHOT_PATH
+    if not path:
+        return False
+    state = {'saved_at': time.time(),
+             'subsystems': {name: dump() for name, (dump, _) in _snapshots.items()}}
+    # Workers exiting together each write their own temporary file; os.replace
+    # then publishes one complete snapshot, never an interleaving of several
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return True
+
+def load_snapshot(path=None, max_age=SNAPSHOT_MAX_AGE):
+    """Restore registered subsystems from the snapshot file. Returns the names restored"""
+    path = path or SNAPSHOT_PATH
+    if not path:
+        return []
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return []
+    if time.time() - state.get('saved_at', 0) > max_age:
+        return []
+
+    restored = []
+    for name, data in state.get('subsystems', {}).items():
+        if name in _snapshots:
+            _snapshots[name][1](data)
+            restored.append(name)
+    return restored
+
+def init_app(app):
+    """Restore snapshot state at boot and save it again when the worker exits"""
+    restored = load_snapshot()
+    if SNAPSHOT_PATH:
+        atexit.register(save_snapshot)
+    app.extensions['startup'] = {'restored': restored}
+
+def _parse_importtime(stderr):
+    # Lines look like "import time:  self |  cumulative | <indent>module"
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_part, cumulative_us, name = line.split('|', 2)
+        self_us = int(self_part.split(':')[1])
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        rows.append((depth, name.strip(), self_us, int(cumulative_us)))
+    return rows
+
+def importtime_report(module='app', top=15):
+    """Cumulative import cost of each module imported directly by `module`, slowest first"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    rows = _parse_importtime(result.stderr)
+    # Python prints children before their parent; the target module is the shallowest row named `module`
+    root = next((row for row in rows if row[1] == module), None)
+    if root is None:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr.splitlines()[-1] if result.stderr else ''}")
+
+    direct = []
+    index = rows.index(root)
+    for depth, name, self_us, cumulative_us in reversed(rows[:index]):
+        if depth <= root[0]:
+            break
+        if depth == root[0] + 1:
+            direct.append((name, cumulative_us / 1000))
+    direct.sort(key=lambda row: row[1], reverse=True)
+    return {'total_ms': root[3] / 1000, 'modules': direct[:top]}
+
+def benchmark(runs=10, module='app'):
+    """Boot time of a fresh interpreter importing `module`, against BOOT_BUDGET_MS"""
+    code = (f"import time; started = time.perf_counter(); import {module}; "
+            f"print((time.perf_counter() - started) * 1000)")
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return {'runs': runs, 'median_ms': statistics.median(timings), 'max_ms': max(timings),
+            'budget_ms': BOOT_BUDGET_MS, 'within_budget': max(timings) <= BOOT_BUDGET_MS}
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        if command == "importtime":
+            report = importtime_report(top=int(sys.argv[2]) if len(sys.argv) > 2 else 15)
+            print(f"import app: {report['total_ms']:.0f}ms")
+            for name, ms in report['modules']:
+                print(f"{ms:>8.1f}ms  {name}")
+        elif command == "bench":
+            stats = benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 10)
+            print(f"{stats['runs']} boots | median {stats['median_ms']:.0f}ms | max {stats['max_ms']:.0f}ms | "
+                  f"budget {stats['budget_ms']}ms: {'OK' if stats['within_budget'] else 'OVER BUDGET'}")
+            sys.exit(0 if stats['within_budget'] else 1)
+        else:
+            print(__doc__)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Resumable chunked document uploads.
+
+Officers in the field upload each document on its own instead of in one
+multipart POST, so a dropped connection only costs the chunk in flight:
+    POST /api/uploads                        {filename, size, sha256?} -> uploadId, chunkSize
+    PUT  /api/uploads/<id>/chunks/<index>    raw bytes, X-Chunk-SHA256 header
+    GET  /api/uploads/<id>                   received and missing chunk indexes, to resume
+Chunks are CHUNK_SIZE bytes (the last may be shorter), may arrive in any
+order and may be resent. Each one is checked against its SHA-256 and
+written at index * CHUNK_SIZE into the session's data file. The size and
+file type are checked when the session is created, and a chunk's
+Content-Length before its body is read, so oversized uploads are refused
+before any bytes are spooled.
+
+Submitting the application finalizes its sessions: the `uploads` field
+maps form file keys to upload IDs, every chunk must be present and the
+whole-file SHA-256 must match, and the data file is moved to its usual
+place under uploads/ with a documents row carrying the hash.
+
+Session state lives on disk (meta.json, the data file and one marker file
+per received chunk), so any worker sharing the upload volume can take any
+chunk without locking.
+
+Run this script from terminal:
+    python uploads.py purge    # remove sessions older than SESSION_TTL
+    python uploads.py check    # interrupted, out-of-order and corrupt uploads through the API
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+SESSION_DIR = os.environ.get('UPLOAD_SESSION_DIR', os.path.join('uploads', 'sessions'))
+DOCUMENT_ROOT = 'uploads'  # finalized documents may only be moved below here
+CHUNK_SIZE = 256 * 1024
+MAX_FILE_SIZE = 10 * 1024 * 1024
+ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.heic', '.pdf'}
+SESSION_TTL = 24 * 3600  # seconds
+CHUNK_CHECKSUM_HEADER = 'X-Chunk-SHA256'
+
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+class UploadError(Exception):
+    """Rejected upload request; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def _session_path(upload_id, *parts):
+    # Upload IDs come from the URL; only our own hex IDs may name a directory
+    if not _UPLOAD_ID.match(upload_id or ''):
+        raise UploadError('Unknown upload', 404)
+    return os.path.join(SESSION_DIR, upload_id, *parts)
+
+def _write_meta(upload_id, meta):
+    tmp_path = _session_path(upload_id, 'meta.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, _session_path(upload_id, 'meta.json'))
+
+def load_session(upload_id):
+    try:
+        with open(_session_path(upload_id, 'meta.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise UploadError('Unknown upload', 404)
+
+def total_chunks(meta):
+    return max(1, -(-meta['size'] // meta['chunkSize']))
+
+def create_session(filename, size, sha256=None, officer_id=None):
+    """Validate the declared file and open a session for it"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        raise UploadError(f"File type not allowed: {extension or 'none'}")
+    if not isinstance(size, int) or size <= 0:
+        raise UploadError('size must be a positive number of bytes')
+    if size > MAX_FILE_SIZE:
+        raise UploadError(f"File exceeds {MAX_FILE_SIZE // (1024 * 1024)} MB limit", 413)
+    if sha256 is not None and not _SHA256.match(sha256):
+        raise UploadError('sha256 must be 64 lowercase hex characters')
+
+    upload_id = uuid.uuid4().hex
+    os.makedirs(_session_path(upload_id, 'chunks'))
+    with open(_session_path(upload_id, 'data'), 'wb') as f:
+        f.truncate(size)
+    meta = {'uploadId': upload_id, 'filename': filename, 'size': size, 'chunkSize': CHUNK_SIZE,
+            'sha256': sha256, 'officerId': officer_id, 'createdAt': time.time(),
+            'status': 'open', 'path': None}
+    _write_meta(upload_id, meta)
+    return meta
+
+def expected_length(meta, index):
+    """Bytes chunk `index` must carry, or None if the index is out of range"""
+    if not 0 <= index < total_chunks(meta):
+        return None
+    return min(meta['chunkSize'], meta['size'] - index * meta['chunkSize'])
+
+def check_chunk_request(meta, index, content_length):
+    """Refuse a chunk from its headers alone, before the body is read"""
+    if meta['status'] != 'open':
+        raise UploadError('Upload already finalized', 409)
+    length = expected_length(meta, index)
+    if length is None:
+        raise UploadError(f"Chunk index out of range (0-{total_chunks(meta) - 1})", 416)
+    if content_length is not None and content_length != length:
+        raise UploadError(f"Chunk {index} must be {length} bytes", 413 if content_length > length else 400)
+    return length
+
+def write_chunk(upload_id, index, body, checksum):
+    """Store one chunk at its offset once its length and checksum are verified"""
+    meta = load_session(upload_id)
+    length = check_chunk_request(meta, index, len(body))
+    if not checksum or hashlib.sha256(body).hexdigest() != checksum.lower():
+        raise UploadError(f"Chunk {index} checksum mismatch, resend it", 422)
+
+    fd = os.open(_session_path(upload_id, 'data'), os.O_WRONLY)
+    try:
+        os.pwrite(fd, body, index * meta['chunkSize'])
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    # The marker is written last, so a chunk only counts once its bytes are on disk
+    open(_session_path(upload_id, 'chunks', str(index)), 'w').close()
+    return length
+
+def received_chunks(upload_id):
+    return sorted(int(name) for name in os.listdir(_session_path(upload_id, 'chunks')))
+
+def status(upload_id):
+    """What a client needs to resume: which chunks are stored and which are still missing"""
+    meta = load_session(upload_id)
+    received = received_chunks(upload_id)
+    missing = sorted(set(range(total_chunks(meta))) - set(received))
+    return {'uploadId': upload_id, 'filename': meta['filename'], 'size': meta['size'],
+            'chunkSize': meta['chunkSize'], 'totalChunks': total_chunks(meta),
+            'received': received, 'missing': missing, 'complete': not missing,
+            'status': meta['status']}
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def check_complete(upload_ids):
+    """Refuse a submission up front if any of its uploads is unknown or still missing chunks"""
+    for file_key, upload_id in upload_ids.items():
+        state = status(upload_id)
+        if state['status'] == 'open' and not state['complete']:
+            raise UploadError(f"{file_key} upload is missing {len(state['missing'])} chunks", 409)
+
+def finalize(upload_id, destination):
+    """
+    Move a complete upload to `destination` and return its sha256.
+    Finalizing again to the same destination is a no-op, so a retried
+    submission whose transaction rolled back can finalize the same uploads.
+    """
+    meta = load_session(upload_id)
+    if meta['status'] == 'finalized':
+        if meta['path'] != destination or not os.path.exists(destination):
+            raise UploadError('Upload already used by another submission', 409)
+        return meta['sha256']
+
+    missing = status(upload_id)['missing']
+    if missing:
+        raise UploadError(f"Upload {upload_id} is missing chunks {missing[:10]}", 409)
+    data_path = _session_path(upload_id, 'data')
+    sha256 = _file_sha256(data_path)
+    if meta['sha256'] and meta['sha256'] != sha256:
+        raise UploadError(f"Upload {upload_id} does not match its sha256, re-upload it", 422)
+
+    # The destination's directory is the route's own and must already exist
+    root = os.path.realpath(DOCUMENT_ROOT)
+    if not os.path.realpath(destination).startswith(root + os.sep):
+        raise UploadError('Invalid document destination')
+    os.replace(data_path, destination)
+    meta.update(status='finalized', path=destination, sha256=sha256)
+    _write_meta(upload_id, meta)
+    return sha256
+
+def parse_upload_ids(value, allowed=None):
+    """
+    The `uploads` submission field: a {fileKey: uploadId} object, or that
+    object as JSON text. File keys end up in paths, so with `allowed` any
+    other key is refused.
+    """
+    if not value:
+        return {}
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise UploadError('uploads must be a JSON object of fileKey: uploadId')
+    if not isinstance(value, dict):
+        raise UploadError('uploads must be a JSON object of fileKey: uploadId')
+    upload_ids = {key: upload_id for key, upload_id in value.items() if upload_id}
+    if allowed is not None:
+        unknown = sorted(set(upload_ids) - set(allowed))
+        if unknown:
+            raise UploadError(f"Unknown document type in uploads: {', '.join(unknown)}")
+    return upload_ids
+
+def purge(max_age=SESSION_TTL):
+    """Remove sessions (abandoned or finalized) created more than max_age seconds ago"""
+    if not os.path.isdir(SESSION_DIR):
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age
+    for upload_id in os.listdir(SESSION_DIR):
+        try:
+            created_at = load_session(upload_id)['createdAt']
+        except (UploadError, ValueError):
+            created_at = os.path.getmtime(os.path.join(SESSION_DIR, upload_id))
+        if created_at < cutoff:
+            shutil.rmtree(os.path.join(SESSION_DIR, upload_id), ignore_errors=True)
+            removed += 1
+    return removed
+
+def selfcheck():
+    """
+    Drive the upload routes through the Flask test client against a
+    temporary directory: chunks sent out of order, an interrupted upload
+    resumed from its status, a corrupt chunk, and limits enforced early.
+    Returns a list of (scenario, passed) pairs.
+    """
+    global SESSION_DIR, DOCUMENT_ROOT
+    from app import create_app
+    client = create_app('officer').test_client()
+    saved_dirs = (SESSION_DIR, DOCUMENT_ROOT)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        SESSION_DIR = os.path.join(workdir, 'sessions')
+        DOCUMENT_ROOT = workdir
+        try:
+            payload = os.urandom(CHUNK_SIZE * 3 + 1234)
+            chunks = [payload[i:i + CHUNK_SIZE] for i in range(0, len(payload), CHUNK_SIZE)]
+
+            def put(upload_id, index, body, checksum=None):
+                return client.put(f"/api/uploads/{upload_id}/chunks/{index}", data=body, headers={
+                    CHUNK_CHECKSUM_HEADER: checksum or hashlib.sha256(body).hexdigest()})
+
+            def open_session(data=payload):
+                response = client.post('/api/uploads', json={
+                    'filename': 'photo.jpg', 'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()})
+                return response.get_json()['uploadId']
+
+            upload_id = open_session()
+            codes = [put(upload_id, index, chunks[index]).status_code for index in (3, 1, 0, 2)]
+            destination = os.path.join(workdir, 'out_of_order.jpg')
+            finalize(upload_id, destination)
+            with open(destination, 'rb') as f:
+                results.append(('out-of-order chunks reassemble', codes == [200] * 4 and f.read() == payload))
+
+            upload_id = open_session()
+            put(upload_id, 0, chunks[0])
+            put(upload_id, 2, chunks[2])
+            state = client.get(f"/api/uploads/{upload_id}").get_json()
+            try:
+                finalize(upload_id, os.path.join(workdir, 'early.jpg'))
+                refused_early = False
+            except UploadError as e:
+                refused_early = e.status == 409
+            for index in state['missing']:
+                put(upload_id, index, chunks[index])
+            finalize(upload_id, os.path.join(workdir, 'resumed.jpg'))
+            results.append(('interrupted upload resumes from status',
+                            state['missing'] == [1, 3] and refused_early))
+
+            upload_id = open_session()
+            corrupt = put(upload_id, 1, chunks[1][:-1] + b'\x00', hashlib.sha256(chunks[1]).hexdigest())
+            results.append(('corrupt chunk rejected', corrupt.status_code == 422
+                            and 1 in client.get(f"/api/uploads/{upload_id}").get_json()['missing']))
+
+            upload_id = open_session()
+            for index in (0, 1, 3):
+                put(upload_id, index, chunks[index])
+            put(upload_id, 2, chunks[2][::-1], hashlib.sha256(chunks[2][::-1]).hexdigest())
+            try:
+                finalize(upload_id, os.path.join(workdir, 'mismatch.jpg'))
+                mismatch_refused = False
+            except UploadError as e:
+                mismatch_refused = e.status == 422
+            results.append(('whole-file sha256 mismatch refused', mismatch_refused))
+
+            too_big = client.post('/api/uploads', json={'filename': 'scan.pdf', 'size': MAX_FILE_SIZE + 1})
+            bad_type = client.post('/api/uploads', json={'filename': 'run.exe', 'size': 10})
+            oversized_chunk = put(open_session(), 0, payload[:CHUNK_SIZE + 1])
+            results.append(('limits enforced before upload', too_big.status_code == 413
+                            and bad_type.status_code == 400 and oversized_chunk.status_code == 413))
+
+            upload_id = open_session()
+            for index, chunk in enumerate(chunks):
+                put(upload_id, index, chunk)
+            try:
+                parse_upload_ids({'x/../../../escaped': upload_id}, ['passportPhoto'])
+                unknown_refused = False
+            except UploadError:
+                unknown_refused = True
+            try:
+                finalize(upload_id, os.path.join(workdir, '..', 'escaped.jpg'))
+                outside_refused = False
+            except UploadError:
+                outside_refused = True
+            results.append(('file keys and destinations cannot leave the upload root',
+                            unknown_refused and outside_refused
+                            and not os.path.exists(os.path.join(workdir, '..', 'escaped.jpg'))))
+        finally:
+            SESSION_DIR, DOCUMENT_ROOT = saved_dirs
+    return results
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        if command == "purge":
+            print(f"Removed {purge()} upload sessions")
+        elif command == "check":
+            import uploads  # the routes see the imported module, not __main__
+            results = uploads.selfcheck()
+            for scenario, passed in results:
+                print(f"{'ok  ' if passed else 'FAIL'}  {scenario}")
+            sys.exit(0 if all(passed for _, passed in results) else 1)
+        else:
+            print(__doc__)
+    except UploadError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
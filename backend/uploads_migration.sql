@@ -0,0 +1,11 @@
+-- Resumable uploads: run once on databases created before uploads.py
+USE digital_id_system;
+
+-- SHA-256 of documents that arrived through a resumable upload session
+ALTER TABLE documents ADD COLUMN sha256 CHAR(64) NULL AFTER file_path;
+
+-- Keep the archive copy in step (archive.py moves rows with INSERT ... SELECT *)
+ALTER TABLE documents_archive ADD COLUMN sha256 CHAR(64) NULL AFTER file_path;
+
+-- Abandoned upload sessions live under uploads/sessions; clear them daily:
+--   python uploads.py purge
@@ -0,0 +1,35 @@
+import { useEffect, useState } from 'react';
+
+// Place-name autocomplete (backend/geography.py). Suggestions for one form
+// field, narrowed by the parent fields already filled in.
+
+const API_URL = 'http://localhost:5000/api/geography/suggest';
+const DEBOUNCE_MS = 150;
+
+type PlaceContext = Record<string, string>;
+
+export function usePlaceSuggestions(field: string, query: string, context: PlaceContext) {
+  const [suggestions, setSuggestions] = useState<string[]>([]);
+  const contextKey = JSON.stringify(context);
+
+  useEffect(() => {
+    const controller = new AbortController();
+    const timer = setTimeout(async () => {
+      const params = new URLSearchParams({ ...JSON.parse(contextKey), field, q: query });
+      try {
+        const response = await fetch(`${API_URL}?${params}`, { signal: controller.signal });
+        if (!response.ok) return;
+        const data = await response.json();
+        setSuggestions(data.suggestions.map((place: { name: string }) => place.name));
+      } catch {
+        // Autocomplete is a convenience; the field stays free text
+      }
+    }, DEBOUNCE_MS);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [field, query, contextKey]);
+
+  return suggestions;
+}
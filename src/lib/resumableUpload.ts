@@ -0,0 +1,93 @@
+// Resumable chunked uploads (backend/uploads.py). Each document is sent in
+// fixed-size chunks with a SHA-256 per chunk; after a dropped connection only
+// the chunks the server reports missing are sent again.
+
+const API_URL = 'http://localhost:5000/api/uploads';
+const MAX_ATTEMPTS = 5;
+
+const toHex = (buffer: ArrayBuffer) =>
+  Array.from(new Uint8Array(buffer), (byte) => byte.toString(16).padStart(2, '0')).join('');
+
+const sha256 = async (data: ArrayBuffer) => toHex(await crypto.subtle.digest('SHA-256', data));
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Upload sessions already opened for a file, so a retried form submit resumes instead of restarting
+const sessions = new WeakMap<File, string>();
+
+interface UploadStatus {
+  uploadId: string;
+  chunkSize: number;
+  missing: number[];
+}
+
+const createSession = async (file: File, digest: string): Promise<UploadStatus> => {
+  const response = await fetch(API_URL, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ filename: file.name, size: file.size, sha256: digest }),
+  });
+  const data = await response.json();
+  if (!response.ok) throw new Error(data.error || 'Failed to start upload');
+  return {
+    uploadId: data.uploadId,
+    chunkSize: data.chunkSize,
+    missing: Array.from({ length: data.totalChunks }, (_, index) => index),
+  };
+};
+
+const getStatus = async (uploadId: string): Promise<UploadStatus | null> => {
+  const response = await fetch(`${API_URL}/${uploadId}`);
+  if (!response.ok) return null;
+  const data = await response.json();
+  return data.status === 'open' ? data : null;
+};
+
+const putChunk = async (uploadId: string, index: number, chunk: ArrayBuffer) => {
+  const checksum = await sha256(chunk);
+  for (let attempt = 1; ; attempt++) {
+    try {
+      const response = await fetch(`${API_URL}/${uploadId}/chunks/${index}`, {
+        method: 'PUT',
+        headers: { 'X-Chunk-SHA256': checksum },
+        body: chunk,
+      });
+      // 4xx other than a checksum mismatch will not get better by resending
+      if (response.ok) return;
+      if (response.status !== 422 && response.status < 500) {
+        const data = await response.json();
+        throw Object.assign(new Error(data.error || 'Upload rejected'), { permanent: true });
+      }
+    } catch (error) {
+      if ((error as { permanent?: boolean }).permanent || attempt >= MAX_ATTEMPTS) throw error;
+    }
+    if (attempt >= MAX_ATTEMPTS) throw new Error('Upload failed, check your connection');
+    await sleep(Math.min(8000, 500 * 2 ** attempt));
+  }
+};
+
+// Upload a file (resuming an earlier attempt if there is one) and return its upload ID
+export const uploadFile = async (file: File): Promise<string> => {
+  const previous = sessions.get(file);
+  let status = previous ? await getStatus(previous) : null;
+  if (!status) {
+    status = await createSession(file, await sha256(await file.arrayBuffer()));
+    sessions.set(file, status.uploadId);
+  }
+
+  for (const index of status.missing) {
+    const start = index * status.chunkSize;
+    const chunk = await file.slice(start, start + status.chunkSize).arrayBuffer();
+    await putChunk(status.uploadId, index, chunk);
+  }
+  return status.uploadId;
+};
+
+// Upload several form files and return the { fileKey: uploadId } map the submit routes accept
+export const uploadFiles = async (files: Record<string, File | null>) => {
+  const uploads: Record<string, string> = {};
+  for (const [key, file] of Object.entries(files)) {
+    if (file) uploads[key] = await uploadFile(file);
+  }
+  return uploads;
+};
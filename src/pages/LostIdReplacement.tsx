@@ -6,6 +6,7 @@ import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
 import { Textarea } from '@/components/ui/textarea';
 import { useToast } from '@/hooks/use-toast';
+import { uploadFiles } from '@/lib/resumableUpload';
 import { Search, Upload, CreditCard, Smartphone, ArrowLeft } from 'lucide-react';
 
 interface CitizenDetails {
@@ -19,6 +20,8 @@ interface CitizenDetails {
 
 const LostIdReplacement = () => {
   const [step, setStep] = useState(1);
+  // One key per form fill, reused on retries so the backend can de-duplicate resubmissions
+  const [idempotencyKey] = useState(() => crypto.randomUUID());
   const [idNumber, setIdNumber] = useState('');
   const [citizenDetails, setCitizenDetails] = useState<CitizenDetails | null>(null);
   const [obNumber, setObNumber] = useState('');
@@ -27,6 +30,9 @@ const LostIdReplacement = () => {
   const [passportPhoto, setPassportPhoto] = useState<File | null>(null);
   const [birthCertPhoto, setBirthCertPhoto] = useState<File | null>(null);
   const [paymentMethod, setPaymentMethod] = useState('');
+  const [mpesaPhone, setMpesaPhone] = useState('');
+  const [notifyPhone, setNotifyPhone] = useState('');
+  const [notifyEmail, setNotifyEmail] = useState('');
   const [loading, setLoading] = useState(false);
   const [waitingCardNumber, setWaitingCardNumber] = useState('');
   
@@ -103,9 +109,19 @@ const LostIdReplacement = () => {
       formData.append('ob_number', obNumber);
       formData.append('ob_description', obDescription);
       formData.append('payment_method', paymentMethod);
-      formData.append('ob_photo', obPhoto!);
-      formData.append('passport_photo', passportPhoto!);
-      formData.append('birth_certificate', birthCertPhoto!);
+      if (paymentMethod === 'mpesa' && mpesaPhone.trim()) {
+        formData.append('mpesa_phone', mpesaPhone.trim());
+      }
+      // Where status updates go; the backend falls back to the M-Pesa number
+      if (notifyPhone.trim()) formData.append('phone_number', notifyPhone.trim());
+      if (notifyEmail.trim()) formData.append('email', notifyEmail.trim());
+      // Photos go up in resumable chunks first; the submit only references them
+      const uploads = await uploadFiles({
+        ob_photo: obPhoto,
+        passport_photo: passportPhoto,
+        birth_certificate: birthCertPhoto,
+      });
+      formData.append('uploads', JSON.stringify(uploads));
 
       const officerData = localStorage.getItem('officerData');
       if (officerData) {
@@ -115,6 +131,7 @@ const LostIdReplacement = () => {
 
       const response = await fetch('http://localhost:5000/api/lost-id-applications', {
         method: 'POST',
+        headers: { 'Idempotency-Key': idempotencyKey },
         body: formData
       });
 
@@ -334,6 +351,40 @@ const LostIdReplacement = () => {
                       <span>{paymentMethod === 'cash' ? 'Cash' : 'M-Pesa'}</span>
                     </div>
                   </div>
+
+                  {paymentMethod === 'mpesa' && (
+                    <div className="mb-4">
+                      <Label htmlFor="mpesaPhone">M-Pesa Phone Number (optional)</Label>
+                      <Input
+                        id="mpesaPhone"
+                        value={mpesaPhone}
+                        onChange={(e) => setMpesaPhone(e.target.value)}
+                        placeholder="e.g. 0712345678"
+                      />
+                    </div>
+                  )}
+
+                  <div className="grid grid-cols-1 md:grid-cols-2 gap-4 mb-4">
+                    <div>
+                      <Label htmlFor="notifyPhone">Phone Number for SMS Updates (optional)</Label>
+                      <Input
+                        id="notifyPhone"
+                        type="tel"
+                        value={notifyPhone}
+                        onChange={(e) => setNotifyPhone(e.target.value)}
+                        placeholder="e.g. 0712345678"
+                      />
+                    </div>
+                    <div>
+                      <Label htmlFor="notifyEmail">Email for Updates (optional)</Label>
+                      <Input
+                        id="notifyEmail"
+                        type="email"
+                        value={notifyEmail}
+                        onChange={(e) => setNotifyEmail(e.target.value)}
+                      />
+                    </div>
+                  </div>
                   
                   <Button 
                     onClick={submitApplication} 
@@ -8,12 +8,16 @@ import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 import { Checkbox } from '@/components/ui/checkbox';
 import { useToast } from '@/hooks/use-toast';
+import { usePlaceSuggestions } from '@/hooks/use-place-suggestions';
+import { uploadFiles } from '@/lib/resumableUpload';
 import { ArrowLeft, Camera, Upload } from 'lucide-react';
 
 const NewApplication = () => {
   const navigate = useNavigate();
   const { toast } = useToast();
   const [isSubmitting, setIsSubmitting] = useState(false);
+  // One key per form fill, reused on retries so the backend can de-duplicate resubmissions
+  const [idempotencyKey] = useState(() => crypto.randomUUID());
   const [passportPhoto, setPassportPhoto] = useState<File | null>(null);
   const [birthCertificate, setBirthCertificate] = useState<File | null>(null);
   const [parentsId, setParentsId] = useState<File | null>(null);
@@ -42,6 +46,8 @@ const NewApplication = () => {
     villageEstate: '',
     homeAddress: '',
     occupation: '',
+    phoneNumber: '',
+    email: '',
     
     // Supporting Documents
     documents: {
@@ -57,6 +63,31 @@ const NewApplication = () => {
     }
   });
 
+  // Canonical place names from the reference data, each narrowed by the fields above it
+  const placeSuggestions: Record<string, string[]> = {
+    districtOfBirth: usePlaceSuggestions('districtOfBirth', formData.districtOfBirth, {}),
+    homeDistrict: usePlaceSuggestions('homeDistrict', formData.homeDistrict, {}),
+    constituency: usePlaceSuggestions('constituency', formData.constituency, {
+      homeDistrict: formData.homeDistrict,
+    }),
+    division: usePlaceSuggestions('division', formData.division, {
+      homeDistrict: formData.homeDistrict, constituency: formData.constituency,
+    }),
+    location: usePlaceSuggestions('location', formData.location, {
+      homeDistrict: formData.homeDistrict, constituency: formData.constituency, division: formData.division,
+    }),
+    subLocation: usePlaceSuggestions('subLocation', formData.subLocation, {
+      homeDistrict: formData.homeDistrict, constituency: formData.constituency, division: formData.division,
+      location: formData.location,
+    }),
+  };
+
+  const placeList = (field: string) => (
+    <datalist id={`${field}-places`}>
+      {placeSuggestions[field].map((name) => <option key={name} value={name} />)}
+    </datalist>
+  );
+
   const handleInputChange = (field: string, value: string) => {
     setFormData(prev => ({
       ...prev,
@@ -110,14 +141,14 @@ const NewApplication = () => {
         }
       });
 
-      // Add files
-      if (passportPhoto) submitData.append('passportPhoto', passportPhoto);
-      if (birthCertificate) submitData.append('birthCertificate', birthCertificate);
-      if (parentsId) submitData.append('parentsId', parentsId);
+      // Files go up in resumable chunks first; the submit only references them
+      const uploads = await uploadFiles({ passportPhoto, birthCertificate, parentsId });
+      submitData.append('uploads', JSON.stringify(uploads));
 
       // Submit to backend
       const response = await fetch('http://localhost:5000/api/applications', {
         method: 'POST',
+        headers: { 'Idempotency-Key': idempotencyKey },
         body: submitData,
       });
 
@@ -128,6 +159,18 @@ const NewApplication = () => {
         });
         navigate('/officer/dashboard');
       } else {
+        const data = await response.json().catch(() => ({}));
+        if (data.field) {
+          // A place name the reference data does not know under its parent
+          toast({
+            title: "Check location",
+            description: data.suggestions?.length
+              ? `${data.error}. Did you mean: ${data.suggestions.join(', ')}?`
+              : data.error,
+            variant: "destructive",
+          });
+          return;
+        }
         throw new Error('Failed to submit application');
       }
     } catch (error) {
@@ -264,10 +307,12 @@ const NewApplication = () => {
                   <Label htmlFor="districtOfBirth">District of Birth</Label>
                   <Input
                     id="districtOfBirth"
+                    list="districtOfBirth-places"
                     value={formData.districtOfBirth}
                     onChange={(e) => handleInputChange('districtOfBirth', e.target.value)}
                     required
                   />
+                  {placeList('districtOfBirth')}
                 </div>
                 <div className="space-y-2">
                   <Label htmlFor="tribe">Tribe (Kabila)</Label>
@@ -298,46 +343,56 @@ const NewApplication = () => {
                   <Label htmlFor="homeDistrict">Home District</Label>
                   <Input
                     id="homeDistrict"
+                    list="homeDistrict-places"
                     value={formData.homeDistrict}
                     onChange={(e) => handleInputChange('homeDistrict', e.target.value)}
                     required
                   />
+                  {placeList('homeDistrict')}
                 </div>
                 <div className="space-y-2">
                   <Label htmlFor="division">Division (Taarafa)</Label>
                   <Input
                     id="division"
+                    list="division-places"
                     value={formData.division}
                     onChange={(e) => handleInputChange('division', e.target.value)}
                     required
                   />
+                  {placeList('division')}
                 </div>
                 <div className="space-y-2">
                   <Label htmlFor="constituency">Constituency</Label>
                   <Input
                     id="constituency"
+                    list="constituency-places"
                     value={formData.constituency}
                     onChange={(e) => handleInputChange('constituency', e.target.value)}
                     required
                   />
+                  {placeList('constituency')}
                 </div>
                 <div className="space-y-2">
                   <Label htmlFor="location">Location (Mtaa)</Label>
                   <Input
                     id="location"
+                    list="location-places"
                     value={formData.location}
                     onChange={(e) => handleInputChange('location', e.target.value)}
                     required
                   />
+                  {placeList('location')}
                 </div>
                 <div className="space-y-2">
                   <Label htmlFor="subLocation">Sub-location</Label>
                   <Input
                     id="subLocation"
+                    list="subLocation-places"
                     value={formData.subLocation}
                     onChange={(e) => handleInputChange('subLocation', e.target.value)}
                     required
                   />
+                  {placeList('subLocation')}
                 </div>
                 <div className="space-y-2">
                   <Label htmlFor="villageEstate">Village/Estate</Label>
@@ -365,6 +420,25 @@ const NewApplication = () => {
                     required
                   />
                 </div>
+                <div className="space-y-2">
+                  <Label htmlFor="phoneNumber">Phone Number for SMS Updates (optional)</Label>
+                  <Input
+                    id="phoneNumber"
+                    type="tel"
+                    value={formData.phoneNumber}
+                    onChange={(e) => handleInputChange('phoneNumber', e.target.value)}
+                    placeholder="e.g. 0712345678"
+                  />
+                </div>
+                <div className="space-y-2">
+                  <Label htmlFor="email">Email for Updates (optional)</Label>
+                  <Input
+                    id="email"
+                    type="email"
+                    value={formData.email}
+                    onChange={(e) => handleInputChange('email', e.target.value)}
+                  />
+                </div>
               </div>
             </CardContent>
           </Card>